@@ -0,0 +1,63 @@
+import sys
+import time
+
+import miniLang
+
+# Compares the character lexer with the regex Lexer in MB/s of source text.
+# Usage: python lexer_benchmark.py [file.ml ...]
+# Without files a large program is generated.
+
+PROGRAMA = '''# soma e produto
+VAR total = 0
+VAR nomes = ["ana", "bia\\tcarlos"]
+DEF media(a, b) -> (a + b) / 2.5
+FOR i = 0 TO 100 STEP 2 THEN
+	IF i >= 10 AND i != 50 THEN VAR total = total + media(i, 3.75) ELSE VAR total = total - 1
+END
+WHILE total > 0 THEN; VAR total = total ^ 0 - 1; END
+PRINT(nomes / 0 * 1)
+'''
+
+
+def gerar_texto(tamanho):
+	repeticoes = tamanho // len(PROGRAMA) + 1
+	return PROGRAMA * repeticoes
+
+
+def medir(lexer_class, text, repeticoes):
+	melhor = None
+	for _ in range(repeticoes):
+		inicio = time.perf_counter()
+		tokens, error = lexer_class('<benchmark>', text).make_token_buffer()
+		tempo = time.perf_counter() - inicio
+		if error:
+			raise SystemExit(error.as_string())
+		if melhor is None or tempo < melhor:
+			melhor = tempo
+	return tokens, melhor
+
+
+def comparar(nome, text, repeticoes=3):
+	megabytes = len(text.encode('utf-8')) / 1_000_000
+	antigos, tempo_antigo = medir(miniLang.CharLexer, text, repeticoes)
+	novos, tempo_novo = medir(miniLang.Lexer, text, repeticoes)
+
+	iguais = len(antigos) == len(novos) and all(
+		(a.type, a.value, a.pos_inicio - antigos.base, a.pos_final - antigos.base) ==
+		(b.type, b.value, b.pos_inicio - novos.base, b.pos_final - novos.base)
+		for a, b in ((antigos[i], novos[i]) for i in range(len(novos))))
+
+	print(f'{nome}: {megabytes:.2f} MB, {len(novos)} tokens')
+	print(f'  CharLexer {tempo_antigo:8.3f} s {megabytes / tempo_antigo:8.2f} MB/s')
+	print(f'  Lexer     {tempo_novo:8.3f} s {megabytes / tempo_novo:8.2f} MB/s')
+	print(f'  {tempo_antigo / tempo_novo:.1f}x, tokens iguais: {"sim" if iguais else "NAO"}')
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1:
+		for fileName in sys.argv[1:]:
+			with open(fileName, 'r') as f:
+				comparar(fileName, f.read())
+	else:
+		for tamanho in (1_000_000, 5_000_000):
+			comparar(f'gerado {tamanho // 1_000_000} MB', gerar_texto(tamanho))
@@ -4,9 +4,24 @@
 
 from erro_usando_setas import *
 
+import re
+import sys
 import string
+import codecs
 import os
 import math
+import gc
+import hashlib
+import json
+import struct
+import tempfile
+import weakref
+from array import array
+from bisect import bisect_right
+from stat import S_IMODE, S_ISREG
+from collections import OrderedDict, deque
+from itertools import chain, islice
+from types import GeneratorType
 
 #######################################
 # CONSTANTS
@@ -16,6 +31,37 @@ DIGITOS = '0123456789'
 LETRAS = string.ascii_letters
 LETRAS_DIGITOS = LETRAS + DIGITOS
 
+# Calls plus loop iterations after which an interpreted function has its
+# body compiled to closures (None keeps everything on the tree walker)
+TIER_UP_THRESHOLD = 200
+
+# Results kept per memoized function
+MEMO_CACHE_SIZE = 1024
+
+# Nested calls the stackless engine allows before a stack overflow error
+MAX_CALL_DEPTH = 10000
+
+# Frames replaced by tail calls that a traceback still lists, per frame
+TAIL_CALL_FRAMES = 100
+
+# Integers preallocated as shared Numbers
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 1024
+
+# Characters read from a streamed script at a time
+STREAM_CHUNK_SIZE = 1 << 16
+# Offsets set aside for a stream whose length is not known up front
+STREAM_RESERVED_SIZE = 1 << 48
+# Lines of a streamed script kept in memory for error messages
+STREAM_KEPT_LINES = 10000
+# Scripts of at least this many bytes are streamed by RUN instead of being
+# read whole (None never streams)
+STREAM_MIN_SIZE = 1 << 20
+
+# Directory next to each script where RUN keeps its parsed AST (None turns
+# the cache off)
+AST_CACHE_DIR = '__mlcache__'
+
 
 #######################################
 # ERRORS
@@ -27,13 +73,15 @@ class Erro:
         self.pos_final = pos_final
         self.nome_erro = nome_erro
         self.detalhe = detalhe
+        # Keeps the text the message shows alive after the run is over
+        self.sources = {find_source(pos_inicio)} if pos_inicio is not None else set()
 
     def as_string(self):
+        source = find_source(self.pos_inicio)
         resultado = f'{self.nome_erro}: {self.detalhe}\n'
-        resultado += f'File {self.pos_inicio.fileName}, line {self.pos_inicio.ln + 1}'
+        resultado += f'File {source.fileName}, line {source.line(self.pos_inicio) + 1}'
         resultado += '\n\n' + \
-            erro_usando_setas(self.pos_inicio.ftxt,
-                              self.pos_inicio, self.pos_final)
+            erro_usando_setas(source, self.pos_inicio, self.pos_final)
         return resultado
 
 
@@ -57,11 +105,20 @@ class RTErro(Erro):
         super().__init__(pos_inicio, pos_final, 'Runtime Erro', detalhe)
         self.context = context
 
+        # and the text of every call site in the traceback
+        ctx = context
+        while ctx:
+            if ctx.parent_entry_pos is not None:
+                self.sources.add(find_source(ctx.parent_entry_pos))
+            if ctx.tail_calls:
+                self.sources.update(find_source(call_pos) for _, call_pos in ctx.tail_calls)
+            ctx = ctx.parent
+
     def as_string(self):
         resultado = self.generate_traceback()
         resultado += f'{self.nome_erro}: {self.detalhe}'
         resultado += '\n\n' + \
-            erro_usando_setas(self.pos_inicio.ftxt,
+            erro_usando_setas(find_source(self.pos_inicio),
                               self.pos_inicio, self.pos_final)
         return resultado
 
@@ -71,37 +128,161 @@ class RTErro(Erro):
         ctx = self.context
 
         while ctx:
-            resultado = f'  File {pos.fileName}, line {str(pos.ln + 1)}, in {ctx.display_name}\n' + resultado
+            resultado = self.traceback_line(pos, ctx.display_name) + resultado
+
+            # Frames a tail call took over, most recent last
+            if ctx.tail_calls:
+                for display_name, call_pos in reversed(ctx.tail_calls):
+                    resultado = self.traceback_line(call_pos, display_name) + resultado
+                hidden = ctx.tail_call_count - len(ctx.tail_calls)
+                if hidden:
+                    resultado = f'  ... {hidden} more tail calls\n' + resultado
+
             pos = ctx.parent_entry_pos
             ctx = ctx.parent
 
         return 'Traceback (most recent call last):\n' + resultado
 
+    def traceback_line(self, pos, display_name):
+        source = find_source(pos)
+        return f'  File {source.fileName}, line {str(source.line(pos) + 1)}, in {display_name}\n'
+
 
 #######################################
 # POSITION
 #######################################
 
-class Position:
-    def __init__(self, idx, ln, col, fileName, ftxt):
-        self.idx = idx
-        self.ln = ln
-        self.col = col
+# Positions are plain ints. Every text given to the Lexer gets its own range
+# of offsets, so an offset alone finds the Source it points into. SOURCES
+# only holds weak references: a Source lives as long as the run() reading
+# it, the Functions defined in it and the errors pointing into it, and its
+# range is never handed out again.
+SOURCES = []
+SOURCE_BASES = []
+NEXT_SOURCE_BASE = 0
+DEAD_SOURCES = 0
+
+
+class Source:
+    def __init__(self, fileName, text, base):
         self.fileName = fileName
-        self.ftxt = ftxt
+        self.text = text
+        self.base = base
+        self.size = len(text)
+
+        self.line_starts = array('L', [0])
+        self.add_line_starts(text, 0)
+
+    def add_line_starts(self, text, offset):
+        idx = text.find('\n')
+        while idx >= 0:
+            self.line_starts.append(offset + idx + 1)
+            idx = text.find('\n', idx + 1)
+
+    def line(self, pos):
+        return bisect_right(self.line_starts, pos - self.base) - 1
+
+    def line_col(self, pos):
+        ln = self.line(pos)
+        return ln, pos - self.base - self.line_starts[ln]
+
+    def end_line_col(self, pos_inicio, pos_final):
+        # Ends are exclusive, a token ending on a newline stays on its line
+        if pos_final is None:
+            pos_final = pos_inicio
+        ln = self.line(max(pos_final - 1, pos_inicio))
+        return ln, pos_final - self.base - self.line_starts[ln]
+
+    def line_text(self, ln):
+        # Lines after the first start at the newline before them, as the
+        # error arrows have always printed them
+        inicio = max(self.line_starts[ln] - 1, 0)
+        if ln + 1 < len(self.line_starts):
+            return self.text[inicio:self.line_starts[ln + 1] - 1]
+        return self.text[inicio:]
+
+
+class StreamSource(Source):
+    # A source read a chunk at a time. Besides the line index only the last
+    # STREAM_KEPT_LINES lines are kept; older ones are read back from the
+    # file, in the encoding the stream had, when an error shows them. size
+    # is an upper bound on the length, reserving the offsets it may use.
+    def __init__(self, fileName, base, size=None, encoding=None):
+        self.lines = {}
+        self.line_count = 0
+        self.partial_line = ''
+        self.encoding = encoding or 'utf-8'
+
+        super().__init__(fileName, '', base)
+        self.text = None
+        self.size = size if size is not None else STREAM_RESERVED_SIZE
+
+    def add_line_starts(self, text, offset):
+        super().add_line_starts(text, offset)
+
+        lines = (self.partial_line + text).split('\n')
+        self.partial_line = lines.pop()
+        for line in lines:
+            self.lines[self.line_count] = line
+            self.lines.pop(self.line_count - STREAM_KEPT_LINES, None)
+            self.line_count += 1
+
+    def line_text(self, ln):
+        line = self.lines.get(ln)
+        if line is None:
+            line = self.partial_line if ln == self.line_count else self.read_line(ln)
+        return '\n' + line if ln > 0 else line
+
+    def read_line(self, ln):
+        if not os.path.isfile(self.fileName):
+            return ''
+        try:
+            with open(self.fileName, 'r', encoding=self.encoding, errors='replace') as f:
+                line = next(islice(f, ln, None), '')
+        except OSError:
+            return ''
+        return line[:-1] if line.endswith('\n') else line
 
-    def advance(self, _peek=None):
-        self.idx += 1
-        self.col += 1
 
-        if _peek == '\n':
-            self.ln += 1
-            self.col = 0
+def register_source(source):
+    global NEXT_SOURCE_BASE, DEAD_SOURCES
 
-        return self
+    if DEAD_SOURCES:
+        live = [(base, ref) for base, ref in zip(SOURCE_BASES, SOURCES) if ref() is not None]
+        SOURCE_BASES[:] = [base for base, _ in live]
+        SOURCES[:] = [ref for _, ref in live]
+        DEAD_SOURCES = 0
 
-    def copy(self):
-        return Position(self.idx, self.ln, self.col, self.fileName, self.ftxt)
+    SOURCES.append(weakref.ref(source, forget_source))
+    SOURCE_BASES.append(source.base)
+    NEXT_SOURCE_BASE = source.base + source.size + 1
+    return source
+
+
+def forget_source(ref):
+    global DEAD_SOURCES
+    DEAD_SOURCES += 1
+
+
+def next_source_base():
+    return NEXT_SOURCE_BASE
+
+
+def add_source(fileName, text):
+    return register_source(Source(fileName, text, next_source_base()))
+
+
+def add_stream_source(fileName, size=None, encoding=None):
+    return register_source(StreamSource(fileName, next_source_base(), size, encoding))
+
+
+def find_source(pos):
+    idx = bisect_right(SOURCE_BASES, pos) - 1
+    source = SOURCES[idx]() if idx >= 0 else None
+    if source is None or pos > source.base + source.size:
+        # A value can outlive the text it was made from
+        return Source('<unknown>', '', pos)
+    return source
 
 
 #######################################
@@ -156,17 +337,18 @@ KEYWORDS = [
 
 
 class Token:
+    __slots__ = ('type', 'value', 'pos_inicio', 'pos_final')
+
     def __init__(self, type_, value=None, pos_inicio=None, pos_final=None):
         self.type = type_
         self.value = value
 
-        if pos_inicio:
-            self.pos_inicio = pos_inicio.copy()
-            self.pos_final = pos_inicio.copy()
-            self.pos_final.advance()
+        if pos_inicio is not None:
+            self.pos_inicio = pos_inicio
+            self.pos_final = pos_inicio + 1
 
-        if pos_final:
-            self.pos_final = pos_final.copy()
+        if pos_final is not None:
+            self.pos_final = pos_final
 
     def matches(self, type_, value):
         return self.type == type_ and self.value == value
@@ -177,93 +359,418 @@ class Token:
         return f'{self.type}'
 
 
+TOKEN_TYPES = [
+    TOKENTYPE_INT, TOKENTYPE_FLOAT, TOKENTYPE_STRING, TOKENTYPE_IDENTIFIER,
+    TOKENTYPE_KEYWORD, TOKENTYPE_SUM, TOKENTYPE_MINUS, TOKENTYPE_MUL,
+    TOKENTYPE_DIV, TOKENTYPE_POW, TOKENTYPE_EQ, TOKENTYPE_LPAREN,
+    TOKENTYPE_RPAREN, TOKENTYPE_LSQUARE, TOKENTYPE_RSQUARE, TOKENTYPE_EE,
+    TOKENTYPE_NE, TOKENTYPE_LT, TOKENTYPE_GT, TOKENTYPE_LTE, TOKENTYPE_GTE,
+    TOKENTYPE_COMMA, TOKENTYPE_ARROW, TOKENTYPE_NEWLINE, TOKENTYPE_EOF,
+]
+TOKEN_TYPE_CODES = {type_: code for code, type_ in enumerate(TOKEN_TYPES)}
+
+
+class TokenBuffer:
+    # Tokens stored as parallel arrays: type code, start and end offsets
+    # relative to the Source and an index into a table that holds each
+    # distinct value once. The parsers read it through a TokenCursor;
+    # indexing builds a Token.
+    def __init__(self, base=0):
+        self.base = base
+        self.types = array('B')
+        self.starts = array('L')
+        self.ends = array('L')
+        self.values = array('L')
+        self.value_table = [None]
+        self.value_index = {}
+
+    def add(self, token):
+        self.append(token.type, token.value, token.pos_inicio, token.pos_final)
+
+    def append(self, type_, value, pos_inicio, pos_final):
+        self.types.append(TOKEN_TYPE_CODES[type_])
+        self.starts.append(pos_inicio - self.base)
+        self.ends.append(pos_final - self.base)
+
+        if value is None:
+            self.values.append(0)
+            return
+
+        # 1, 1.0 and True are equal keys, the type keeps them apart
+        key = (type(value), value)
+        index = self.value_index.get(key)
+        if index is None:
+            index = self.value_index[key] = len(self.value_table)
+            self.value_table.append(value)
+        self.values.append(index)
+
+    def close(self):
+        # Nothing is added after lexing, the interning index can go
+        self.value_index = None
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, idx):
+        base = self.base
+        return Token(TOKEN_TYPES[self.types[idx]], self.value_table[self.values[idx]],
+                     base + self.starts[idx], base + self.ends[idx])
+
+
+class TokenCursor:
+    # The token at idx of a TokenBuffer, read from its arrays in place: it
+    # has the fields of a Token, and moving it builds nothing. A Token is
+    # only built, by token() or token_at(), for a node that keeps one.
+    #
+    # tokens is a list of Tokens or a TokenBuffer
+    def __init__(self, tokens):
+        if not isinstance(tokens, TokenBuffer):
+            buffer = TokenBuffer()
+            for token in tokens:
+                buffer.add(token)
+            buffer.close()
+            tokens = buffer
+
+        self.tokens = tokens
+        self.base = tokens.base
+        self.types = tokens.types
+        self.starts = tokens.starts
+        self.ends = tokens.ends
+        self.values = tokens.values
+        self.value_table = tokens.value_table
+        self.idx = -1
+
+    def __len__(self):
+        return len(self.types)
+
+    def move(self, idx):
+        self.idx = idx
+        self.type = TOKEN_TYPES[self.types[idx]]
+        self.value = self.value_table[self.values[idx]]
+        self.pos_inicio = self.base + self.starts[idx]
+        self.pos_final = self.base + self.ends[idx]
+
+    def matches(self, type_, value):
+        return self.type == type_ and self.value == value
+
+    def token(self):
+        return Token(self.type, self.value, self.pos_inicio, self.pos_final)
+
+    def token_at(self, idx):
+        return self.tokens[idx]
+
+
+class TokenStream:
+    # Tokens pulled from an iterator as the parser reaches them. Tokens
+    # before the last released index are dropped, so only the statement
+    # being parsed is held.
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.window = []
+        self.start = 0
+
+    def get(self, idx):
+        window = self.window
+        while idx >= self.start + len(window):
+            token = next(self.tokens, None)
+            if token is None:
+                return None
+            window.append(token)
+        return window[idx - self.start]
+
+    def release(self, idx):
+        del self.window[:idx - self.start]
+        self.start = idx
+
+
 #######################################
 # LEXER
 #######################################
 
+# Leading blanks plus one alternative per kind of token. Comments and the
+# blanks at the end of the text match without a group and are skipped; the
+# comment swallows its newline like the character lexer always did. ILLEGAL
+# takes any other character, so matches never leave gaps.
+LEXER_PATTERN = re.compile(r'''
+    [ \t]*(?:
+      \#[^\n]*\n?
+    | (?P<NEWLINE>[;\n])
+    | (?P<NUMBER>[0-9]+(?:\.[0-9]*)?)
+    | (?P<WORD>[A-Za-z][A-Za-z0-9_]*)
+    | (?P<STRING>"[^"]*"?)
+    | (?P<OPERATOR>->|==|!=|<=|>=|[-+*/^()\[\],=<>])
+    | (?P<NOT>!)
+    | (?P<ILLEGAL>.)
+    | $)
+''', re.VERBOSE | re.DOTALL)
+
+OPERATOR_TOKENS = {
+    '+': TOKENTYPE_SUM,
+    '-': TOKENTYPE_MINUS,
+    '*': TOKENTYPE_MUL,
+    '/': TOKENTYPE_DIV,
+    '^': TOKENTYPE_POW,
+    '(': TOKENTYPE_LPAREN,
+    ')': TOKENTYPE_RPAREN,
+    '[': TOKENTYPE_LSQUARE,
+    ']': TOKENTYPE_RSQUARE,
+    ',': TOKENTYPE_COMMA,
+    '=': TOKENTYPE_EQ,
+    '<': TOKENTYPE_LT,
+    '>': TOKENTYPE_GT,
+    '->': TOKENTYPE_ARROW,
+    '==': TOKENTYPE_EE,
+    '!=': TOKENTYPE_NE,
+    '<=': TOKENTYPE_LTE,
+    '>=': TOKENTYPE_GTE,
+}
+
+KEYWORD_SET = frozenset(KEYWORDS)
+
+
 class Lexer:
+    # Scans with LEXER_PATTERN, one match per token or run of blanks, and
+    # hands each token to append(type, value, pos_inicio, pos_final).
     def __init__(self, fileName, text):
         self.fileName = fileName
         self.text = text
-        self.pos = Position(-1, 0, -1, fileName, text)
+        self.source = add_source(fileName, text)
+
+    def make_tokens(self):
+        tokens = []
+
+        def append(type_, value, pos_inicio, pos_final):
+            tokens.append(Token(type_, value, pos_inicio, pos_final))
+
+        error = self.lex(append)
+        if error:
+            return [], error
+        return tokens, None
+
+    def make_token_buffer(self):
+        tokens = TokenBuffer(self.source.base)
+        error = self.lex(tokens.append)
+        tokens.close()
+        if error:
+            return TokenBuffer(self.source.base), error
+        return tokens, None
+
+    def lex(self, append):
+        error, _ = self.lex_text(self.text, self.source.base, append, True)
+        return error
+
+    def lex_text(self, text, base, append, final):
+        # Returns the error, if any, and where the unread text starts. Unless
+        # final, a match reaching the end of text may continue in the next
+        # chunk, so it is left unread.
+        size = len(text)
+        pos_eof = base + size
+
+        for m in LEXER_PATTERN.finditer(text):
+            kind = m.lastgroup
+
+            if not final and m.end() == size:
+                return None, m.start()
+            elif kind is None:
+                continue
+            elif kind == 'WORD':
+                value = m.group(kind)
+                tok_type = TOKENTYPE_KEYWORD if value in KEYWORD_SET else TOKENTYPE_IDENTIFIER
+                append(tok_type, value, base + m.start(kind), base + m.end())
+            elif kind == 'OPERATOR':
+                append(OPERATOR_TOKENS[m.group(kind)], None, base + m.start(kind), base + m.end())
+            elif kind == 'NEWLINE':
+                pos_inicio = base + m.start(kind)
+                append(TOKENTYPE_NEWLINE, None, pos_inicio, pos_inicio + 1)
+            elif kind == 'NUMBER':
+                value = m.group(kind)
+                if '.' in value:
+                    append(TOKENTYPE_FLOAT, float(value), base + m.start(kind), base + m.end())
+                else:
+                    append(TOKENTYPE_INT, int(value), base + m.start(kind), base + m.end())
+            elif kind == 'STRING':
+                value = m.group(kind)
+                # Backslashes are dropped and never escape anything, as in
+                # make_string. An unclosed string ends one past the text.
+                if len(value) > 1 and value[-1] == '"':
+                    value = value[1:-1]
+                    pos_final = base + m.end()
+                else:
+                    value = value[1:]
+                    pos_final = pos_eof = base + m.end() + 1
+                append(TOKENTYPE_STRING, value.replace('\\', ''), base + m.start(kind), pos_final)
+            elif kind == 'NOT':
+                pos_inicio = base + m.start(kind)
+                return ExpectedCharErro(pos_inicio, pos_inicio + 2, "'=' (after '!')"), size
+            else:
+                pos_inicio = base + m.start(kind)
+                return IllegalCharErro(pos_inicio, pos_inicio + 1, "'" + m.group(kind) + "'"), size
+
+        append(TOKENTYPE_EOF, None, pos_eof, pos_eof + 1)
+        return None, size
+
+
+class StreamLexer(Lexer):
+    # Lexes a file-like object a chunk at a time, so only the chunk being
+    # read and its tokens are in memory. read() may return text or bytes,
+    # as an mmap does; bytes are decoded as UTF-8.
+    def __init__(self, fileName, stream, size=None):
+        self.fileName = fileName
+        self.text = None
+        self.stream = stream
+        # Bytes are decoded as UTF-8, text keeps the encoding it was read in
+        self.source = add_stream_source(
+            fileName, size, getattr(stream, 'encoding', None))
+        self.error = None
+        self.decoder = None
+        self.read_size = 0
+
+    def lex(self, append):
+        for tokens in self.chunks():
+            for token in tokens:
+                append(token.type, token.value, token.pos_inicio, token.pos_final)
+        return self.error
+
+    def read_chunk(self):
+        # The next chunk of text, added to the Source's line index, and
+        # whether the stream has ended
+        chunk = self.stream.read(STREAM_CHUNK_SIZE)
+        final = not chunk
+        if isinstance(chunk, bytes):
+            if self.decoder is None:
+                self.decoder = codecs.getincrementaldecoder('utf-8')()
+            chunk = self.decoder.decode(chunk, final)
+
+        self.source.add_line_starts(chunk, self.read_size)
+        self.read_size += len(chunk)
+        return chunk, final
+
+    def finish_line(self):
+        # Reads on to the end of the line lexing stopped in, so an error
+        # there shows the whole line and not just the part read so far
+        line_count = self.source.line_count
+        while self.source.line_count == line_count:
+            _, final = self.read_chunk()
+            if final:
+                return
+
+    def chunks(self):
+        # Yields the tokens of each chunk. An error ends the tokens with an
+        # EOF where it happened and is left in self.error.
+        base = self.source.base
+        rest = ''
+        offset = 0
+
+        while True:
+            chunk, final = self.read_chunk()
+            text = rest + chunk
+            tokens = []
+
+            def append(type_, value, pos_inicio, pos_final):
+                tokens.append(Token(type_, value, pos_inicio, pos_final))
+
+            error, idx = self.lex_text(text, base + offset, append, final)
+            if error:
+                self.error = error
+                tokens.append(Token(TOKENTYPE_EOF, pos_inicio=error.pos_inicio))
+                yield tokens
+                return
+
+            yield tokens
+            if final:
+                return
+            rest = text[idx:]
+            offset += idx
+
+
+class CharLexer(Lexer):
+    # The original lexer, advancing one character at a time. Kept as the
+    # reference the regex Lexer is checked and benchmarked against.
+    def __init__(self, fileName, text):
+        super().__init__(fileName, text)
+        self.idx = -1
+        self.pos = self.source.base - 1
         self._peek = None
         self.advance()
 
     def advance(self):
-        self.pos.advance(self._peek)
-        self._peek = self.text[self.pos.idx] if self.pos.idx < len(
+        self.idx += 1
+        self.pos += 1
+        self._peek = self.text[self.idx] if self.idx < len(
             self.text) else None
 
-    def make_tokens(self):
-        tokens = []
+    def lex(self, append):
+        return self.scan(lambda token: append(token.type, token.value,
+                                              token.pos_inicio, token.pos_final))
 
+    def scan(self, add):
         while self._peek != None:
             if self._peek in ' \t':
                 self.advance()
             elif self._peek == '#':
                 self.skip_comment()
             elif self._peek in ';\n':
-                tokens.append(Token(TOKENTYPE_NEWLINE, pos_inicio=self.pos))
+                add(Token(TOKENTYPE_NEWLINE, pos_inicio=self.pos))
                 self.advance()
             elif self._peek in DIGITOS:
-                tokens.append(self.make_number())
+                add(self.make_number())
             elif self._peek in LETRAS:
-                tokens.append(self.make_identifier())
+                add(self.make_identifier())
             elif self._peek == '"':
-                tokens.append(self.make_string())
+                add(self.make_string())
             elif self._peek == '+':
-                tokens.append(Token(TOKENTYPE_SUM, pos_inicio=self.pos))
+                add(Token(TOKENTYPE_SUM, pos_inicio=self.pos))
                 self.advance()
             elif self._peek == '-':
-                tokens.append(self.make_minus_or_arrow())
+                add(self.make_minus_or_arrow())
             elif self._peek == '*':
-                tokens.append(Token(TOKENTYPE_MUL, pos_inicio=self.pos))
+                add(Token(TOKENTYPE_MUL, pos_inicio=self.pos))
                 self.advance()
             elif self._peek == '/':
-                tokens.append(Token(TOKENTYPE_DIV, pos_inicio=self.pos))
+                add(Token(TOKENTYPE_DIV, pos_inicio=self.pos))
                 self.advance()
             elif self._peek == '^':
-                tokens.append(Token(TOKENTYPE_POW, pos_inicio=self.pos))
+                add(Token(TOKENTYPE_POW, pos_inicio=self.pos))
                 self.advance()
             elif self._peek == '(':
-                tokens.append(Token(TOKENTYPE_LPAREN, pos_inicio=self.pos))
+                add(Token(TOKENTYPE_LPAREN, pos_inicio=self.pos))
                 self.advance()
             elif self._peek == ')':
-                tokens.append(Token(TOKENTYPE_RPAREN, pos_inicio=self.pos))
+                add(Token(TOKENTYPE_RPAREN, pos_inicio=self.pos))
                 self.advance()
             elif self._peek == '[':
-                tokens.append(Token(TOKENTYPE_LSQUARE, pos_inicio=self.pos))
+                add(Token(TOKENTYPE_LSQUARE, pos_inicio=self.pos))
                 self.advance()
             elif self._peek == ']':
-                tokens.append(Token(TOKENTYPE_RSQUARE, pos_inicio=self.pos))
+                add(Token(TOKENTYPE_RSQUARE, pos_inicio=self.pos))
                 self.advance()
             elif self._peek == '!':
                 token, error = self.make_not_equals()
                 if error:
-                    return [], error
-                tokens.append(token)
+                    return error
+                add(token)
             elif self._peek == '=':
-                tokens.append(self.make_equals())
+                add(self.make_equals())
             elif self._peek == '<':
-                tokens.append(self.make_less_than())
+                add(self.make_less_than())
             elif self._peek == '>':
-                tokens.append(self.make_greater_than())
+                add(self.make_greater_than())
             elif self._peek == ',':
-                tokens.append(Token(TOKENTYPE_COMMA, pos_inicio=self.pos))
+                add(Token(TOKENTYPE_COMMA, pos_inicio=self.pos))
                 self.advance()
             else:
-                pos_inicio = self.pos.copy()
+                pos_inicio = self.pos
                 char = self._peek
                 self.advance()
-                return [], IllegalCharErro(pos_inicio, self.pos, "'" + char + "'")
+                return IllegalCharErro(pos_inicio, self.pos, "'" + char + "'")
 
-        tokens.append(Token(TOKENTYPE_EOF, pos_inicio=self.pos))
-        return tokens, None
+        add(Token(TOKENTYPE_EOF, pos_inicio=self.pos))
+        return None
 
     def make_number(self):
         num_str = ''
         dot_count = 0
-        pos_inicio = self.pos.copy()
+        pos_inicio = self.pos
 
         while self._peek != None and self._peek in DIGITOS + '.':
             if self._peek == '.':
@@ -280,7 +787,7 @@ class Lexer:
 
     def make_string(self):
         string = ''
-        pos_inicio = self.pos.copy()
+        pos_inicio = self.pos
         escape_character = False
         self.advance()
 
@@ -305,7 +812,7 @@ class Lexer:
 
     def make_identifier(self):
         id_str = ''
-        pos_inicio = self.pos.copy()
+        pos_inicio = self.pos
 
         while self._peek != None and self._peek in LETRAS_DIGITOS + '_':
             id_str += self._peek
@@ -316,7 +823,7 @@ class Lexer:
 
     def make_minus_or_arrow(self):
         tok_type = TOKENTYPE_MINUS
-        pos_inicio = self.pos.copy()
+        pos_inicio = self.pos
         self.advance()
 
         if self._peek == '>':
@@ -326,7 +833,7 @@ class Lexer:
         return Token(tok_type, pos_inicio=pos_inicio, pos_final=self.pos)
 
     def make_not_equals(self):
-        pos_inicio = self.pos.copy()
+        pos_inicio = self.pos
         self.advance()
 
         if self._peek == '=':
@@ -338,7 +845,7 @@ class Lexer:
 
     def make_equals(self):
         tok_type = TOKENTYPE_EQ
-        pos_inicio = self.pos.copy()
+        pos_inicio = self.pos
         self.advance()
 
         if self._peek == '=':
@@ -349,7 +856,7 @@ class Lexer:
 
     def make_less_than(self):
         tok_type = TOKENTYPE_LT
-        pos_inicio = self.pos.copy()
+        pos_inicio = self.pos
         self.advance()
 
         if self._peek == '=':
@@ -360,7 +867,7 @@ class Lexer:
 
     def make_greater_than(self):
         tok_type = TOKENTYPE_GT
-        pos_inicio = self.pos.copy()
+        pos_inicio = self.pos
         self.advance()
 
         if self._peek == '=':
@@ -385,6 +892,7 @@ class Lexer:
 class NumberNode:
     def __init__(self, tok):
         self.tok = tok
+        self.constant = None
 
         self.pos_inicio = self.tok.pos_inicio
         self.pos_final = self.tok.pos_final
@@ -407,6 +915,8 @@ class StringNode:
 class ListNode:
     def __init__(self, element_nodes, pos_inicio, pos_final):
         self.element_nodes = element_nodes
+        # Set on a streamed statement, which is only part of its program
+        self.partial = False
 
         self.pos_inicio = pos_inicio
         self.pos_final = pos_final
@@ -415,6 +925,7 @@ class ListNode:
 class VarAccessNode:
     def __init__(self, var_name_tok):
         self.var_name_tok = var_name_tok
+        self.cache = None
 
         self.pos_inicio = self.var_name_tok.pos_inicio
         self.pos_final = self.var_name_tok.pos_final
@@ -434,6 +945,8 @@ class BinOpNode:
         self.left_node = left_node
         self.op_tok = op_tok
         self.right_node = right_node
+        self.method_name = None
+        self.specialization = None
 
         self.pos_inicio = self.left_node.pos_inicio
         self.pos_final = self.right_node.pos_final
@@ -458,6 +971,8 @@ class IfNode:
     def __init__(self, cases, else_case):
         self.cases = cases
         self.else_case = else_case
+        # Branch whose value the last run returned, None for NULL
+        self.taken = None
 
         self.pos_inicio = self.cases[0][0].pos_inicio
         self.pos_final = (
@@ -472,6 +987,7 @@ class ForNode:
         self.step_value_node = step_value_node
         self.body_node = body_node
         self.should_return_null = should_return_null
+        self.trace = None
 
         self.pos_inicio = self.var_name_tok.pos_inicio
         self.pos_final = self.body_node.pos_final
@@ -482,6 +998,7 @@ class WhileNode:
         self.condition_node = condition_node
         self.body_node = body_node
         self.should_return_null = should_return_null
+        self.trace = None
 
         self.pos_inicio = self.condition_node.pos_inicio
         self.pos_final = self.body_node.pos_final
@@ -493,6 +1010,8 @@ class FuncDefNode:
         self.arg_name_toks = arg_name_toks
         self.body_node = body_node
         self.should_auto_return = should_auto_return
+        self.profile = None
+        self.memo = None
 
         if self.var_name_tok:
             self.pos_inicio = self.var_name_tok.pos_inicio
@@ -508,6 +1027,7 @@ class CallNode:
     def __init__(self, node_to_call, arg_nodes):
         self.node_to_call = node_to_call
         self.arg_nodes = arg_nodes
+        self.tail_call = False
 
         self.pos_inicio = self.node_to_call.pos_inicio
 
@@ -537,6 +1057,40 @@ class BreakNode:
         self.pos_final = pos_final
 
 
+def child_nodes(node):
+    if isinstance(node, ListNode):
+        return list(node.element_nodes)
+    if isinstance(node, VarAssignNode):
+        return [node.value_node]
+    if isinstance(node, BinOpNode):
+        return [node.left_node, node.right_node]
+    if isinstance(node, UnaryOpNode):
+        return [node.node]
+    if isinstance(node, IfNode):
+        children = []
+        for condition, expr, _ in node.cases:
+            children.append(condition)
+            children.append(expr)
+        if node.else_case:
+            children.append(node.else_case[0])
+        return children
+    if isinstance(node, ForNode):
+        children = [node.start_value_node, node.end_value_node]
+        if node.step_value_node:
+            children.append(node.step_value_node)
+        children.append(node.body_node)
+        return children
+    if isinstance(node, WhileNode):
+        return [node.condition_node, node.body_node]
+    if isinstance(node, FuncDefNode):
+        return [node.body_node]
+    if isinstance(node, CallNode):
+        return [node.node_to_call] + list(node.arg_nodes)
+    if isinstance(node, ReturnNode):
+        return [node.node_to_return] if node.node_to_return else []
+    return []
+
+
 #######################################
 # PARSE RESULT
 #######################################
@@ -545,783 +1099,1071 @@ class ParseResult:
     def __init__(self):
         self.error = None
         self.node = None
-        self.last_registered_advance_count = 0
-        self.advance_count = 0
-        self.to_reverse_count = 0
-
-    def register_advancement(self):
-        self.last_registered_advance_count = 1
-        self.advance_count += 1
-
-    def register(self, res):
-        self.last_registered_advance_count = res.advance_count
-        self.advance_count += res.advance_count
-        if res.error:
-            self.error = res.error
-        return res.node
-
-    def try_register(self, res):
-        if res.error:
-            self.to_reverse_count = res.advance_count
-            return None
-        return self.register(res)
 
     def success(self, node):
         self.node = node
         return self
 
     def failure(self, error):
-        if not self.error or self.last_registered_advance_count == 0:
-            self.error = error
+        self.error = error
         return self
 
 
+class ParseSignal(Exception):
+    # Raised by the Parser on a syntax error, parse() turns it into a failure
+    def __init__(self, error):
+        self.error = error
+
+
 #######################################
 # PARSER
 #######################################
 
+# Tokens that can start an expression, and so a statement
+EXPR_START_TYPES = frozenset((
+    TOKENTYPE_INT, TOKENTYPE_FLOAT, TOKENTYPE_STRING, TOKENTYPE_IDENTIFIER,
+    TOKENTYPE_SUM, TOKENTYPE_MINUS, TOKENTYPE_LPAREN, TOKENTYPE_LSQUARE,
+))
+EXPR_START_KEYWORDS = frozenset(('VAR', 'NOT', 'IF', 'FOR', 'WHILE', 'DEF'))
+STATEMENT_KEYWORDS = frozenset(('RETURN', 'CONTINUE', 'BREAK'))
+
+# Binding power of the binary operators below AND/OR. All of them are left
+# associative; '^' is handled by power() since its right side is a factor.
+BINARY_PRECEDENCE = {
+    TOKENTYPE_EE: 1,
+    TOKENTYPE_NE: 1,
+    TOKENTYPE_LT: 1,
+    TOKENTYPE_GT: 1,
+    TOKENTYPE_LTE: 1,
+    TOKENTYPE_GTE: 1,
+    TOKENTYPE_SUM: 2,
+    TOKENTYPE_MINUS: 2,
+    TOKENTYPE_MUL: 3,
+    TOKENTYPE_DIV: 3,
+}
+LOGIC_KEYWORDS = ('AND', 'OR')
+
+EXPECTED_STATEMENT = "Expected 'RETURN', 'CONTINUE', 'BREAK', 'VAR', 'IF', 'FOR', 'WHILE', 'DEF', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
+EXPECTED_EXPR = "Expected 'VAR', 'IF', 'FOR', 'WHILE', 'DEF', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
+EXPECTED_COMP_EXPR = "Expected int, float, identifier, '+', '-', '(', '[', 'IF', 'FOR', 'WHILE', 'DEF' or 'NOT'"
+EXPECTED_ATOM = "Expected int, float, identifier, '+', '-', '(', '[', IF', 'FOR', 'WHILE', 'DEF'"
+EXPECTED_ARG = "Expected ')', 'VAR', 'IF', 'FOR', 'WHILE', 'DEF', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
+EXPECTED_ELEMENT = "Expected ']', 'VAR', 'IF', 'FOR', 'WHILE', 'DEF', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
+
+
 class Parser:
+    # Predictive parser: the current token decides every step, so nothing is
+    # read twice. Binary operators are parsed by precedence climbing. A
+    # syntax error raises ParseSignal; when it is on the first token of a
+    # statement, expression, argument or list element, the message names
+    # what was expected there. current_tok is a TokenCursor, and keep()
+    # builds a Token for a node that holds on to the current one.
+    #
+    # tokens is a list of Tokens or a TokenBuffer
     def __init__(self, tokens):
-        self.tokens = tokens
+        self.current_tok = TokenCursor(tokens)
+        self.token_count = len(self.current_tok)
         self.tok_idx = -1
         self.advance()
 
     def advance(self):
+        # Past the end the EOF token stays current
         self.tok_idx += 1
-        self.update_current_tok()
-        return self.current_tok
-
-    def reverse(self, amount=1):
-        self.tok_idx -= amount
-        self.update_current_tok()
+        if self.tok_idx < self.token_count:
+            self.current_tok.move(self.tok_idx)
         return self.current_tok
 
-    def update_current_tok(self):
-        if self.tok_idx >= 0 and self.tok_idx < len(self.tokens):
-            self.current_tok = self.tokens[self.tok_idx]
+    def keep(self):
+        return self.current_tok.token()
 
     def parse(self):
-        res = self.Stmt()
-        if not res.error and self.current_tok.type != TOKENTYPE_EOF:
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                "Token cannot appear after previous tokens"
-            ))
-        return res
+        res = ParseResult()
+        try:
+            node = self.Stmt()
+            if self.current_tok.type != TOKENTYPE_EOF:
+                self.fail("Token cannot appear after previous tokens")
+        except ParseSignal as signal:
+            return res.failure(signal.error)
+        return res.success(node)
+
+    ###################################
+
+    def fail(self, detalhe):
+        raise ParseSignal(InvalidSyntaxErro(
+            self.current_tok.pos_inicio, self.current_tok.pos_final, detalhe))
+
+    def expected_at(self, signal, start, detalhe):
+        # Nothing was read since start, so say what start should have been
+        if self.tok_idx == start:
+            signal.error = InvalidSyntaxErro(
+                self.current_tok.pos_inicio, self.current_tok.pos_final, detalhe)
+
+    def expect(self, type_, detalhe):
+        if self.current_tok.type != type_:
+            self.fail(detalhe)
+        self.advance()
+
+    def expect_keyword(self, value):
+        if not self.current_tok.matches(TOKENTYPE_KEYWORD, value):
+            self.fail(f"Expected '{value}'")
+        self.advance()
+
+    def starts_expr(self):
+        tok = self.current_tok
+        if tok.type == TOKENTYPE_KEYWORD:
+            return tok.value in EXPR_START_KEYWORDS
+        return tok.type in EXPR_START_TYPES
+
+    def starts_statement(self):
+        tok = self.current_tok
+        return self.starts_expr() or (tok.type == TOKENTYPE_KEYWORD and tok.value in STATEMENT_KEYWORDS)
 
     ###################################
 
     def Stmt(self):
-        res = ParseResult()
         Stmt = []
-        pos_inicio = self.current_tok.pos_inicio.copy()
+        pos_inicio = self.current_tok.pos_inicio
 
         while self.current_tok.type == TOKENTYPE_NEWLINE:
-            res.register_advancement()
             self.advance()
 
-        statement = res.register(self.statement())
-        if res.error:
-            return res
-        Stmt.append(statement)
-
-        more_Stmt = True
+        Stmt.append(self.statement())
 
-        while True:
-            newline_count = 0
+        while self.current_tok.type == TOKENTYPE_NEWLINE:
             while self.current_tok.type == TOKENTYPE_NEWLINE:
-                res.register_advancement()
                 self.advance()
-                newline_count += 1
-            if newline_count == 0:
-                more_Stmt = False
-
-            if not more_Stmt:
+            if not self.starts_statement():
                 break
-            statement = res.try_register(self.statement())
-            if not statement:
-                self.reverse(res.to_reverse_count)
-                more_Stmt = False
-                continue
-            Stmt.append(statement)
+            Stmt.append(self.statement())
 
-        return res.success(ListNode(
+        return ListNode(
             Stmt,
             pos_inicio,
-            self.current_tok.pos_final.copy()
-        ))
+            self.current_tok.pos_final
+        )
 
     def statement(self):
-        res = ParseResult()
-        pos_inicio = self.current_tok.pos_inicio.copy()
+        pos_inicio = self.current_tok.pos_inicio
 
         if self.current_tok.matches(TOKENTYPE_KEYWORD, 'RETURN'):
-            res.register_advancement()
             self.advance()
-
-            expr = res.try_register(self.expr())
-            if not expr:
-                self.reverse(res.to_reverse_count)
-            return res.success(ReturnNode(expr, pos_inicio, self.current_tok.pos_inicio.copy()))
+            expr = self.expr() if self.starts_expr() else None
+            return ReturnNode(expr, pos_inicio, self.current_tok.pos_inicio)
 
         if self.current_tok.matches(TOKENTYPE_KEYWORD, 'CONTINUE'):
-            res.register_advancement()
             self.advance()
-            return res.success(ContinueNode(pos_inicio, self.current_tok.pos_inicio.copy()))
+            return ContinueNode(pos_inicio, self.current_tok.pos_inicio)
 
         if self.current_tok.matches(TOKENTYPE_KEYWORD, 'BREAK'):
-            res.register_advancement()
             self.advance()
-            return res.success(BreakNode(pos_inicio, self.current_tok.pos_inicio.copy()))
+            return BreakNode(pos_inicio, self.current_tok.pos_inicio)
 
-        expr = res.register(self.expr())
-        if res.error:
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                "Expected 'RETURN', 'CONTINUE', 'BREAK', 'VAR', 'IF', 'FOR', 'WHILE', 'DEF', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
-            ))
-        return res.success(expr)
+        start = self.tok_idx
+        try:
+            return self.expr()
+        except ParseSignal as signal:
+            self.expected_at(signal, start, EXPECTED_STATEMENT)
+            raise
 
     def expr(self):
-        res = ParseResult()
-
         if self.current_tok.matches(TOKENTYPE_KEYWORD, 'VAR'):
-            res.register_advancement()
             self.advance()
 
             if self.current_tok.type != TOKENTYPE_IDENTIFIER:
-                return res.failure(InvalidSyntaxErro(
-                    self.current_tok.pos_inicio, self.current_tok.pos_final,
-                    "Expected identifier"
-                ))
-
-            var_name = self.current_tok
-            res.register_advancement()
-            self.advance()
-
-            if self.current_tok.type != TOKENTYPE_EQ:
-                return res.failure(InvalidSyntaxErro(
-                    self.current_tok.pos_inicio, self.current_tok.pos_final,
-                    "Expected '='"
-                ))
+                self.fail("Expected identifier")
 
-            res.register_advancement()
+            var_name = self.keep()
             self.advance()
-            expr = res.register(self.expr())
-            if res.error:
-                return res
-            return res.success(VarAssignNode(var_name, expr))
-
-        node = res.register(self.bin_op(
-            self.comp_expr, ((TOKENTYPE_KEYWORD, 'AND'), (TOKENTYPE_KEYWORD, 'OR'))))
-
-        if res.error:
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                "Expected 'VAR', 'IF', 'FOR', 'WHILE', 'DEF', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
-            ))
+            self.expect(TOKENTYPE_EQ, "Expected '='")
+            return VarAssignNode(var_name, self.expr())
 
-        return res.success(node)
+        start = self.tok_idx
+        try:
+            left = self.comp_expr()
+            while self.current_tok.type == TOKENTYPE_KEYWORD and self.current_tok.value in LOGIC_KEYWORDS:
+                op_tok = self.keep()
+                self.advance()
+                left = BinOpNode(left, op_tok, self.comp_expr())
+            return left
+        except ParseSignal as signal:
+            self.expected_at(signal, start, EXPECTED_EXPR)
+            raise
 
     def comp_expr(self):
-        res = ParseResult()
-
         if self.current_tok.matches(TOKENTYPE_KEYWORD, 'NOT'):
-            op_tok = self.current_tok
-            res.register_advancement()
+            op_tok = self.keep()
             self.advance()
+            return UnaryOpNode(op_tok, self.comp_expr())
 
-            node = res.register(self.comp_expr())
-            if res.error:
-                return res
-            return res.success(UnaryOpNode(op_tok, node))
-
-        node = res.register(self.bin_op(self.arith_expr, (TOKENTYPE_EE, TOKENTYPE_NE,
-                            TOKENTYPE_LT, TOKENTYPE_GT, TOKENTYPE_LTE, TOKENTYPE_GTE)))
-
-        if res.error:
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                "Expected int, float, identifier, '+', '-', '(', '[', 'IF', 'FOR', 'WHILE', 'DEF' or 'NOT'"
-            ))
-
-        return res.success(node)
+        start = self.tok_idx
+        try:
+            return self.binary(1)
+        except ParseSignal as signal:
+            self.expected_at(signal, start, EXPECTED_COMP_EXPR)
+            raise
 
-    def arith_expr(self):
-        return self.bin_op(self.term, (TOKENTYPE_SUM, TOKENTYPE_MINUS))
+    def binary(self, min_precedence):
+        left = self.factor()
 
-    def term(self):
-        return self.bin_op(self.factor, (TOKENTYPE_MUL, TOKENTYPE_DIV))
+        while True:
+            precedence = BINARY_PRECEDENCE.get(self.current_tok.type, 0)
+            if precedence < min_precedence:
+                return left
+            op_tok = self.keep()
+            self.advance()
+            left = BinOpNode(left, op_tok, self.binary(precedence + 1))
 
     def factor(self):
-        res = ParseResult()
-        tok = self.current_tok
-
-        if tok.type in (TOKENTYPE_SUM, TOKENTYPE_MINUS):
-            res.register_advancement()
+        if self.current_tok.type in (TOKENTYPE_SUM, TOKENTYPE_MINUS):
+            tok = self.keep()
             self.advance()
-            factor = res.register(self.factor())
-            if res.error:
-                return res
-            return res.success(UnaryOpNode(tok, factor))
+            return UnaryOpNode(tok, self.factor())
 
         return self.power()
 
     def power(self):
-        return self.bin_op(self.call, (TOKENTYPE_POW,), self.factor)
+        left = self.call()
+
+        while self.current_tok.type == TOKENTYPE_POW:
+            op_tok = self.keep()
+            self.advance()
+            left = BinOpNode(left, op_tok, self.factor())
+
+        return left
 
     def call(self):
-        res = ParseResult()
-        atom = res.register(self.atom())
-        if res.error:
-            return res
+        atom = self.atom()
 
-        if self.current_tok.type == TOKENTYPE_LPAREN:
-            res.register_advancement()
-            self.advance()
-            arg_nodes = []
+        if self.current_tok.type != TOKENTYPE_LPAREN:
+            return atom
 
-            if self.current_tok.type == TOKENTYPE_RPAREN:
-                res.register_advancement()
-                self.advance()
-            else:
-                arg_nodes.append(res.register(self.expr()))
-                if res.error:
-                    return res.failure(InvalidSyntaxErro(
-                        self.current_tok.pos_inicio, self.current_tok.pos_final,
-                        "Expected ')', 'VAR', 'IF', 'FOR', 'WHILE', 'DEF', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
-                    ))
+        self.advance()
+        arg_nodes = []
 
-                while self.current_tok.type == TOKENTYPE_COMMA:
-                    res.register_advancement()
-                    self.advance()
+        if self.current_tok.type == TOKENTYPE_RPAREN:
+            self.advance()
+            return CallNode(atom, arg_nodes)
 
-                    arg_nodes.append(res.register(self.expr()))
-                    if res.error:
-                        return res
+        start = self.tok_idx
+        try:
+            arg_nodes.append(self.expr())
+        except ParseSignal as signal:
+            self.expected_at(signal, start, EXPECTED_ARG)
+            raise
 
-                if self.current_tok.type != TOKENTYPE_RPAREN:
-                    return res.failure(InvalidSyntaxErro(
-                        self.current_tok.pos_inicio, self.current_tok.pos_final,
-                        f"Expected ',' or ')'"
-                    ))
+        while self.current_tok.type == TOKENTYPE_COMMA:
+            self.advance()
+            arg_nodes.append(self.expr())
 
-                res.register_advancement()
-                self.advance()
-            return res.success(CallNode(atom, arg_nodes))
-        return res.success(atom)
+        self.expect(TOKENTYPE_RPAREN, "Expected ',' or ')'")
+        return CallNode(atom, arg_nodes)
 
     def atom(self):
-        res = ParseResult()
         tok = self.current_tok
 
         if tok.type in (TOKENTYPE_INT, TOKENTYPE_FLOAT):
-            res.register_advancement()
+            node = NumberNode(self.keep())
             self.advance()
-            return res.success(NumberNode(tok))
+            return node
 
         elif tok.type == TOKENTYPE_STRING:
-            res.register_advancement()
+            node = StringNode(self.keep())
             self.advance()
-            return res.success(StringNode(tok))
+            return node
 
         elif tok.type == TOKENTYPE_IDENTIFIER:
-            res.register_advancement()
+            node = VarAccessNode(self.keep())
             self.advance()
-            return res.success(VarAccessNode(tok))
+            return node
 
         elif tok.type == TOKENTYPE_LPAREN:
-            res.register_advancement()
             self.advance()
-            expr = res.register(self.expr())
-            if res.error:
-                return res
-            if self.current_tok.type == TOKENTYPE_RPAREN:
-                res.register_advancement()
-                self.advance()
-                return res.success(expr)
-            else:
-                return res.failure(InvalidSyntaxErro(
-                    self.current_tok.pos_inicio, self.current_tok.pos_final,
-                    "Expected ')'"
-                ))
+            expr = self.expr()
+            self.expect(TOKENTYPE_RPAREN, "Expected ')'")
+            return expr
 
         elif tok.type == TOKENTYPE_LSQUARE:
-            list_expr = res.register(self.list_expr())
-            if res.error:
-                return res
-            return res.success(list_expr)
+            return self.list_expr()
 
         elif tok.matches(TOKENTYPE_KEYWORD, 'IF'):
-            if_expr = res.register(self.if_expr())
-            if res.error:
-                return res
-            return res.success(if_expr)
+            return self.if_expr()
 
         elif tok.matches(TOKENTYPE_KEYWORD, 'FOR'):
-            for_expr = res.register(self.for_expr())
-            if res.error:
-                return res
-            return res.success(for_expr)
+            return self.for_expr()
 
         elif tok.matches(TOKENTYPE_KEYWORD, 'WHILE'):
-            while_expr = res.register(self.while_expr())
-            if res.error:
-                return res
-            return res.success(while_expr)
+            return self.while_expr()
 
         elif tok.matches(TOKENTYPE_KEYWORD, 'DEF'):
-            func_def = res.register(self.func_def())
-            if res.error:
-                return res
-            return res.success(func_def)
+            return self.func_def()
 
-        return res.failure(InvalidSyntaxErro(
-            tok.pos_inicio, tok.pos_final,
-            "Expected int, float, identifier, '+', '-', '(', '[', IF', 'FOR', 'WHILE', 'DEF'"
-        ))
+        self.fail(EXPECTED_ATOM)
 
     def list_expr(self):
-        res = ParseResult()
         element_nodes = []
-        pos_inicio = self.current_tok.pos_inicio.copy()
-
-        if self.current_tok.type != TOKENTYPE_LSQUARE:
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected '['"
-            ))
-
-        res.register_advancement()
+        pos_inicio = self.current_tok.pos_inicio
         self.advance()
 
         if self.current_tok.type == TOKENTYPE_RSQUARE:
-            res.register_advancement()
             self.advance()
         else:
-            element_nodes.append(res.register(self.expr()))
-            if res.error:
-                return res.failure(InvalidSyntaxErro(
-                    self.current_tok.pos_inicio, self.current_tok.pos_final,
-                    "Expected ']', 'VAR', 'IF', 'FOR', 'WHILE', 'DEF', int, float, identifier, '+', '-', '(', '[' or 'NOT'"
-                ))
+            start = self.tok_idx
+            try:
+                element_nodes.append(self.expr())
+            except ParseSignal as signal:
+                self.expected_at(signal, start, EXPECTED_ELEMENT)
+                raise
 
             while self.current_tok.type == TOKENTYPE_COMMA:
-                res.register_advancement()
                 self.advance()
+                element_nodes.append(self.expr())
 
-                element_nodes.append(res.register(self.expr()))
-                if res.error:
-                    return res
+            self.expect(TOKENTYPE_RSQUARE, "Expected ',' or ']'")
 
-            if self.current_tok.type != TOKENTYPE_RSQUARE:
-                return res.failure(InvalidSyntaxErro(
-                    self.current_tok.pos_inicio, self.current_tok.pos_final,
-                    f"Expected ',' or ']'"
-                ))
-
-            res.register_advancement()
-            self.advance()
-
-        return res.success(ListNode(
+        return ListNode(
             element_nodes,
             pos_inicio,
-            self.current_tok.pos_final.copy()
-        ))
-
-    def if_expr(self):
-        res = ParseResult()
-        all_cases = res.register(self.if_expr_cases('IF'))
-        if res.error:
-            return res
-        cases, else_case = all_cases
-        return res.success(IfNode(cases, else_case))
-
-    def if_expr_b(self):
-        return self.if_expr_cases('ELIF')
+            self.current_tok.pos_final
+        )
 
-    def if_expr_c(self):
-        res = ParseResult()
-        else_case = None
+    def block_or_statement(self):
+        # After THEN, ELSE or a function header: a NEWLINE starts a block
+        # that ends with END, anything else is a single statement
+        if self.current_tok.type != TOKENTYPE_NEWLINE:
+            return self.statement(), False
 
-        if self.current_tok.matches(TOKENTYPE_KEYWORD, 'ELSE'):
-            res.register_advancement()
-            self.advance()
+        self.advance()
+        return self.Stmt(), True
 
-            if self.current_tok.type == TOKENTYPE_NEWLINE:
-                res.register_advancement()
-                self.advance()
+    def if_expr(self):
+        cases, else_case = self.if_expr_cases()
+        return IfNode(cases, else_case)
 
-                Stmt = res.register(self.Stmt())
-                if res.error:
-                    return res
-                else_case = (Stmt, True)
+    def if_expr_cases(self):
+        # At 'IF' or 'ELIF'
+        cases = []
+        self.advance()
 
-                if self.current_tok.matches(TOKENTYPE_KEYWORD, 'END'):
-                    res.register_advancement()
-                    self.advance()
-                else:
-                    return res.failure(InvalidSyntaxErro(
-                        self.current_tok.pos_inicio, self.current_tok.pos_final,
-                        "Expected 'END'"
-                    ))
-            else:
-                expr = res.register(self.statement())
-                if res.error:
-                    return res
-                else_case = (expr, False)
+        condition = self.expr()
+        self.expect_keyword('THEN')
 
-        return res.success(else_case)
+        body, is_block = self.block_or_statement()
+        cases.append((condition, body, is_block))
 
-    def if_expr_b_or_c(self):
-        res = ParseResult()
-        cases, else_case = [], None
+        if is_block and self.current_tok.matches(TOKENTYPE_KEYWORD, 'END'):
+            self.advance()
+            return cases, None
 
         if self.current_tok.matches(TOKENTYPE_KEYWORD, 'ELIF'):
-            all_cases = res.register(self.if_expr_b())
-            if res.error:
-                return res
-            cases, else_case = all_cases
-        else:
-            else_case = res.register(self.if_expr_c())
-            if res.error:
-                return res
-
-        return res.success((cases, else_case))
+            new_cases, else_case = self.if_expr_cases()
+            cases.extend(new_cases)
+            return cases, else_case
 
-    def if_expr_cases(self, case_keyword):
-        res = ParseResult()
-        cases = []
-        else_case = None
+        return cases, self.if_expr_else()
 
-        if not self.current_tok.matches(TOKENTYPE_KEYWORD, case_keyword):
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected '{case_keyword}'"
-            ))
+    def if_expr_else(self):
+        if not self.current_tok.matches(TOKENTYPE_KEYWORD, 'ELSE'):
+            return None
 
-        res.register_advancement()
         self.advance()
+        else_case = self.block_or_statement()
+        if else_case[1]:
+            self.expect_keyword('END')
+        return else_case
 
-        condition = res.register(self.expr())
-        if res.error:
-            return res
+    def for_expr(self):
+        self.advance()
 
-        if not self.current_tok.matches(TOKENTYPE_KEYWORD, 'THEN'):
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected 'THEN'"
-            ))
+        if self.current_tok.type != TOKENTYPE_IDENTIFIER:
+            self.fail("Expected identifier")
 
-        res.register_advancement()
+        var_name = self.keep()
         self.advance()
+        self.expect(TOKENTYPE_EQ, "Expected '='")
 
-        if self.current_tok.type == TOKENTYPE_NEWLINE:
-            res.register_advancement()
-            self.advance()
-
-            Stmt = res.register(self.Stmt())
-            if res.error:
-                return res
-            cases.append((condition, Stmt, True))
+        start_value = self.expr()
+        self.expect_keyword('TO')
+        end_value = self.expr()
 
-            if self.current_tok.matches(TOKENTYPE_KEYWORD, 'END'):
-                res.register_advancement()
-                self.advance()
-            else:
-                all_cases = res.register(self.if_expr_b_or_c())
-                if res.error:
-                    return res
-                new_cases, else_case = all_cases
-                cases.extend(new_cases)
+        if self.current_tok.matches(TOKENTYPE_KEYWORD, 'STEP'):
+            self.advance()
+            step_value = self.expr()
         else:
-            expr = res.register(self.statement())
-            if res.error:
-                return res
-            cases.append((condition, expr, False))
-
-            all_cases = res.register(self.if_expr_b_or_c())
-            if res.error:
-                return res
-            new_cases, else_case = all_cases
-            cases.extend(new_cases)
-
-        return res.success((cases, else_case))
+            step_value = None
 
-    def for_expr(self):
-        res = ParseResult()
+        self.expect_keyword('THEN')
+        body, is_block = self.block_or_statement()
+        if is_block:
+            self.expect_keyword('END')
 
-        if not self.current_tok.matches(TOKENTYPE_KEYWORD, 'FOR'):
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected 'FOR'"
-            ))
+        return ForNode(var_name, start_value, end_value, step_value, body, is_block)
 
-        res.register_advancement()
+    def while_expr(self):
         self.advance()
 
-        if self.current_tok.type != TOKENTYPE_IDENTIFIER:
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected identifier"
-            ))
+        condition = self.expr()
+        self.expect_keyword('THEN')
 
-        var_name = self.current_tok
-        res.register_advancement()
-        self.advance()
+        body, is_block = self.block_or_statement()
+        if is_block:
+            self.expect_keyword('END')
 
-        if self.current_tok.type != TOKENTYPE_EQ:
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected '='"
-            ))
+        return WhileNode(condition, body, is_block)
 
-        res.register_advancement()
+    def func_def(self):
         self.advance()
 
-        start_value = res.register(self.expr())
-        if res.error:
-            return res
-
-        if not self.current_tok.matches(TOKENTYPE_KEYWORD, 'TO'):
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected 'TO'"
-            ))
+        if self.current_tok.type == TOKENTYPE_IDENTIFIER:
+            var_name_tok = self.keep()
+            self.advance()
+            if self.current_tok.type != TOKENTYPE_LPAREN:
+                self.fail("Expected '('")
+        else:
+            var_name_tok = None
+            if self.current_tok.type != TOKENTYPE_LPAREN:
+                self.fail("Expected identifier or '('")
 
-        res.register_advancement()
         self.advance()
+        arg_name_toks = []
 
-        end_value = res.register(self.expr())
-        if res.error:
-            return res
-
-        if self.current_tok.matches(TOKENTYPE_KEYWORD, 'STEP'):
-            res.register_advancement()
+        if self.current_tok.type == TOKENTYPE_IDENTIFIER:
+            arg_name_toks.append(self.keep())
             self.advance()
 
-            step_value = res.register(self.expr())
-            if res.error:
-                return res
+            while self.current_tok.type == TOKENTYPE_COMMA:
+                self.advance()
+                if self.current_tok.type != TOKENTYPE_IDENTIFIER:
+                    self.fail("Expected identifier")
+                arg_name_toks.append(self.keep())
+                self.advance()
+
+            self.expect(TOKENTYPE_RPAREN, "Expected ',' or ')'")
         else:
-            step_value = None
+            self.expect(TOKENTYPE_RPAREN, "Expected identifier or ')'")
 
-        if not self.current_tok.matches(TOKENTYPE_KEYWORD, 'THEN'):
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected 'THEN'"
-            ))
+        if self.current_tok.type == TOKENTYPE_ARROW:
+            self.advance()
+            return FuncDefNode(var_name_tok, arg_name_toks, self.expr(), True)
+
+        self.expect(TOKENTYPE_NEWLINE, "Expected '->' or NEWLINE")
+        body = self.Stmt()
+        self.expect_keyword('END')
 
-        res.register_advancement()
+        return FuncDefNode(var_name_tok, arg_name_toks, body, False)
+
+
+class StreamParser(Parser):
+    # Parses a TokenStream a top-level statement at a time
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.tok_idx = -1
         self.advance()
 
-        if self.current_tok.type == TOKENTYPE_NEWLINE:
-            res.register_advancement()
-            self.advance()
+    def advance(self):
+        self.tok_idx += 1
+        token = self.tokens.get(self.tok_idx)
+        if token is not None:
+            self.current_tok = token
+        return self.current_tok
 
-            body = res.register(self.Stmt())
-            if res.error:
-                return res
+    def keep(self):
+        # Stream tokens are Tokens already
+        return self.current_tok
 
-            if not self.current_tok.matches(TOKENTYPE_KEYWORD, 'END'):
-                return res.failure(InvalidSyntaxErro(
-                    self.current_tok.pos_inicio, self.current_tok.pos_final,
-                    f"Expected 'END'"
-                ))
+    def statements(self):
+        # Yields a ParseResult per statement, accepting what Stmt accepts,
+        # and releases the tokens before each statement it starts
+        try:
+            while self.current_tok.type == TOKENTYPE_NEWLINE:
+                self.advance()
 
-            res.register_advancement()
-            self.advance()
+            self.tokens.release(self.tok_idx)
+            yield ParseResult().success(self.statement())
 
-            return res.success(ForNode(var_name, start_value, end_value, step_value, body, True))
+            while self.current_tok.type == TOKENTYPE_NEWLINE:
+                while self.current_tok.type == TOKENTYPE_NEWLINE:
+                    self.advance()
+                if not self.starts_statement():
+                    break
 
-        body = res.register(self.statement())
-        if res.error:
-            return res
+                self.tokens.release(self.tok_idx)
+                yield ParseResult().success(self.statement())
 
-        return res.success(ForNode(var_name, start_value, end_value, step_value, body, False))
+            if self.current_tok.type != TOKENTYPE_EOF:
+                self.fail("Token cannot appear after previous tokens")
+        except ParseSignal as signal:
+            yield ParseResult().failure(signal.error)
 
-    def while_expr(self):
-        res = ParseResult()
 
-        if not self.current_tok.matches(TOKENTYPE_KEYWORD, 'WHILE'):
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected 'WHILE'"
-            ))
+#######################################
+# TABLE PARSER
+#######################################
 
-        res.register_advancement()
-        self.advance()
+# The grammar the TableParser is generated from
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gramatica mIniLang.txt')
 
-        condition = res.register(self.expr())
-        if res.error:
-            return res
+GRAMMAR_PATTERN = re.compile(r'''
+      (?P<SKIP>\s+|\#[^\n]*)
+    | (?P<NAME>[A-Za-z_][A-Za-z0-9_]*)
+    | "(?P<STRING>[^"]*)"
+    | @(?P<ACTION>[A-Za-z_]+)
+    | (?P<PUNCT>[=|;()\[\]{}!])
+    | (?P<ILLEGAL>.)
+''', re.VERBOSE)
 
-        if not self.current_tok.matches(TOKENTYPE_KEYWORD, 'THEN'):
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected 'THEN'"
-            ))
 
-        res.register_advancement()
-        self.advance()
+class GrammarTerminal:
+    # key is the token type, or the keyword for KEYWORD tokens (no keyword
+    # is spelled like a token type)
+    def __init__(self, key, message):
+        self.key = key
+        self.message = message
 
-        if self.current_tok.type == TOKENTYPE_NEWLINE:
-            res.register_advancement()
-            self.advance()
+    def __repr__(self):
+        return self.key
 
-            body = res.register(self.Stmt())
-            if res.error:
-                return res
 
-            if not self.current_tok.matches(TOKENTYPE_KEYWORD, 'END'):
-                return res.failure(InvalidSyntaxErro(
-                    self.current_tok.pos_inicio, self.current_tok.pos_final,
-                    f"Expected 'END'"
-                ))
+class GrammarAction:
+    def __init__(self, name):
+        self.name = name
+        self.function = None
 
-            res.register_advancement()
-            self.advance()
+    def __repr__(self):
+        return f'@{self.name}'
 
-            return res.success(WhileNode(condition, body, True))
 
-        body = res.register(self.statement())
-        if res.error:
-            return res
+class GrammarRule:
+    # productions are lists of symbols, an empty one matches nothing. The
+    # generator fills table (lookahead key -> production, reversed for the
+    # parse stack) and default, used for keys missing from table.
+    def __init__(self, name, message=None):
+        self.name = name
+        self.message = message
+        self.productions = []
+        self.table = {}
+        self.default = None
 
-        return res.success(WhileNode(condition, body, False))
+    def __repr__(self):
+        return self.name
+
+
+class Grammar:
+    # Reads the EBNF of the grammar file into GrammarRules, turning groups,
+    # options and repetitions into rules of their own
+    def __init__(self, text):
+        self.tokens = []
+        for match in GRAMMAR_PATTERN.finditer(text):
+            if match.lastgroup == 'ILLEGAL':
+                raise Exception(f"Invalid character '{match.group()}' in grammar")
+            if match.lastgroup != 'SKIP':
+                self.tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        self.tokens.append((None, None))
+
+        self.tok_idx = 0
+        self.rules = {}
+        self.references = []
+        self.start = None
+
+        while self.tokens[self.tok_idx][0] is not None:
+            self.rule_def()
+
+        for name in self.references:
+            if name not in self.rules:
+                raise Exception(f"Undefined grammar rule '{name}'")
+        for rule in self.rules.values():
+            rule.productions = [[self.rules[symbol] if type(symbol) is str else symbol
+                                 for symbol in production]
+                                for production in rule.productions]
+
+    def current(self):
+        return self.tokens[self.tok_idx]
+
+    def expect(self, type_, value=None):
+        tok_type, tok_value = self.current()
+        if tok_type != type_ or (value is not None and tok_value != value):
+            raise Exception(f"Expected {value or type_} in grammar, found '{tok_value}'")
+        self.tok_idx += 1
+        return tok_value
 
-    def func_def(self):
-        res = ParseResult()
+    def accept(self, value):
+        if self.current() == ('PUNCT', value):
+            self.tok_idx += 1
+            return True
+        return False
 
-        if not self.current_tok.matches(TOKENTYPE_KEYWORD, 'DEF'):
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected 'DEF'"
-            ))
+    def message(self):
+        return self.expect('STRING') if self.accept('!') else None
+
+    def new_rule(self, name, message=None):
+        if name in self.rules:
+            raise Exception(f"Grammar rule '{name}' defined twice")
+        rule = GrammarRule(name, message)
+        self.rules[name] = rule
+        return rule
+
+    def rule_def(self):
+        name = self.expect('NAME')
+        rule = self.new_rule(name, self.message())
+        self.start = self.start or rule
+        self.expect('PUNCT', '=')
+        rule.productions = self.alternatives(name)
+        self.expect('PUNCT', ';')
+
+    def alternatives(self, name):
+        productions = [self.sequence(name)]
+        while self.accept('|'):
+            productions.append(self.sequence(name))
+        return productions
+
+    def sequence(self, name):
+        symbols = []
+        while True:
+            tok_type, value = self.current()
 
-        res.register_advancement()
-        self.advance()
+            if tok_type == 'ACTION':
+                self.tok_idx += 1
+                symbols.append(GrammarAction(value))
+                continue
 
-        if self.current_tok.type == TOKENTYPE_IDENTIFIER:
-            var_name_tok = self.current_tok
-            res.register_advancement()
-            self.advance()
-            if self.current_tok.type != TOKENTYPE_LPAREN:
-                return res.failure(InvalidSyntaxErro(
-                    self.current_tok.pos_inicio, self.current_tok.pos_final,
-                    f"Expected '('"
-                ))
-        else:
-            var_name_tok = None
-            if self.current_tok.type != TOKENTYPE_LPAREN:
-                return res.failure(InvalidSyntaxErro(
-                    self.current_tok.pos_inicio, self.current_tok.pos_final,
-                    f"Expected identifier or '('"
-                ))
+            if tok_type == 'STRING':
+                if value not in KEYWORDS:
+                    raise Exception(f"Unknown keyword '{value}' in grammar")
+                self.tok_idx += 1
+                symbols.append(GrammarTerminal(value, self.message() or f"Expected '{value}'"))
+                continue
 
-        res.register_advancement()
-        self.advance()
-        arg_name_toks = []
+            if tok_type == 'NAME' and value[0].isupper():
+                if value not in TOKEN_TYPES or value == TOKENTYPE_KEYWORD:
+                    raise Exception(f"Unknown token type '{value}' in grammar")
+                self.tok_idx += 1
+                symbols.append(GrammarTerminal(value, self.message() or f'Expected {value}'))
+                continue
 
-        if self.current_tok.type == TOKENTYPE_IDENTIFIER:
-            arg_name_toks.append(self.current_tok)
-            res.register_advancement()
-            self.advance()
+            if tok_type == 'NAME':
+                self.tok_idx += 1
+                self.references.append(value)
+                message = self.message()
+                if message is None:
+                    symbols.append(value)
+                else:
+                    # A message of its own for this use of the rule
+                    rule = self.new_rule(f'{name}_{len(self.rules)}', message)
+                    rule.productions = [[value]]
+                    symbols.append(rule.name)
+                    self.references.append(rule.name)
+                continue
 
-            while self.current_tok.type == TOKENTYPE_COMMA:
-                res.register_advancement()
-                self.advance()
+            if tok_type == 'PUNCT' and value in '([{':
+                self.tok_idx += 1
+                closing = {'(': ')', '[': ']', '{': '}'}[value]
+                productions = self.alternatives(name)
+                self.expect('PUNCT', closing)
+                message = self.message()
+
+                if value == '(' and len(productions) == 1 and message is None:
+                    symbols.extend(productions[0])
+                    continue
+
+                rule = self.new_rule(f'{name}_{len(self.rules)}', message)
+                if value == '[':
+                    productions.append([])
+                elif value == '{':
+                    for production in productions:
+                        production.append(rule.name)
+                    productions.append([])
+                rule.productions = productions
+                symbols.append(rule.name)
+                self.references.append(rule.name)
+                continue
 
-                if self.current_tok.type != TOKENTYPE_IDENTIFIER:
-                    return res.failure(InvalidSyntaxErro(
-                        self.current_tok.pos_inicio, self.current_tok.pos_final,
-                        f"Expected identifier"
-                    ))
+            return symbols
+
+
+class LL1Generator:
+    # Fills the LL(1) tables of a Grammar. Two productions of a rule starting
+    # with the same token are an error. When a token can both start a
+    # production and follow the rule, the production wins, so options and
+    # repetitions read as much as they can, as the Parser does; those choices
+    # are kept in conflicts. A rule with no entry for a token takes its empty
+    # production, leaving the error to whatever comes next; without one it
+    # fails with its message, or takes its last production if it has none.
+    def generate(self, grammar):
+        self.rules = list(grammar.rules.values())
+        self.conflicts = []
+        self.first_sets()
+        self.follow_sets(grammar.start)
+
+        for rule in self.rules:
+            self.fill_table(rule)
+        for rule in self.rules:
+            self.chain(rule)
+
+        return self.conflicts
+
+    def production_first(self, production):
+        # The keys that can start production, and whether it can match nothing
+        keys = set()
+        for symbol in production:
+            if type(symbol) is GrammarTerminal:
+                keys.add(symbol.key)
+                return keys, False
+            if type(symbol) is GrammarRule:
+                keys |= self.first[symbol]
+                if symbol not in self.nullable:
+                    return keys, False
+        return keys, True
+
+    def first_sets(self):
+        self.first = {rule: set() for rule in self.rules}
+        self.nullable = set()
+
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.rules:
+                for production in rule.productions:
+                    keys, nullable = self.production_first(production)
+                    if not keys <= self.first[rule]:
+                        self.first[rule] |= keys
+                        changed = True
+                    if nullable and rule not in self.nullable:
+                        self.nullable.add(rule)
+                        changed = True
+
+    def follow_sets(self, start):
+        self.follow = {rule: set() for rule in self.rules}
+        self.follow[start].add(TOKENTYPE_EOF)
+
+        changed = True
+        while changed:
+            changed = False
+            for rule in self.rules:
+                for production in rule.productions:
+                    for idx, symbol in enumerate(production):
+                        if type(symbol) is not GrammarRule:
+                            continue
+                        keys, nullable = self.production_first(production[idx + 1:])
+                        if nullable:
+                            keys |= self.follow[rule]
+                        if not keys <= self.follow[symbol]:
+                            self.follow[symbol] |= keys
+                            changed = True
+
+    def fill_table(self, rule):
+        empty = None
+
+        for production in rule.productions:
+            keys, nullable = self.production_first(production)
+            reversed_production = production[::-1]
+
+            for key in keys:
+                if key in rule.table:
+                    raise Exception(f"Grammar rule '{rule.name}' is not LL(1): two productions start with {key}")
+                rule.table[key] = reversed_production
+
+            if nullable:
+                if empty is not None:
+                    raise Exception(f"Grammar rule '{rule.name}' is not LL(1): two productions match nothing")
+                empty = reversed_production
+
+        if empty is not None:
+            for key in self.follow[rule]:
+                if key in rule.table:
+                    self.conflicts.append((rule.name, key))
+                else:
+                    rule.table[key] = empty
+            rule.default = empty
+        elif rule.message is None:
+            rule.default = rule.productions[-1][::-1]
+
+    def chain(self, rule):
+        # A rule on top of a production is expanded on the same token, so
+        # push its production along and look the token up only once
+        for key, production in rule.table.items():
+            production = list(production)
+            while production and type(production[-1]) is GrammarRule:
+                following = production[-1].table.get(key, production[-1].default)
+                if following is None:
+                    break
+                production[-1:] = following
+            rule.table[key] = production
 
-                arg_name_toks.append(self.current_tok)
-                res.register_advancement()
-                self.advance()
 
-            if self.current_tok.type != TOKENTYPE_RPAREN:
-                return res.failure(InvalidSyntaxErro(
-                    self.current_tok.pos_inicio, self.current_tok.pos_final,
-                    f"Expected ',' or ')'"
-                ))
-        else:
-            if self.current_tok.type != TOKENTYPE_RPAREN:
-                return res.failure(InvalidSyntaxErro(
-                    self.current_tok.pos_inicio, self.current_tok.pos_final,
-                    f"Expected identifier or ')'"
-                ))
+PARSE_TABLE = None
 
-        res.register_advancement()
-        self.advance()
 
-        if self.current_tok.type == TOKENTYPE_ARROW:
-            res.register_advancement()
-            self.advance()
+def parse_table():
+    # The start rule of the grammar, generated on first use
+    global PARSE_TABLE
 
-            body = res.register(self.expr())
-            if res.error:
-                return res
+    if PARSE_TABLE is None:
+        with open(GRAMMAR_PATH, 'r', encoding='utf-8') as f:
+            grammar = Grammar(f.read())
+        LL1Generator().generate(grammar)
 
-            return res.success(FuncDefNode(
-                var_name_tok,
-                arg_name_toks,
-                body,
-                True
-            ))
+        for rule in grammar.rules.values():
+            for production in rule.productions:
+                for symbol in production:
+                    if type(symbol) is GrammarAction:
+                        symbol.function = getattr(TableParser, f'build_{symbol.name}', None)
+                        if symbol.function is None:
+                            raise Exception(f'No build_{symbol.name} method defined')
 
-        if self.current_tok.type != TOKENTYPE_NEWLINE:
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected '->' or NEWLINE"
-            ))
+        PARSE_TABLE = grammar.start
 
-        res.register_advancement()
-        self.advance()
+    return PARSE_TABLE
 
-        body = res.register(self.Stmt())
-        if res.error:
-            return res
 
-        if not self.current_tok.matches(TOKENTYPE_KEYWORD, 'END'):
-            return res.failure(InvalidSyntaxErro(
-                self.current_tok.pos_inicio, self.current_tok.pos_final,
-                f"Expected 'END'"
-            ))
+class Mark:
+    # Where a list of values of varying length starts on the value stack
+    def __init__(self, pos_inicio):
+        self.pos_inicio = pos_inicio
 
-        res.register_advancement()
-        self.advance()
 
-        return res.success(FuncDefNode(
-            var_name_tok,
-            arg_name_toks,
-            body,
-            False
-        ))
+class TableParser:
+    # Table-driven parser for the grammar file. Rules, tokens to match and
+    # actions wait on an explicit stack, so nesting never recurses in Python;
+    # the indices of matched tokens go on a value stack that the actions
+    # turn into the same nodes the Parser builds, with the same syntax
+    # errors. Tokens are read through a TokenCursor and built only for the
+    # nodes that keep them.
+    #
+    # tokens is a list of Tokens or a TokenBuffer
+    def __init__(self, tokens):
+        self.cursor = TokenCursor(tokens)
+        self.token_count = len(self.cursor)
 
-    ###################################
+    def parse(self):
+        tok = self.cursor
+        token_count = self.token_count
+        tok_idx = 0
+        tok.move(0)
+        key = tok.value if tok.type == TOKENTYPE_KEYWORD else tok.type
+
+        stack = [parse_table()]
+        values = []
+        pop = stack.pop
+        extend = stack.extend
+        push = values.append
+
+        while stack:
+            symbol = pop()
+            kind = type(symbol)
+
+            if kind is GrammarRule:
+                production = symbol.table.get(key, symbol.default)
+                if production is None:
+                    return self.failure(tok, symbol.message)
+                extend(production)
+
+            elif kind is GrammarTerminal:
+                if key != symbol.key:
+                    return self.failure(tok, symbol.message)
+                push(tok_idx)
+                # Past the end the EOF token stays current
+                tok_idx += 1
+                if tok_idx < token_count:
+                    tok.move(tok_idx)
+                    key = tok.value if tok.type == TOKENTYPE_KEYWORD else tok.type
 
-    def bin_op(self, func_a, ops, func_b=None):
-        if func_b == None:
-            func_b = func_a
+            else:
+                symbol.function(values, tok)
 
-        res = ParseResult()
-        left = res.register(func_a())
-        if res.error:
-            return res
+        return ParseResult().success(values[0])
 
-        while self.current_tok.type in ops or (self.current_tok.type, self.current_tok.value) in ops:
-            op_tok = self.current_tok
-            res.register_advancement()
-            self.advance()
-            right = res.register(func_b())
-            if res.error:
-                return res
-            left = BinOpNode(left, op_tok, right)
+    def failure(self, tok, detalhe):
+        return ParseResult().failure(InvalidSyntaxErro(tok.pos_inicio, tok.pos_final, detalhe))
+
+    ###################################
+    # Actions: each gets the value stack and the cursor at the current
+    # token. Matched tokens are ints on the stack until an action builds
+    # the Token a node keeps with tok.token_at().
+
+    @staticmethod
+    def pop_marked(values):
+        idx = len(values) - 1
+        while type(values[idx]) is not Mark:
+            idx -= 1
+        marked = values[idx + 1:]
+        mark = values[idx]
+        del values[idx:]
+        return mark, marked
+
+    @staticmethod
+    def build_mark(values, tok):
+        values.append(Mark(tok.pos_inicio))
+
+    @staticmethod
+    def build_none(values, tok):
+        values.append(None)
+
+    @staticmethod
+    def build_statements(values, tok):
+        mark, marked = TableParser.pop_marked(values)
+        values.append(ListNode(
+            [value for value in marked if type(value) is not int],
+            mark.pos_inicio,
+            tok.pos_final
+        ))
+
+    @staticmethod
+    def build_return(values, tok):
+        node = values.pop()
+        if type(node) is int:
+            values.append(ReturnNode(None, tok.token_at(node).pos_inicio, tok.pos_inicio))
+        else:
+            values.append(ReturnNode(node, tok.token_at(values.pop()).pos_inicio, tok.pos_inicio))
+
+    @staticmethod
+    def build_continue(values, tok):
+        values.append(ContinueNode(tok.token_at(values.pop()).pos_inicio, tok.pos_inicio))
+
+    @staticmethod
+    def build_break(values, tok):
+        values.append(BreakNode(tok.token_at(values.pop()).pos_inicio, tok.pos_inicio))
+
+    @staticmethod
+    def build_var_assign(values, tok):
+        value_node = values.pop()
+        values.pop()
+        var_name_tok = tok.token_at(values.pop())
+        values[-1] = VarAssignNode(var_name_tok, value_node)
+
+    @staticmethod
+    def build_bin_op(values, tok):
+        right_node = values.pop()
+        op_tok = tok.token_at(values.pop())
+        values[-1] = BinOpNode(values[-1], op_tok, right_node)
+
+    @staticmethod
+    def build_unary_op(values, tok):
+        node = values.pop()
+        values[-1] = UnaryOpNode(tok.token_at(values[-1]), node)
+
+    @staticmethod
+    def build_call(values, tok):
+        mark, marked = TableParser.pop_marked(values)
+        values.pop()
+        values[-1] = CallNode(values[-1], [value for value in marked if type(value) is not int])
+
+    @staticmethod
+    def build_number(values, tok):
+        values[-1] = NumberNode(tok.token_at(values[-1]))
+
+    @staticmethod
+    def build_string(values, tok):
+        values[-1] = StringNode(tok.token_at(values[-1]))
+
+    @staticmethod
+    def build_var_access(values, tok):
+        values[-1] = VarAccessNode(tok.token_at(values[-1]))
+
+    @staticmethod
+    def build_parens(values, tok):
+        values.pop()
+        expr = values.pop()
+        values[-1] = expr
+
+    @staticmethod
+    def build_list(values, tok):
+        mark, marked = TableParser.pop_marked(values)
+        values[-1] = ListNode(
+            [value for value in marked if type(value) is not int],
+            tok.token_at(values[-1]).pos_inicio,
+            tok.pos_final
+        )
 
-        return res.success(left)
+    @staticmethod
+    def build_if(values, tok):
+        mark, marked = TableParser.pop_marked(values)
+        cases = []
+        else_case = None
+        for value in marked:
+            if type(value) is tuple:
+                if len(value) == 3:
+                    cases.append(value)
+                else:
+                    else_case = value
+        values[-1] = IfNode(cases, else_case)
+
+    @staticmethod
+    def build_block_case(values, tok):
+        body = values.pop()
+        del values[-2:]
+        values[-1] = (values[-1], body, True)
+
+    @staticmethod
+    def build_single_case(values, tok):
+        body = values.pop()
+        values.pop()
+        values[-1] = (values[-1], body, False)
+
+    @staticmethod
+    def build_block_else(values, tok):
+        values.pop()
+        body = values.pop()
+        del values[-2:]
+        values.append((body, True))
+
+    @staticmethod
+    def build_single_else(values, tok):
+        body = values.pop()
+        values[-1] = (body, False)
+
+    @staticmethod
+    def build_step(values, tok):
+        step_value = values.pop()
+        values[-1] = step_value
+
+    @staticmethod
+    def build_for(values, tok):
+        body, is_block = values.pop()
+        values.pop()
+        step_value = values.pop()
+        end_value = values.pop()
+        values.pop()
+        start_value = values.pop()
+        values.pop()
+        var_name = tok.token_at(values.pop())
+        values[-1] = ForNode(var_name, start_value, end_value, step_value, body, is_block)
+
+    @staticmethod
+    def build_while(values, tok):
+        body, is_block = values.pop()
+        values.pop()
+        condition = values.pop()
+        values[-1] = WhileNode(condition, body, is_block)
+
+    @staticmethod
+    def build_block_body(values, tok):
+        values.pop()
+        body = values.pop()
+        values[-1] = (body, True)
+
+    @staticmethod
+    def build_single_body(values, tok):
+        values[-1] = (values[-1], False)
+
+    @staticmethod
+    def build_arrow_body(values, tok):
+        body = values.pop()
+        values[-1] = (body, True)
+
+    @staticmethod
+    def build_func_body(values, tok):
+        values.pop()
+        body = values.pop()
+        values[-1] = (body, False)
+
+    @staticmethod
+    def build_func_def(values, tok):
+        mark, marked = TableParser.pop_marked(values)
+        body, should_auto_return = marked.pop()
+        marked = [tok.token_at(value) for value in marked]
+        var_name_tok = marked[0] if marked[0].type == TOKENTYPE_IDENTIFIER else None
+        arg_name_toks = [value for value in marked[1 if var_name_tok is None else 2:]
+                         if value.type == TOKENTYPE_IDENTIFIER]
+        values[-1] = FuncDefNode(var_name_tok, arg_name_toks, body, should_auto_return)
 
 
 #######################################
@@ -1381,11 +2223,59 @@ class RTResult:
         )
 
 
+class ControlSignal(Exception):
+    pass
+
+
+class BreakSignal(ControlSignal):
+    pass
+
+
+class ContinueSignal(ControlSignal):
+    pass
+
+
+class ReturnSignal(ControlSignal):
+    def __init__(self, value):
+        self.value = value
+
+
+class ErroSignal(ControlSignal):
+    def __init__(self, error):
+        self.error = error
+
+
+def run_closure(closure, context):
+    res = RTResult()
+    try:
+        return res.success(closure(context))
+    except ReturnSignal as signal:
+        return res.success_return(signal.value)
+    except BreakSignal:
+        return res.success_break()
+    except ContinueSignal:
+        return res.success_continue()
+    except ErroSignal as signal:
+        return res.failure(signal.error)
+
+
+def raise_call_result(res):
+    if res.error:
+        raise ErroSignal(res.error)
+    if res.loop_should_break:
+        raise BreakSignal()
+    if res.loop_should_continue:
+        raise ContinueSignal()
+    return res.value
+
+
 #######################################
 # VALUES
 #######################################
 
 class Value:
+    __slots__ = ('pos_inicio', 'pos_final', 'context')
+
     def __init__(self):
         self.set_pos()
         self.set_context()
@@ -1461,9 +2351,33 @@ class Value:
 
 
 class Number(Value):
+    __slots__ = ('value', 'frozen')
+
     def __init__(self, value):
-        super().__init__()
+        # Made for every result, so without going through Value.__init__
         self.value = value
+        self.pos_inicio = None
+        self.pos_final = None
+        self.context = None
+        self.frozen = False
+
+    def set_pos(self, pos_inicio=None, pos_final=None):
+        # Frozen numbers are shared, whoever changes one gets a copy
+        if self.frozen:
+            return self.copy().set_pos(pos_inicio, pos_final)
+        self.pos_inicio = pos_inicio
+        self.pos_final = pos_final
+        return self
+
+    def set_context(self, context=None):
+        if self.frozen:
+            return self.copy().set_context(context)
+        self.context = context
+        return self
+
+    def freeze(self):
+        self.frozen = True
+        return self
 
     def added_to(self, other):
         if isinstance(other, Number):
@@ -1555,8 +2469,9 @@ class Number(Value):
 
     def copy(self):
         copy = Number(self.value)
-        copy.set_pos(self.pos_inicio, self.pos_final)
-        copy.set_context(self.context)
+        copy.pos_inicio = self.pos_inicio
+        copy.pos_final = self.pos_final
+        copy.context = self.context
         return copy
 
     def is_true(self):
@@ -1569,10 +2484,30 @@ class Number(Value):
         return str(self.value)
 
 
-Number.null = Number(0)
-Number.false = Number(0)
-Number.true = Number(1)
-Number.math_PI = Number(math.pi)
+Number.null = Number(0).freeze()
+Number.false = Number(0).freeze()
+Number.true = Number(1).freeze()
+Number.math_PI = Number(math.pi).freeze()
+
+SMALL_NUMBERS = [Number(value).freeze()
+                 for value in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+
+
+def make_number(value):
+    if type(value) is int and SMALL_INT_MIN <= value <= SMALL_INT_MAX:
+        return SMALL_NUMBERS[value - SMALL_INT_MIN]
+    return Number(value)
+
+
+def constant_number(node, context):
+    # A literal hands out one frozen Number for as long as it keeps running
+    # in the same context
+    constant = node.constant
+    if constant and constant.context is context:
+        return constant
+    constant = node.constant = Number(node.tok.value).set_context(context).set_pos(
+        node.pos_inicio, node.pos_final).freeze()
+    return constant
 
 
 class String(Value):
@@ -1667,6 +2602,55 @@ class List(Value):
         return f'[{", ".join([repr(x) for x in self.elements])}]'
 
 
+# Modules loaded by IMPORT, by absolute path
+MODULES = {}
+
+
+class Module(Value):
+    # The names an IMPORTed script left in its own SymbolTable, read with
+    # '/' like list elements: module / "name"
+    def __init__(self, name, symbol_table):
+        super().__init__()
+        self.name = name
+        self.symbol_table = symbol_table
+        self.functions = {}
+
+    def dived_by(self, other):
+        if not isinstance(other, String):
+            return None, Value.illegal_operation(self, other)
+
+        value = self.symbol_table.symbols.get(other.value)
+        if value == None:
+            return None, RTErro(
+                other.pos_inicio, other.pos_final,
+                f"'{other.value}' is not defined in module \"{self.name}\"",
+                self.context
+            )
+
+        if isinstance(value, BaseFunction):
+            member = self.functions.get(other.value)
+            if member == None or member.function is not value:
+                member = ModuleFunction(value, self)
+                self.functions[other.value] = member
+            # Callers that keep the callee's own context call from here
+            value = member.set_context(self.context)
+
+        return value, None
+
+    def is_true(self):
+        return True
+
+    def copy(self):
+        copy = Module(self.name, self.symbol_table)
+        copy.functions = self.functions
+        copy.set_pos(self.pos_inicio, self.pos_final)
+        copy.set_context(self.context)
+        return copy
+
+    def __repr__(self):
+        return f'<module "{self.name}">'
+
+
 class BaseFunction(Value):
     def __init__(self, name):
         super().__init__()
@@ -1700,7 +2684,6 @@ class BaseFunction(Value):
         for i in range(len(args)):
             arg_name = arg_names[i]
             arg_value = args[i]
-            arg_value.set_context(exec_ctx)
             exec_ctx.symbol_table.set(arg_name, arg_value)
 
     def check_and_populate_args(self, arg_names, args, exec_ctx):
@@ -1712,34 +2695,174 @@ class BaseFunction(Value):
         return res.success(None)
 
 
+class FunctionProfile:
+    def __init__(self):
+        self.calls = 0
+        self.back_edges = 0
+        self.body_closure = None
+
+    def is_hot(self):
+        return TIER_UP_THRESHOLD != None and \
+            self.calls + self.back_edges >= TIER_UP_THRESHOLD
+
+    def tier_up(self, body_node, should_auto_return):
+        compiler = ClosureCompiler()
+        if should_auto_return:
+            self.body_closure = compiler.compile(body_node)
+        else:
+            self.body_closure = compiler.compile_discard(body_node)
+
+
+PURE_BUILTINS = ('print_ret', 'is_number', 'is_string',
+                 'is_list', 'is_function', 'len')
+
+
+class MemoCache:
+    def __init__(self, dependencies):
+        self.dependencies = dependencies
+        self.dependency_set = frozenset(dependencies)
+        self.bound = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, function, args):
+        if len(args) != len(function.arg_names):
+            return None
+
+        key = []
+        for arg in args:
+            if type(arg) is not Number and type(arg) is not String:
+                return None
+            key.append((type(arg.value), arg.value))
+
+        # Free names are looked up from wherever the function is called, so
+        # the entries only hold while those names keep the same values
+        table = function.context.symbol_table
+        bound = [table.get(name) for name in self.dependencies]
+        if bound != self.bound:
+            if not all(self.is_pure_value(value) for value in bound):
+                return None
+            self.entries.clear()
+            self.bound = bound
+
+        return tuple(key)
+
+    def is_pure_value(self, value):
+        if type(value) is Number or type(value) is String:
+            return True
+        if isinstance(value, BuiltInFunction):
+            return value.name in PURE_BUILTINS
+        # A function from another program may read names this one does not
+        # watch
+        return isinstance(value, Function) and value.memo != None and \
+            value.memo.dependency_set <= self.dependency_set
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value == None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        # Lists share their elements between copies, so only immutable
+        # results can be handed out again
+        if type(value) is not Number and type(value) is not String:
+            return
+        self.entries[key] = value
+        if len(self.entries) > MEMO_CACHE_SIZE:
+            self.entries.popitem(last=False)
+
+
+class TailCall:
+    # Returned by a call in tail position so the caller's frame runs it
+    __slots__ = ('function', 'args')
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+
+
 class Function(BaseFunction):
+    tail_calls = True
+
     def __init__(self, name, body_node, arg_names, should_auto_return):
         super().__init__(name)
         self.body_node = body_node
         self.arg_names = arg_names
         self.should_auto_return = should_auto_return
+        self.profile = None
+        self.memo = None
+        # Keeps the text the function was defined in alive with it
+        self.source = find_source(body_node.pos_inicio) if body_node else None
 
     def execute(self, args):
         res = RTResult()
-        interpreter = Interpreter()
+
+        memo = self.memo
+        key = memo.key(self, args) if memo else None
+        if key != None:
+            value = memo.get(key)
+            if value != None:
+                return res.success(value)
+
         exec_ctx = self.generate_new_context()
+        function = self
 
-        res.register(self.check_and_populate_args(
-            self.arg_names, args, exec_ctx))
-        if res.should_return():
-            return res
+        while True:
+            res.register(function.check_and_populate_args(
+                function.arg_names, args, exec_ctx))
+            if res.should_return():
+                return res
 
-        value = res.register(interpreter.visit(self.body_node, exec_ctx))
-        if res.should_return() and res.func_return_value == None:
-            return res
+            value = res.register(function.run_body(exec_ctx))
+            if res.should_return() and res.func_return_value == None:
+                return res
+
+            ret_value = (
+                value if function.should_auto_return else None) or res.func_return_value or Number.null
+            if type(ret_value) is not TailCall:
+                break
 
-        ret_value = (
-            value if self.should_auto_return else None) or res.func_return_value or Number.null
+            # The callee is done with nothing left to do in this frame, so it
+            # takes the frame over instead of growing the stack
+            function = ret_value.function
+            args = ret_value.args
+            if function.memo:
+                tail_key = function.memo.key(function, args)
+                value = function.memo.get(tail_key) if tail_key != None else None
+                if value != None:
+                    ret_value = value
+                    break
+            exec_ctx.replace_frame(function.name, function.pos_inicio)
+            exec_ctx.profile = None
+
+        if key != None:
+            memo.put(key, ret_value)
         return res.success(ret_value)
 
+    def run_body(self, exec_ctx):
+        profile = self.profile
+        if profile:
+            if not profile.body_closure:
+                profile.calls += 1
+                if profile.is_hot():
+                    profile.tier_up(self.body_node, self.should_auto_return)
+
+            if profile.body_closure:
+                return run_closure(profile.body_closure, exec_ctx)
+            exec_ctx.profile = profile
+
+        return Interpreter().run(self.body_node, exec_ctx)
+
     def copy(self):
         copy = Function(self.name, self.body_node,
                         self.arg_names, self.should_auto_return)
+        copy.profile = self.profile
+        copy.memo = self.memo
         copy.set_context(self.context)
         copy.set_pos(self.pos_inicio, self.pos_final)
         return copy
@@ -1748,6 +2871,35 @@ class Function(BaseFunction):
         return f"<function {self.name}>"
 
 
+class ModuleFunction(BaseFunction):
+    # A function read from a Module. Functions see the names of whoever
+    # calls them, so this one is called from a context like the caller's
+    # whose names are the module's, and the rest of its module stays in
+    # reach.
+    def __init__(self, function, module):
+        super().__init__(function.name)
+        self.function = function
+        self.module = module
+
+    def execute(self, args):
+        caller = self.context
+        context = Context(caller.display_name, caller.parent, caller.parent_entry_pos)
+        context.symbol_table = self.module.symbol_table
+
+        function = self.function.set_pos(
+            self.pos_inicio, self.pos_final).set_context(context)
+        return function.execute(args)
+
+    def copy(self):
+        copy = ModuleFunction(self.function, self.module)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_inicio, self.pos_final)
+        return copy
+
+    def __repr__(self):
+        return repr(self.function)
+
+
 class BuiltInFunction(BaseFunction):
     def __init__(self, name):
         super().__init__(name)
@@ -1927,11 +3079,13 @@ class BuiltInFunction(BaseFunction):
     execute_len.arg_names = ["list"]
 
     def execute_run(self, exec_ctx):
+        # The script may call RUN again, which moves this shared function
+        pos_inicio, pos_final = self.pos_inicio, self.pos_final
         fileName = exec_ctx.symbol_table.get("fileName")
 
         if not isinstance(fileName, String):
             return RTResult().failure(RTErro(
-                self.pos_inicio, self.pos_final,
+                pos_inicio, pos_final,
                 "Second argument must be string",
                 exec_ctx
             ))
@@ -1939,20 +3093,27 @@ class BuiltInFunction(BaseFunction):
         fileName = fileName.value
 
         try:
-            with open(fileName, "r") as f:
-                script = f.read()
+            streamed = STREAM_MIN_SIZE is not None and os.path.getsize(fileName) >= STREAM_MIN_SIZE
+            f = open(fileName, "r")
+            if not streamed:
+                with f:
+                    script = f.read()
         except Exception as e:
             return RTResult().failure(RTErro(
-                self.pos_inicio, self.pos_final,
+                pos_inicio, pos_final,
                 f"Failed to load script \"{fileName}\"\n" + str(e),
                 exec_ctx
             ))
 
-        _, error = run(fileName, script)
+        if streamed:
+            with f:
+                _, error = run_stream(fileName, f)
+        else:
+            _, error = run(fileName, script)
 
         if error:
             return RTResult().failure(RTErro(
-                self.pos_inicio, self.pos_final,
+                pos_inicio, pos_final,
                 f"Failed to finish executing script \"{fileName}\"\n" +
                 error.as_string(),
                 exec_ctx
@@ -1962,23 +3123,72 @@ class BuiltInFunction(BaseFunction):
 
     execute_run.arg_names = ["fileName"]
 
+    def execute_import(self, exec_ctx):
+        # Runs a script once into a table of its own and returns it as a
+        # Module, later imports of the same file get the same Module
+        pos_inicio, pos_final = self.pos_inicio, self.pos_final
+        fileName = exec_ctx.symbol_table.get("fileName")
+
+        if not isinstance(fileName, String):
+            return RTResult().failure(RTErro(
+                pos_inicio, pos_final,
+                "Argument must be string",
+                exec_ctx
+            ))
+
+        fileName = fileName.value
+        path = os.path.abspath(fileName)
+        module = MODULES.get(path)
+        if module != None:
+            return RTResult().success(module)
+
+        try:
+            with open(fileName, "r") as f:
+                script = f.read()
+        except Exception as e:
+            return RTResult().failure(RTErro(
+                pos_inicio, pos_final,
+                f"Failed to load module \"{fileName}\"\n" + str(e),
+                exec_ctx
+            ))
+
+        # Registered before it runs, so a module importing itself back gets
+        # the names defined so far
+        module = Module(fileName, SymbolTable(global_symbol_table))
+        MODULES[path] = module
+        _, error = run(fileName, script, symbol_table=module.symbol_table)
+
+        if error:
+            del MODULES[path]
+            return RTResult().failure(RTErro(
+                pos_inicio, pos_final,
+                f"Failed to finish executing module \"{fileName}\"\n" +
+                error.as_string(),
+                exec_ctx
+            ))
+
+        return RTResult().success(module)
+
+    execute_import.arg_names = ["fileName"]
+
+
+BuiltInFunction.print = BuiltInFunction("print")
+BuiltInFunction.print_ret = BuiltInFunction("print_ret")
+BuiltInFunction.input = BuiltInFunction("input")
+BuiltInFunction.input_int = BuiltInFunction("input_int")
+BuiltInFunction.clear = BuiltInFunction("clear")
+BuiltInFunction.is_number = BuiltInFunction("is_number")
+BuiltInFunction.is_string = BuiltInFunction("is_string")
+BuiltInFunction.is_list = BuiltInFunction("is_list")
+BuiltInFunction.is_function = BuiltInFunction("is_function")
+BuiltInFunction.append = BuiltInFunction("append")
+BuiltInFunction.pop = BuiltInFunction("pop")
+BuiltInFunction.extend = BuiltInFunction("extend")
+BuiltInFunction.len = BuiltInFunction("len")
+BuiltInFunction.run = BuiltInFunction("run")
+BuiltInFunction.import_ = BuiltInFunction("import")
+
 
-BuiltInFunction.print = BuiltInFunction("print")
-BuiltInFunction.print_ret = BuiltInFunction("print_ret")
-BuiltInFunction.input = BuiltInFunction("input")
-BuiltInFunction.input_int = BuiltInFunction("input_int")
-BuiltInFunction.clear = BuiltInFunction("clear")
-BuiltInFunction.is_number = BuiltInFunction("is_number")
-BuiltInFunction.is_string = BuiltInFunction("is_string")
-BuiltInFunction.is_list = BuiltInFunction("is_list")
-BuiltInFunction.is_function = BuiltInFunction("is_function")
-BuiltInFunction.append = BuiltInFunction("append")
-BuiltInFunction.pop = BuiltInFunction("pop")
-BuiltInFunction.extend = BuiltInFunction("extend")
-BuiltInFunction.len = BuiltInFunction("len")
-BuiltInFunction.run = BuiltInFunction("run")
-
-
 #######################################
 # CONTEXT
 #######################################
@@ -1989,35 +3199,265 @@ class Context:
         self.parent = parent
         self.parent_entry_pos = parent_entry_pos
         self.symbol_table = None
+        self.slots = None
+        self.profile = None
+        self.tail_calls = None
+        self.tail_call_count = 0
+
+    def replace_frame(self, display_name, call_pos):
+        # A tail call from this frame, made at call_pos, takes it over. The
+        # traceback keeps listing the most recent frames it replaced.
+        if self.tail_calls is None:
+            self.tail_calls = deque(maxlen=TAIL_CALL_FRAMES)
+        self.tail_calls.append((self.display_name, call_pos))
+        self.tail_call_count += 1
+        self.display_name = display_name
 
 
 #######################################
 # SYMBOL TABLE
 #######################################
 
+# Names that have been bound in a table with a parent at some point. Any
+# other name can only live in the table at the root of a chain.
+LOCAL_NAMES = set()
+
+
 class SymbolTable:
     def __init__(self, parent=None):
         self.symbols = {}
         self.parent = parent
+        self.root = parent.root if parent else self
+        self.version = 0
 
     def get(self, name):
-        value = self.symbols.get(name, None)
-        if value == None and self.parent:
-            return self.parent.get(name)
-        return value
+        # Tables chain through every active call, so walk them in a loop
+        table = self
+        while table:
+            if type(table) is not SymbolTable:
+                # Tables such as FrameSymbolTable find names their own way
+                return table.get(name)
+            value = table.symbols.get(name, None)
+            if value != None:
+                return value
+            table = table.parent
+        return None
 
     def set(self, name, value):
+        if self.parent and name not in LOCAL_NAMES:
+            LOCAL_NAMES.add(name)
         self.symbols[name] = value
+        self.version += 1
 
     def remove(self, name):
         del self.symbols[name]
+        self.version += 1
+
+
+class InlineCache:
+    __slots__ = ('table', 'version', 'value')
+
+    def __init__(self, table, value):
+        self.table = table
+        self.version = table.version
+        self.value = value
+
+
+def cached_lookup(node, context):
+    var_name = node.var_name_tok.value
+    cache = node.cache
+    table = context.symbol_table
+
+    if cache:
+        owner = cache.table
+        if table.root is not owner:
+            table = None
+        elif var_name in LOCAL_NAMES:
+            # Scoping is dynamic: a table closer to the caller may have
+            # started to hide the cached one
+            while table is not owner and var_name not in table.symbols:
+                table = table.parent
+        else:
+            # No table below the root ever held the name
+            table = owner
+
+        if table is owner:
+            if owner.version == cache.version:
+                return cache
+            if owner.symbols.get(var_name) is cache.value:
+                cache.version = owner.version
+                return cache
+
+        table = context.symbol_table
+
+    while type(table) is SymbolTable:
+        value = table.symbols.get(var_name, None)
+        if value != None:
+            if table.parent:
+                # Function locals live in a new table on every call
+                return None
+            if not cache:
+                cache = node.cache = InlineCache(table, value)
+            else:
+                cache.__init__(table, value)
+            return cache
+        table = table.parent
+
+    return None
 
 
 #######################################
 # INTERPRETER
 #######################################
 
+# A BinOpNode starts out generic. After its first execution it picks the
+# specialized operation for the operand types it saw; each one checks those
+# types again and returns None when they changed, which sends the node back
+# to the generic path for good.
+
+def add_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(left.value + right.value).set_context(left.context)
+
+
+def sub_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(left.value - right.value).set_context(left.context)
+
+
+def mul_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(left.value * right.value).set_context(left.context)
+
+
+def div_numbers(left, right):
+    if type(left) is Number and type(right) is Number and right.value != 0:
+        return Number(left.value / right.value).set_context(left.context)
+
+
+def pow_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(left.value ** right.value).set_context(left.context)
+
+
+def eq_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(int(left.value == right.value)).set_context(left.context)
+
+
+def ne_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(int(left.value != right.value)).set_context(left.context)
+
+
+def lt_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(int(left.value < right.value)).set_context(left.context)
+
+
+def gt_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(int(left.value > right.value)).set_context(left.context)
+
+
+def lte_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(int(left.value <= right.value)).set_context(left.context)
+
+
+def gte_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(int(left.value >= right.value)).set_context(left.context)
+
+
+def and_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(int(left.value and right.value)).set_context(left.context)
+
+
+def or_numbers(left, right):
+    if type(left) is Number and type(right) is Number:
+        return Number(int(left.value or right.value)).set_context(left.context)
+
+
+def concat_strings(left, right):
+    if type(left) is String and type(right) is String:
+        return String(left.value + right.value).set_context(left.context)
+
+
+def repeat_string(left, right):
+    if type(left) is String and type(right) is Number:
+        return String(left.value * right.value).set_context(left.context)
+
+
+# Nodes whose value is the value of one of their children
+VALUE_PASSING_NODES = frozenset((IfNode, VarAssignNode))
+
+
+def value_source(node):
+    # The node that made the value node last evaluated to. A value is placed
+    # where it was made, so an IF hands on the position of its branch.
+    while True:
+        if type(node) is VarAssignNode:
+            node = node.value_node
+        elif type(node) is IfNode and node.taken:
+            node = node.taken
+        else:
+            return node
+
+
+def binary_op_error(node, method_name, left, right, context, left_source=None):
+    # Values are shared without their positions, so a failed operation runs
+    # again on copies placed where its operands were made to build the
+    # error. Running the right side may take a different branch of an IF on
+    # the left, so callers look up left_source before that.
+    left_source = left_source or value_source(node.left_node)
+    right_source = value_source(node.right_node)
+    left = left.copy().set_pos(
+        left_source.pos_inicio, left_source.pos_final).set_context(context)
+    right = right.copy().set_pos(
+        right_source.pos_inicio, right_source.pos_final).set_context(context)
+    return getattr(left, method_name)(right)[1]
+
+
+def unary_op_error(node, number, context):
+    source = value_source(node.node)
+    number = number.copy().set_pos(
+        source.pos_inicio, source.pos_final).set_context(context)
+    if node.op_tok.type == TOKENTYPE_MINUS:
+        # The -1 stands where the operator is
+        return number.multed_by(Number(-1).set_pos(node.pos_inicio, node.pos_final))[1]
+    return number.notted()[1]
+
+
+GENERIC = 'generic'
+
+SPECIALIZED_BINARY_OPS = {
+    (0, Number, Number): add_numbers,
+    (1, Number, Number): sub_numbers,
+    (2, Number, Number): mul_numbers,
+    (3, Number, Number): div_numbers,
+    (4, Number, Number): pow_numbers,
+    (5, Number, Number): eq_numbers,
+    (6, Number, Number): ne_numbers,
+    (7, Number, Number): lt_numbers,
+    (8, Number, Number): gt_numbers,
+    (9, Number, Number): lte_numbers,
+    (10, Number, Number): gte_numbers,
+    (11, Number, Number): and_numbers,
+    (12, Number, Number): or_numbers,
+    (0, String, String): concat_strings,
+    (2, String, Number): repeat_string,
+}
+
+
 class Interpreter:
+    # Visitors return values directly. RETURN, BREAK, CONTINUE and errors
+    # are raised as ControlSignals, which loops catch and run() turns back
+    # into an RTResult at the function boundary.
+    def run(self, node, context):
+        return run_closure(lambda context: self.visit(node, context), context)
+
     def visit(self, node, context):
         method_name = f'visit_{type(node).__name__}'
         method = getattr(self, method_name, self.no_visit_method)
@@ -2029,155 +3469,120 @@ class Interpreter:
     ###################################
 
     def visit_NumberNode(self, node, context):
-        return RTResult().success(
-            Number(node.tok.value).set_context(context).set_pos(
-                node.pos_inicio, node.pos_final)
-        )
+        return constant_number(node, context)
 
     def visit_StringNode(self, node, context):
-        return RTResult().success(
-            String(node.tok.value).set_context(context).set_pos(
-                node.pos_inicio, node.pos_final)
-        )
+        return String(node.tok.value).set_context(context).set_pos(
+            node.pos_inicio, node.pos_final)
 
     def visit_ListNode(self, node, context):
-        res = RTResult()
-        elements = []
-
-        for element_node in node.element_nodes:
-            elements.append(res.register(self.visit(element_node, context)))
-            if res.should_return():
-                return res
+        elements = [self.visit(element_node, context)
+                    for element_node in node.element_nodes]
 
-        return res.success(
-            List(elements).set_context(context).set_pos(
-                node.pos_inicio, node.pos_final)
-        )
+        return List(elements).set_context(context).set_pos(
+            node.pos_inicio, node.pos_final)
 
     def visit_VarAccessNode(self, node, context):
-        res = RTResult()
         var_name = node.var_name_tok.value
-        value = context.symbol_table.get(var_name)
+        cache = cached_lookup(node, context)
+        value = cache.value if cache else context.symbol_table.get(var_name)
 
         if not value:
-            return res.failure(RTErro(
+            raise ErroSignal(RTErro(
                 node.pos_inicio, node.pos_final,
                 f"'{var_name}' is not defined",
                 context
             ))
 
-        value = value.copy().set_pos(node.pos_inicio, node.pos_final).set_context(context)
-        return res.success(value)
+        return value
 
     def visit_VarAssignNode(self, node, context):
-        res = RTResult()
         var_name = node.var_name_tok.value
-        value = res.register(self.visit(node.value_node, context))
-        if res.should_return():
-            return res
+        value = self.visit(node.value_node, context)
 
         context.symbol_table.set(var_name, value)
-        return res.success(value)
+        return value
 
     def visit_BinOpNode(self, node, context):
-        res = RTResult()
-        left = res.register(self.visit(node.left_node, context))
-        if res.should_return():
-            return res
-        right = res.register(self.visit(node.right_node, context))
-        if res.should_return():
-            return res
-
-        if node.op_tok.type == TOKENTYPE_SUM:
-            resultado, error = left.added_to(right)
-        elif node.op_tok.type == TOKENTYPE_MINUS:
-            resultado, error = left.subbed_by(right)
-        elif node.op_tok.type == TOKENTYPE_MUL:
-            resultado, error = left.multed_by(right)
-        elif node.op_tok.type == TOKENTYPE_DIV:
-            resultado, error = left.dived_by(right)
-        elif node.op_tok.type == TOKENTYPE_POW:
-            resultado, error = left.powed_by(right)
-        elif node.op_tok.type == TOKENTYPE_EE:
-            resultado, error = left.get_comparison_eq(right)
-        elif node.op_tok.type == TOKENTYPE_NE:
-            resultado, error = left.get_comparison_ne(right)
-        elif node.op_tok.type == TOKENTYPE_LT:
-            resultado, error = left.get_comparison_lt(right)
-        elif node.op_tok.type == TOKENTYPE_GT:
-            resultado, error = left.get_comparison_gt(right)
-        elif node.op_tok.type == TOKENTYPE_LTE:
-            resultado, error = left.get_comparison_lte(right)
-        elif node.op_tok.type == TOKENTYPE_GTE:
-            resultado, error = left.get_comparison_gte(right)
-        elif node.op_tok.matches(TOKENTYPE_KEYWORD, 'AND'):
-            resultado, error = left.anded_by(right)
-        elif node.op_tok.matches(TOKENTYPE_KEYWORD, 'OR'):
-            resultado, error = left.ored_by(right)
+        left = self.visit(node.left_node, context)
+        if type(node.left_node) in VALUE_PASSING_NODES:
+            left_source = value_source(node.left_node)
+            right = self.visit(node.right_node, context)
+            return self.apply_BinOpNode(node, left, right, context, left_source)
+        right = self.visit(node.right_node, context)
+        return self.apply_BinOpNode(node, left, right, context)
+
+    def apply_BinOpNode(self, node, left, right, context, left_source=None):
+        specialization = node.specialization
+        if specialization is GENERIC:
+            resultado, error = getattr(left, node.method_name)(right)
+        elif specialization:
+            resultado = specialization(left, right)
+            if resultado:
+                return resultado.set_pos(node.pos_inicio, node.pos_final)
+            node.specialization = GENERIC
+            resultado, error = getattr(left, node.method_name)(right)
+        else:
+            resultado, error = self.specialize_BinOpNode(node, left, right)
 
         if error:
-            return res.failure(error)
-        else:
-            return res.success(resultado.set_pos(node.pos_inicio, node.pos_final))
+            raise ErroSignal(binary_op_error(
+                node, node.method_name, left, right, context, left_source))
+        return resultado.set_pos(node.pos_inicio, node.pos_final)
+
+    def specialize_BinOpNode(self, node, left, right):
+        op_tok = node.op_tok
+        op = BINARY_OPS.get(op_tok.type)
+        if op == None:
+            op = BINARY_OPS[(op_tok.type, op_tok.value)]
+        node.method_name = BINARY_OP_NAMES[op]
+
+        resultado, error = getattr(left, node.method_name)(right)
+        node.specialization = SPECIALIZED_BINARY_OPS.get(
+            (op, type(left), type(right)), GENERIC)
+        return resultado, error
 
     def visit_UnaryOpNode(self, node, context):
-        res = RTResult()
-        number = res.register(self.visit(node.node, context))
-        if res.should_return():
-            return res
-
-        error = None
+        number = self.visit(node.node, context)
+        return self.apply_UnaryOpNode(node, number, context)
 
+    def apply_UnaryOpNode(self, node, number, context):
         if node.op_tok.type == TOKENTYPE_MINUS:
-            number, error = number.multed_by(Number(-1))
+            def operation(number): return number.multed_by(Number(-1))
         elif node.op_tok.matches(TOKENTYPE_KEYWORD, 'NOT'):
-            number, error = number.notted()
+            def operation(number): return number.notted()
+        else:
+            return number.set_pos(node.pos_inicio, node.pos_final)
 
+        resultado, error = operation(number)
         if error:
-            return res.failure(error)
-        else:
-            return res.success(number.set_pos(node.pos_inicio, node.pos_final))
+            raise ErroSignal(unary_op_error(node, number, context))
+        return resultado.set_pos(node.pos_inicio, node.pos_final)
 
     def visit_IfNode(self, node, context):
-        res = RTResult()
-
         for condition, expr, should_return_null in node.cases:
-            condition_value = res.register(self.visit(condition, context))
-            if res.should_return():
-                return res
-
-            if condition_value.is_true():
-                expr_value = res.register(self.visit(expr, context))
-                if res.should_return():
-                    return res
-                return res.success(Number.null if should_return_null else expr_value)
+            if self.visit(condition, context).is_true():
+                expr_value = self.visit(expr, context)
+                node.taken = None if should_return_null else expr
+                return Number.null if should_return_null else expr_value
 
         if node.else_case:
             expr, should_return_null = node.else_case
-            expr_value = res.register(self.visit(expr, context))
-            if res.should_return():
-                return res
-            return res.success(Number.null if should_return_null else expr_value)
+            expr_value = self.visit(expr, context)
+            node.taken = None if should_return_null else expr
+            return Number.null if should_return_null else expr_value
 
-        return res.success(Number.null)
+        node.taken = None
+        return Number.null
 
     def visit_ForNode(self, node, context):
-        res = RTResult()
         elements = []
 
-        start_value = res.register(self.visit(node.start_value_node, context))
-        if res.should_return():
-            return res
-
-        end_value = res.register(self.visit(node.end_value_node, context))
-        if res.should_return():
-            return res
+        start_value = self.visit(node.start_value_node, context)
+        end_value = self.visit(node.end_value_node, context)
 
         if node.step_value_node:
-            step_value = res.register(
-                self.visit(node.step_value_node, context))
-            if res.should_return():
-                return res
+            step_value = self.visit(node.step_value_node, context)
         else:
             step_value = Number(1)
 
@@ -2188,155 +3593,3829 @@ class Interpreter:
         else:
             def condition(): return i > end_value.value
 
+        profile = context.profile
+        trace = node.trace
+
         while condition():
-            context.symbol_table.set(node.var_name_tok.value, Number(i))
+            if trace:
+                if not trace.function and trace.should_record():
+                    trace.record(node, context, i, step_value.value)
+
+                if trace.function:
+                    done, i = trace.function(
+                        context, i, end_value.value, step_value.value)
+                    if done:
+                        break
+                    trace.bail()
+
+            context.symbol_table.set(node.var_name_tok.value, make_number(i))
             i += step_value.value
+            if profile:
+                profile.back_edges += 1
 
-            value = res.register(self.visit(node.body_node, context))
-            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
-                return res
-
-            if res.loop_should_continue:
+            try:
+                value = self.visit(node.body_node, context)
+            except ContinueSignal:
                 continue
-
-            if res.loop_should_break:
+            except BreakSignal:
                 break
 
             elements.append(value)
 
-        return res.success(
+        return (
             Number.null if node.should_return_null else
             List(elements).set_context(context).set_pos(
                 node.pos_inicio, node.pos_final)
         )
 
     def visit_WhileNode(self, node, context):
-        res = RTResult()
         elements = []
+        profile = context.profile
+        trace = node.trace
 
         while True:
-            condition = res.register(self.visit(node.condition_node, context))
-            if res.should_return():
-                return res
+            if trace:
+                if not trace.function and trace.should_record():
+                    trace.record(node, context)
 
-            if not condition.is_true():
+                if trace.function:
+                    done, _ = trace.function(context)
+                    if done:
+                        break
+                    trace.bail()
+
+            if not self.visit(node.condition_node, context).is_true():
                 break
 
-            value = res.register(self.visit(node.body_node, context))
-            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
-                return res
+            if profile:
+                profile.back_edges += 1
 
-            if res.loop_should_continue:
+            try:
+                value = self.visit(node.body_node, context)
+            except ContinueSignal:
                 continue
-
-            if res.loop_should_break:
+            except BreakSignal:
                 break
 
             elements.append(value)
 
-        return res.success(
+        return (
             Number.null if node.should_return_null else
             List(elements).set_context(context).set_pos(
                 node.pos_inicio, node.pos_final)
         )
 
     def visit_FuncDefNode(self, node, context):
-        res = RTResult()
-
         func_name = node.var_name_tok.value if node.var_name_tok else None
         body_node = node.body_node
         arg_names = [arg_name.value for arg_name in node.arg_name_toks]
         func_value = Function(func_name, body_node, arg_names, node.should_auto_return).set_context(context).set_pos(
             node.pos_inicio, node.pos_final)
 
+        # Every function made from this definition shares one profile
+        if not node.profile:
+            node.profile = FunctionProfile()
+        func_value.profile = node.profile
+        func_value.memo = node.memo
+
         if node.var_name_tok:
             context.symbol_table.set(func_name, func_value)
 
-        return res.success(func_value)
+        return func_value
 
     def visit_CallNode(self, node, context):
-        res = RTResult()
-        args = []
-
-        value_to_call = res.register(self.visit(node.node_to_call, context))
-        if res.should_return():
-            return res
-        value_to_call = value_to_call.copy().set_pos(node.pos_inicio, node.pos_final)
-
-        for arg_node in node.arg_nodes:
-            args.append(res.register(self.visit(arg_node, context)))
-            if res.should_return():
-                return res
+        value_to_call = self.visit(node.node_to_call, context)
+        args = [self.visit(arg_node, context) for arg_node in node.arg_nodes]
 
-        return_value = res.register(value_to_call.execute(args))
-        if res.should_return():
-            return res
-        return_value = return_value.copy().set_pos(
+        # The callee is shared, it only learns where it is called from right
+        # before it runs
+        value_to_call = value_to_call.set_pos(
             node.pos_inicio, node.pos_final).set_context(context)
-        return res.success(return_value)
+        if node.tail_call and isinstance(value_to_call, Function) and value_to_call.tail_calls:
+            return TailCall(value_to_call, args)
+        return raise_call_result(value_to_call.execute(args))
 
     def visit_ReturnNode(self, node, context):
-        res = RTResult()
-
         if node.node_to_return:
-            value = res.register(self.visit(node.node_to_return, context))
-            if res.should_return():
-                return res
-        else:
-            value = Number.null
-
-        return res.success_return(value)
+            raise ReturnSignal(self.visit(node.node_to_return, context))
+        raise ReturnSignal(Number.null)
 
     def visit_ContinueNode(self, node, context):
-        return RTResult().success_continue()
+        raise ContinueSignal()
 
     def visit_BreakNode(self, node, context):
-        return RTResult().success_break()
+        raise BreakSignal()
+
+
+def mark_tail_calls(node):
+    # Calls whose value is returned as is run in the frame of the function
+    # making them, see Function.execute
+    if isinstance(node, FuncDefNode):
+        if node.should_auto_return:
+            mark_tail_position(node.body_node)
+        mark_returns(node.body_node)
+
+    for child in child_nodes(node):
+        mark_tail_calls(child)
+
+
+def mark_returns(node):
+    if isinstance(node, ReturnNode):
+        if node.node_to_return:
+            mark_tail_position(node.node_to_return)
+        return
+    if isinstance(node, FuncDefNode):
+        return
+
+    for child in child_nodes(node):
+        mark_returns(child)
+
+
+def mark_tail_position(node):
+    if isinstance(node, CallNode):
+        node.tail_call = True
+    elif isinstance(node, IfNode):
+        for _, expr, should_return_null in node.cases:
+            if not should_return_null:
+                mark_tail_position(expr)
+        if node.else_case and not node.else_case[1]:
+            mark_tail_position(node.else_case[0])
 
 
 #######################################
-# RUN
+# STACKLESS
 #######################################
 
-global_symbol_table = SymbolTable()
-global_symbol_table.set("NULL", Number.null)
-global_symbol_table.set("FALSE", Number.false)
-global_symbol_table.set("TRUE", Number.true)
-global_symbol_table.set("MATH_PI", Number.math_PI)
-global_symbol_table.set("PRINT", BuiltInFunction.print)
-global_symbol_table.set("PRINT_RET", BuiltInFunction.print_ret)
-global_symbol_table.set("INPUT", BuiltInFunction.input)
-global_symbol_table.set("INPUT_INT", BuiltInFunction.input_int)
-global_symbol_table.set("CLEAR", BuiltInFunction.clear)
-global_symbol_table.set("CLS", BuiltInFunction.clear)
-global_symbol_table.set("IS_NUM", BuiltInFunction.is_number)
-global_symbol_table.set("IS_STR", BuiltInFunction.is_string)
-global_symbol_table.set("IS_LIST", BuiltInFunction.is_list)
-global_symbol_table.set("IS_DEF", BuiltInFunction.is_function)
-global_symbol_table.set("APPEND", BuiltInFunction.append)
-global_symbol_table.set("POP", BuiltInFunction.pop)
-global_symbol_table.set("EXTEND", BuiltInFunction.extend)
-global_symbol_table.set("LEN", BuiltInFunction.len)
-global_symbol_table.set("RUN", BuiltInFunction.run)
+class StacklessInterpreter(Interpreter):
+    # Nodes with children are generators: they yield the (node, context) to
+    # visit next and get its value sent back, and calls yield the generator
+    # running the function. visit keeps the suspended generators on a list
+    # and throws ControlSignals into them, so miniLang recursion never grows
+    # the Python stack.
+    def __init__(self):
+        self.depth = 0
 
+    def visit(self, node, context):
+        frame = Interpreter.visit(self, node, context)
+        if type(frame) is not GeneratorType:
+            return frame
 
-def run(fileName, text):
-    # Generate tokens
-    lexer = Lexer(fileName, text)
-    tokens, error = lexer.make_tokens()
-    if error:
-        return None, error
+        stack = []
+        value = None
+        signal = None
 
-    # Generate AST
-    parser = Parser(tokens)
-    ast = parser.parse()
-    if ast.error:
-        return None, ast.error
+        while True:
+            try:
+                if signal:
+                    thrown, signal = signal, None
+                    request = frame.throw(thrown)
+                else:
+                    request = frame.send(value)
+            except StopIteration as stop:
+                value = stop.value
+                if not stack:
+                    return value
+                frame = stack.pop()
+                continue
+            except ControlSignal as raised:
+                if not stack:
+                    raise
+                signal = raised
+                frame = stack.pop()
+                continue
 
-    # Run program
-    interpreter = Interpreter()
-    context = Context('<program>')
-    context.symbol_table = global_symbol_table
-    resultado = interpreter.visit(ast.node, context)
+            try:
+                if type(request) is tuple:
+                    child = Interpreter.visit(self, *request)
+                else:
+                    child = request
+            except ControlSignal as raised:
+                signal = raised
+                continue
 
-    return resultado.value, resultado.error
+            if type(child) is GeneratorType:
+                stack.append(frame)
+                frame = child
+                value = None
+            else:
+                value = child
+
+    ###################################
+
+    def visit_ListNode(self, node, context):
+        elements = []
+
+        for element_node in node.element_nodes:
+            elements.append((yield element_node, context))
+
+        return List(elements).set_context(context).set_pos(
+            node.pos_inicio, node.pos_final)
+
+    def visit_VarAssignNode(self, node, context):
+        var_name = node.var_name_tok.value
+        value = yield node.value_node, context
+
+        context.symbol_table.set(var_name, value)
+        return value
+
+    def visit_BinOpNode(self, node, context):
+        left = yield node.left_node, context
+        if type(node.left_node) in VALUE_PASSING_NODES:
+            left_source = value_source(node.left_node)
+            right = yield node.right_node, context
+            return self.apply_BinOpNode(node, left, right, context, left_source)
+        right = yield node.right_node, context
+        return self.apply_BinOpNode(node, left, right, context)
+
+    def visit_UnaryOpNode(self, node, context):
+        number = yield node.node, context
+        return self.apply_UnaryOpNode(node, number, context)
+
+    def visit_IfNode(self, node, context):
+        for condition, expr, should_return_null in node.cases:
+            condition_value = yield condition, context
+            if condition_value.is_true():
+                expr_value = yield expr, context
+                node.taken = None if should_return_null else expr
+                return Number.null if should_return_null else expr_value
+
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            expr_value = yield expr, context
+            node.taken = None if should_return_null else expr
+            return Number.null if should_return_null else expr_value
+
+        node.taken = None
+        return Number.null
+
+    def visit_ForNode(self, node, context):
+        elements = []
+
+        start_value = yield node.start_value_node, context
+        end_value = yield node.end_value_node, context
+
+        if node.step_value_node:
+            step_value = yield node.step_value_node, context
+        else:
+            step_value = Number(1)
+
+        i = start_value.value
+
+        if step_value.value >= 0:
+            def condition(): return i < end_value.value
+        else:
+            def condition(): return i > end_value.value
+
+        while condition():
+            context.symbol_table.set(node.var_name_tok.value, make_number(i))
+            i += step_value.value
+
+            try:
+                value = yield node.body_node, context
+            except ContinueSignal:
+                continue
+            except BreakSignal:
+                break
+
+            elements.append(value)
+
+        return (
+            Number.null if node.should_return_null else
+            List(elements).set_context(context).set_pos(
+                node.pos_inicio, node.pos_final)
+        )
+
+    def visit_WhileNode(self, node, context):
+        elements = []
+
+        while True:
+            condition = yield node.condition_node, context
+            if not condition.is_true():
+                break
+
+            try:
+                value = yield node.body_node, context
+            except ContinueSignal:
+                continue
+            except BreakSignal:
+                break
+
+            elements.append(value)
+
+        return (
+            Number.null if node.should_return_null else
+            List(elements).set_context(context).set_pos(
+                node.pos_inicio, node.pos_final)
+        )
+
+    def visit_CallNode(self, node, context):
+        args = []
+
+        value_to_call = yield node.node_to_call, context
+        for arg_node in node.arg_nodes:
+            args.append((yield arg_node, context))
+
+        value_to_call = value_to_call.set_pos(
+            node.pos_inicio, node.pos_final).set_context(context)
+        if type(value_to_call) is Function:
+            if node.tail_call:
+                return TailCall(value_to_call, args)
+            return (yield self.call(value_to_call, args))
+        return raise_call_result(value_to_call.execute(args))
+
+    def call(self, function, args):
+        # Function.execute, with the body visited by the caller's loop
+        memo = function.memo
+        key = memo.key(function, args) if memo else None
+        if key != None:
+            value = memo.get(key)
+            if value != None:
+                return value
+
+        if self.depth >= MAX_CALL_DEPTH:
+            raise ErroSignal(RTErro(
+                function.pos_inicio, function.pos_final,
+                f"Stack overflow: more than {MAX_CALL_DEPTH} nested calls",
+                function.context
+            ))
+
+        exec_ctx = function.generate_new_context()
+        self.depth += 1
+        try:
+            value = yield from self.call_body(function, args, exec_ctx)
+        finally:
+            self.depth -= 1
+
+        if key != None:
+            memo.put(key, value)
+        return value
+
+    def call_body(self, function, args, exec_ctx):
+        while True:
+            raise_call_result(function.check_and_populate_args(
+                function.arg_names, args, exec_ctx))
+
+            try:
+                value = yield function.body_node, exec_ctx
+                ret_value = value if function.should_auto_return else None
+            except ReturnSignal as signal:
+                ret_value = signal.value
+
+            ret_value = ret_value or Number.null
+            if type(ret_value) is not TailCall:
+                return ret_value
+
+            function = ret_value.function
+            args = ret_value.args
+            if function.memo:
+                tail_key = function.memo.key(function, args)
+                value = function.memo.get(tail_key) if tail_key != None else None
+                if value != None:
+                    return value
+            exec_ctx.replace_frame(function.name, function.pos_inicio)
+
+    def visit_ReturnNode(self, node, context):
+        if node.node_to_return:
+            raise ReturnSignal((yield node.node_to_return, context))
+        raise ReturnSignal(Number.null)
+
+
+#######################################
+# OPTIMIZER
+#######################################
+
+MAX_FOLDED_STRING = 4096
+MAX_FOLDED_POWER = 128
+
+
+class Optimizer:
+    def optimize(self, node):
+        method_name = f'optimize_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node)
+
+    def no_visit_method(self, node):
+        raise Exception(f'No optimize_{type(node).__name__} method defined')
+
+    ###################################
+
+    def constant_value(self, node):
+        if isinstance(node, NumberNode):
+            return Number(node.tok.value)
+        if isinstance(node, StringNode):
+            return String(node.tok.value)
+        return None
+
+    def constant_node(self, value, node):
+        if type(value.value) is int:
+            tok_type = TOKENTYPE_INT
+        elif type(value.value) is float:
+            tok_type = TOKENTYPE_FLOAT
+        elif type(value.value) is str:
+            tok = Token(TOKENTYPE_STRING, value.value,
+                        node.pos_inicio, node.pos_final)
+            return StringNode(tok)
+        else:
+            return None
+
+        tok = Token(tok_type, value.value, node.pos_inicio, node.pos_final)
+        return NumberNode(tok)
+
+    def null_node(self, node):
+        return NumberNode(Token(TOKENTYPE_INT, 0, node.pos_inicio, node.pos_final))
+
+    def true_node(self, node):
+        return NumberNode(Token(TOKENTYPE_INT, 1, node.pos_inicio, node.pos_final))
+
+    def is_foldable(self, method_name, left, right):
+        # Keep results that would be huge to build out of the AST, they are
+        # only paid for at runtime if the code actually runs
+        if method_name == 'powed_by':
+            return isinstance(right.value, (int, float)) and abs(right.value) <= MAX_FOLDED_POWER
+        if method_name == 'multed_by' and isinstance(left, String):
+            return isinstance(right.value, int) and len(left.value) * right.value <= MAX_FOLDED_STRING
+        if method_name == 'added_to' and isinstance(left, String):
+            return isinstance(right, String) and len(left.value) + len(right.value) <= MAX_FOLDED_STRING
+        return True
+
+    def drop_dead_code(self, element_nodes):
+        # Nothing after RETURN/BREAK/CONTINUE in the same block can run
+        for idx, element_node in enumerate(element_nodes):
+            if isinstance(element_node, (ReturnNode, BreakNode, ContinueNode)):
+                return element_nodes[:idx + 1]
+        return element_nodes
+
+    ###################################
+
+    def optimize_NumberNode(self, node):
+        return node
+
+    def optimize_StringNode(self, node):
+        return node
+
+    def optimize_ListNode(self, node):
+        node.element_nodes = self.drop_dead_code(
+            [self.optimize(element_node) for element_node in node.element_nodes])
+        return node
+
+    def optimize_VarAccessNode(self, node):
+        return node
+
+    def optimize_VarAssignNode(self, node):
+        node.value_node = self.optimize(node.value_node)
+        return node
+
+    def optimize_BinOpNode(self, node):
+        node.left_node = self.optimize(node.left_node)
+        node.right_node = self.optimize(node.right_node)
+
+        left = self.constant_value(node.left_node)
+        right = self.constant_value(node.right_node)
+        if left == None or right == None:
+            return node
+
+        op_tok = node.op_tok
+        op = BINARY_OPS.get(op_tok.type)
+        if op == None:
+            op = BINARY_OPS[(op_tok.type, op_tok.value)]
+        method_name = BINARY_OP_NAMES[op]
+
+        if not self.is_foldable(method_name, left, right):
+            return node
+
+        resultado, error = getattr(left, method_name)(right)
+        if error:
+            # Leave it for runtime, so the error is raised when (and if) it runs
+            return node
+        return self.constant_node(resultado, node) or node
+
+    def optimize_UnaryOpNode(self, node):
+        node.node = self.optimize(node.node)
+        value = self.constant_value(node.node)
+        if value == None:
+            return node
+
+        if node.op_tok.type == TOKENTYPE_MINUS:
+            resultado, error = value.multed_by(Number(-1))
+        elif node.op_tok.matches(TOKENTYPE_KEYWORD, 'NOT'):
+            if not isinstance(value, Number):
+                return node
+            resultado, error = value.notted()
+        else:
+            resultado, error = value, None
+
+        if error:
+            return node
+        return self.constant_node(resultado, node) or node
+
+    def optimize_IfNode(self, node):
+        cases = []
+
+        for condition, expr, should_return_null in node.cases:
+            condition = self.optimize(condition)
+            expr = self.optimize(expr)
+            value = self.constant_value(condition)
+
+            if value == None:
+                cases.append((condition, expr, should_return_null))
+                continue
+
+            if not value.is_true():
+                continue
+
+            if cases:
+                # Earlier cases still have to be tested, this one is the else
+                node.cases = cases
+                node.else_case = (expr, should_return_null)
+                return node
+
+            if should_return_null:
+                return IfNode([(condition, expr, should_return_null)], None)
+            return expr
+
+        else_case = None
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            else_case = (self.optimize(expr), should_return_null)
+
+        if cases:
+            node.cases = cases
+            node.else_case = else_case
+            return node
+
+        if not else_case:
+            return self.null_node(node)
+        expr, should_return_null = else_case
+        if should_return_null:
+            return IfNode([(self.true_node(expr), expr, True)], None)
+        return expr
+
+    def optimize_ForNode(self, node):
+        node.start_value_node = self.optimize(node.start_value_node)
+        node.end_value_node = self.optimize(node.end_value_node)
+        if node.step_value_node:
+            node.step_value_node = self.optimize(node.step_value_node)
+        node.body_node = self.optimize(node.body_node)
+        return node
+
+    def optimize_WhileNode(self, node):
+        node.condition_node = self.optimize(node.condition_node)
+        node.body_node = self.optimize(node.body_node)
+        return node
+
+    def optimize_FuncDefNode(self, node):
+        node.body_node = self.optimize(node.body_node)
+        return node
+
+    def optimize_CallNode(self, node):
+        node.node_to_call = self.optimize(node.node_to_call)
+        node.arg_nodes = [self.optimize(arg_node) for arg_node in node.arg_nodes]
+        return node
+
+    def optimize_ReturnNode(self, node):
+        if node.node_to_return:
+            node.node_to_return = self.optimize(node.node_to_return)
+        return node
+
+    def optimize_ContinueNode(self, node):
+        return node
+
+    def optimize_BreakNode(self, node):
+        return node
+
+
+#######################################
+# RESOLVER
+#######################################
+
+class FunctionScope:
+    def __init__(self, node):
+        self.params = [arg_name.value for arg_name in node.arg_name_toks]
+        self.assigned = set()
+        self.reads = set()
+        self.walk(node.body_node)
+        self.assigned.difference_update(self.params)
+        self.free = self.reads - self.assigned - set(self.params)
+        self.slots = {}
+        self.local_names = []
+        self.needs_table = False
+
+    def walk(self, node):
+        if isinstance(node, VarAccessNode):
+            self.reads.add(node.var_name_tok.value)
+        elif isinstance(node, VarAssignNode):
+            self.assigned.add(node.var_name_tok.value)
+        elif isinstance(node, ForNode):
+            self.assigned.add(node.var_name_tok.value)
+        elif isinstance(node, FuncDefNode):
+            # Nested functions get their own scope
+            if node.var_name_tok:
+                self.assigned.add(node.var_name_tok.value)
+            return
+
+        for child in child_nodes(node):
+            self.walk(child)
+
+    def is_local(self, name):
+        return name in self.assigned or name in self.params
+
+
+# Built-in functions that never run miniLang code. RUN and IMPORT are left
+# out, they run functions the Resolver never sees.
+PLAIN_BUILTINS = frozenset((
+    'PRINT', 'PRINT_RET', 'INPUT', 'INPUT_INT', 'CLEAR', 'CLS', 'IS_NUM',
+    'IS_STR', 'IS_LIST', 'IS_DEF', 'APPEND', 'POP', 'EXTEND', 'LEN',
+))
+
+
+class Resolver:
+    def resolve(self, node):
+        self.scopes = {}
+        self.calls = []
+        self.rebound = set()
+        self.collect(node)
+
+        # Scoping is dynamic: a function may read a name from whoever called
+        # it, so any local that some function reads as a free name has to
+        # stay in a SymbolTable where that lookup can find it
+        self.exposed = set()
+        for scope in self.scopes.values():
+            self.exposed.update(scope.free)
+
+        # A streamed statement may be called from, or call, functions that
+        # have not been parsed yet, and a call to anything but a function of
+        # the program may run code loaded by RUN or IMPORT or left by an
+        # earlier run(). Either way none of the names can leave the tables.
+        if (type(node) is ListNode and node.partial) or not self.calls_known_code():
+            for scope in self.scopes.values():
+                self.exposed.update(scope.reads, scope.assigned, scope.params)
+
+        for scope in self.scopes.values():
+            for name in scope.params + sorted(scope.assigned):
+                if name in self.exposed:
+                    scope.needs_table = True
+                elif name not in scope.slots:
+                    scope.slots[name] = len(scope.local_names)
+                    scope.local_names.append(name)
+
+        return self
+
+    def collect(self, node):
+        if isinstance(node, FuncDefNode):
+            self.scopes[node] = FunctionScope(node)
+            self.rebound.update(self.scopes[node].params)
+        elif isinstance(node, (VarAssignNode, ForNode)):
+            self.rebound.add(node.var_name_tok.value)
+        elif isinstance(node, CallNode):
+            self.calls.append(node.node_to_call)
+        for child in child_nodes(node):
+            self.collect(child)
+
+    def calls_known_code(self):
+        # Whether every call goes to a plain built-in or to a function the
+        # program defines under a name nothing else binds
+        defined = set(func_node.var_name_tok.value for func_node in self.scopes
+                      if func_node.var_name_tok)
+
+        for callee in self.calls:
+            if not isinstance(callee, VarAccessNode):
+                return False
+            name = callee.var_name_tok.value
+            if name in self.rebound or (name not in defined and name not in PLAIN_BUILTINS):
+                return False
+        return True
+
+
+#######################################
+# TYPE INFERENCE
+#######################################
+
+TYPE_INT = 'int'
+TYPE_FLOAT = 'float'
+TYPE_NUMBER = 'number'
+TYPE_STRING = 'string'
+TYPE_LIST = 'list'
+TYPE_FUNCTION = 'function'
+TYPE_ANY = 'any'
+
+NUMBER_TYPES = (TYPE_INT, TYPE_FLOAT, TYPE_NUMBER)
+
+
+def join_types(a, b):
+    # None means nothing has been seen yet
+    if a == None:
+        return b
+    if b == None or a == b:
+        return a
+    if a in NUMBER_TYPES and b in NUMBER_TYPES:
+        return TYPE_NUMBER
+    return TYPE_ANY
+
+
+def arith_type(a, b):
+    if a == TYPE_INT and b == TYPE_INT:
+        return TYPE_INT
+    if a in (TYPE_INT, TYPE_FLOAT) and b in (TYPE_INT, TYPE_FLOAT):
+        return TYPE_FLOAT
+    return TYPE_NUMBER
+
+
+class TypeInference:
+    # Works out, for the whole program, which type every variable name and
+    # expression always has, and stores it as node.inferred_type. Scoping is
+    # dynamic, so a name gets one type from every assignment to it anywhere
+    # in the program. A value from outside the program (an earlier run, a
+    # caller in another script) can still break these types, so engines that
+    # use them must check the values they read from a SymbolTable.
+    def infer(self, node):
+        self.var_types = {}
+        self.sources = []
+        self.functions = {}
+        self.calls = {}
+        self.escaping = set()
+        self.collect(node)
+
+        changed = True
+        while changed:
+            changed = False
+            for var_name, source in self.sources:
+                old_type = self.var_types.get(var_name)
+                new_type = join_types(old_type, self.source_type(source))
+                if new_type != old_type:
+                    self.var_types[var_name] = new_type
+                    changed = True
+
+        self.annotate(node)
+        return node
+
+    def collect(self, node, is_callee=False):
+        if isinstance(node, VarAccessNode):
+            if not is_callee:
+                self.escaping.add(node.var_name_tok.value)
+        elif isinstance(node, VarAssignNode):
+            self.sources.append((node.var_name_tok.value, node.value_node))
+        elif isinstance(node, ForNode):
+            self.sources.append((node.var_name_tok.value, node))
+        elif isinstance(node, FuncDefNode):
+            if node.var_name_tok:
+                func_name = node.var_name_tok.value
+                self.sources.append((func_name, node))
+                self.functions.setdefault(func_name, []).append(node)
+            for idx, arg_name in enumerate(node.arg_name_toks):
+                self.sources.append((arg_name.value, (node, idx)))
+        elif isinstance(node, CallNode):
+            if isinstance(node.node_to_call, VarAccessNode):
+                self.calls.setdefault(
+                    node.node_to_call.var_name_tok.value, []).append(node)
+                for arg_node in node.arg_nodes:
+                    self.collect(arg_node)
+                return
+
+        for child in child_nodes(node):
+            self.collect(child)
+
+    def source_type(self, source):
+        if isinstance(source, ForNode):
+            start_type = self.type_of(source.start_value_node)
+            step_type = self.type_of(
+                source.step_value_node) if source.step_value_node else TYPE_INT
+            if start_type == None or step_type == None:
+                return None
+            if start_type in NUMBER_TYPES and step_type in NUMBER_TYPES:
+                return arith_type(start_type, step_type)
+            return TYPE_ANY
+
+        if isinstance(source, tuple):
+            return self.param_type(*source)
+
+        return self.type_of(source)
+
+    def param_type(self, node, idx):
+        # Arguments are only known when every call of the function is a
+        # call by name in this program
+        if not node.var_name_tok:
+            return TYPE_ANY
+        func_name = node.var_name_tok.value
+        if func_name in self.escaping or \
+                self.var_types.get(func_name) != TYPE_FUNCTION:
+            return TYPE_ANY
+
+        arg_type = None
+        for call in self.calls.get(func_name, []):
+            if len(call.arg_nodes) == len(node.arg_name_toks):
+                arg_type = join_types(
+                    arg_type, self.type_of(call.arg_nodes[idx]))
+        return arg_type
+
+    def type_of(self, node):
+        if isinstance(node, NumberNode):
+            return TYPE_INT if node.tok.type == TOKENTYPE_INT else TYPE_FLOAT
+        if isinstance(node, StringNode):
+            return TYPE_STRING
+        if isinstance(node, ListNode):
+            return TYPE_LIST
+        if isinstance(node, FuncDefNode):
+            return TYPE_FUNCTION
+        if isinstance(node, VarAccessNode):
+            return self.var_types.get(node.var_name_tok.value)
+        if isinstance(node, VarAssignNode):
+            return self.type_of(node.value_node)
+        if isinstance(node, BinOpNode):
+            return self.binary_type(node.op_tok, self.type_of(node.left_node),
+                                    self.type_of(node.right_node))
+        if isinstance(node, UnaryOpNode):
+            operand_type = self.type_of(node.node)
+            if node.op_tok.matches(TOKENTYPE_KEYWORD, 'NOT'):
+                return TYPE_INT
+            if operand_type in NUMBER_TYPES or operand_type == None:
+                return operand_type
+            return TYPE_STRING if operand_type == TYPE_STRING else TYPE_ANY
+        if isinstance(node, IfNode):
+            return self.if_type(node)
+        if isinstance(node, (ForNode, WhileNode)):
+            return TYPE_INT if node.should_return_null else TYPE_LIST
+        return TYPE_ANY
+
+    def if_type(self, node):
+        branches = list(node.cases)
+        if node.else_case:
+            branches.append((None,) + tuple(node.else_case))
+
+        # Without an ELSE the IF can also give null
+        result = None if node.else_case else TYPE_INT
+        for _, expr, should_return_null in branches:
+            result = join_types(
+                result, TYPE_INT if should_return_null else self.type_of(expr))
+        return result
+
+    def binary_type(self, op_tok, left, right):
+        if left == None or right == None:
+            return None
+
+        if left in NUMBER_TYPES and right in NUMBER_TYPES:
+            if op_tok.type in (TOKENTYPE_SUM, TOKENTYPE_MINUS, TOKENTYPE_MUL):
+                return arith_type(left, right)
+            if op_tok.type == TOKENTYPE_DIV:
+                return TYPE_FLOAT if arith_type(left, right) != TYPE_NUMBER else TYPE_NUMBER
+            if op_tok.type == TOKENTYPE_POW:
+                # Negative and fractional powers change int to float or complex
+                return TYPE_NUMBER
+            return TYPE_INT
+
+        if left == TYPE_STRING:
+            if op_tok.type == TOKENTYPE_SUM and right == TYPE_STRING:
+                return TYPE_STRING
+            if op_tok.type == TOKENTYPE_MUL and right in NUMBER_TYPES:
+                return TYPE_STRING
+
+        if left == TYPE_LIST:
+            if op_tok.type == TOKENTYPE_SUM:
+                return TYPE_LIST
+            if op_tok.type == TOKENTYPE_MINUS and right in NUMBER_TYPES:
+                return TYPE_LIST
+            if op_tok.type == TOKENTYPE_MUL and right == TYPE_LIST:
+                return TYPE_LIST
+
+        return TYPE_ANY
+
+    def annotate(self, node):
+        for child in child_nodes(node):
+            self.annotate(child)
+        node.inferred_type = self.type_of(node) or TYPE_ANY
+
+
+#######################################
+# PURITY
+#######################################
+
+IMPURE_BUILTINS = ('PRINT', 'INPUT', 'INPUT_INT', 'CLEAR', 'CLS',
+                   'APPEND', 'POP', 'EXTEND', 'RUN', 'IMPORT')
+
+
+class PurityCheck:
+    # A function is pure when its result only depends on its arguments and
+    # on names it does not assign, which MemoCache checks on every call.
+    # Those free names are the dependencies; the ones it calls must hold
+    # pure functions themselves.
+    def __init__(self, node):
+        self.pure = True
+        self.dependencies = set()
+        self.callees = set()
+        self.scan(node.body_node, set(
+            arg_name.value for arg_name in node.arg_name_toks), False)
+
+    def scan(self, node, assigned, in_loop):
+        # assigned holds the names certainly set by now, anything else is
+        # looked up in the caller
+        if isinstance(node, (NumberNode, StringNode)):
+            pass
+        elif isinstance(node, ListNode):
+            for element_node in node.element_nodes:
+                self.scan(element_node, assigned, in_loop)
+        elif isinstance(node, VarAccessNode):
+            if node.var_name_tok.value not in assigned:
+                self.dependencies.add(node.var_name_tok.value)
+        elif isinstance(node, VarAssignNode):
+            self.scan(node.value_node, assigned, in_loop)
+            assigned.add(node.var_name_tok.value)
+        elif isinstance(node, BinOpNode):
+            self.scan(node.left_node, assigned, in_loop)
+            self.scan(node.right_node, assigned, in_loop)
+        elif isinstance(node, UnaryOpNode):
+            self.scan(node.node, assigned, in_loop)
+        elif isinstance(node, IfNode):
+            reached = assigned
+            for condition, expr, _ in node.cases:
+                self.scan(condition, reached, in_loop)
+                reached = set(reached)
+                self.scan(expr, set(reached), in_loop)
+            if node.else_case:
+                self.scan(node.else_case[0], set(reached), in_loop)
+        elif isinstance(node, ForNode):
+            self.scan(node.start_value_node, assigned, in_loop)
+            self.scan(node.end_value_node, assigned, in_loop)
+            if node.step_value_node:
+                self.scan(node.step_value_node, assigned, in_loop)
+            self.scan(node.body_node, assigned |
+                      {node.var_name_tok.value}, True)
+        elif isinstance(node, WhileNode):
+            self.scan(node.condition_node, assigned, in_loop)
+            self.scan(node.body_node, set(assigned), True)
+        elif isinstance(node, ReturnNode):
+            if node.node_to_return:
+                self.scan(node.node_to_return, assigned, in_loop)
+        elif isinstance(node, (BreakNode, ContinueNode)):
+            # Outside a loop these jump out of the caller's loop
+            if not in_loop:
+                self.pure = False
+        elif isinstance(node, CallNode):
+            self.scan_call(node, assigned, in_loop)
+        else:
+            self.pure = False
+
+    def scan_call(self, node, assigned, in_loop):
+        if not isinstance(node.node_to_call, VarAccessNode):
+            self.pure = False
+            return
+
+        func_name = node.node_to_call.var_name_tok.value
+        if func_name in assigned or func_name in IMPURE_BUILTINS:
+            self.pure = False
+            return
+
+        self.dependencies.add(func_name)
+        self.callees.add(func_name)
+        for arg_node in node.arg_nodes:
+            self.scan(arg_node, assigned, in_loop)
+
+
+class PurityAnalysis:
+    def analyze(self, node):
+        self.checks = {}
+        self.definitions = {}
+        self.collect(node)
+
+        # A function that calls one of this program's impure functions by
+        # name is impure too
+        changed = True
+        while changed:
+            changed = False
+            for check in self.checks.values():
+                if check.pure and any(not self.is_pure_name(func_name)
+                                      for func_name in check.callees):
+                    check.pure = False
+                    changed = True
+
+        # Scoping is dynamic, so the free names of a callee are looked up
+        # from the caller's frame and its result depends on them too
+        changed = True
+        while changed:
+            changed = False
+            for check in self.checks.values():
+                for func_name in check.callees:
+                    for func_node in self.definitions.get(func_name, []):
+                        missing = self.checks[func_node].dependencies - check.dependencies
+                        if missing:
+                            check.dependencies |= missing
+                            changed = True
+
+        for func_node, check in self.checks.items():
+            if check.pure:
+                func_node.memo = MemoCache(sorted(check.dependencies))
+        return node
+
+    def collect(self, node):
+        if isinstance(node, FuncDefNode):
+            self.checks[node] = PurityCheck(node)
+            if node.var_name_tok:
+                self.definitions.setdefault(
+                    node.var_name_tok.value, []).append(node)
+        for child in child_nodes(node):
+            self.collect(child)
+
+    def is_pure_name(self, func_name):
+        return all(self.checks[func_node].pure
+                   for func_node in self.definitions.get(func_name, []))
+
+
+#######################################
+# TRACER
+#######################################
+
+# Iterations a loop runs on the tree walker before one of them is traced
+TRACE_THRESHOLD = 50
+# Side exits a trace may take before its loop goes back to the tree walker
+MAX_TRACE_BAILS = 8
+
+TRACED_BINARY_OPS = [
+    '({0} + {1})',
+    '({0} - {1})',
+    '({0} * {1})',
+    '({0} / {1})',
+    '({0} ** {1})',
+    '(1 if {0} == {1} else 0)',
+    '(1 if {0} != {1} else 0)',
+    '(1 if {0} < {1} else 0)',
+    '(1 if {0} > {1} else 0)',
+    '(1 if {0} <= {1} else 0)',
+    '(1 if {0} >= {1} else 0)',
+    'int({0} and {1})',
+    'int({0} or {1})',
+]
+
+
+class TraceAbort(Exception):
+    pass
+
+
+class LoopTrace:
+    def __init__(self):
+        self.iterations = 0
+        self.function = None
+        self.bails = 0
+        self.failed = False
+
+    def should_record(self):
+        self.iterations += 1
+        return not self.failed and self.iterations >= TRACE_THRESHOLD
+
+    def record(self, node, context, i=None, step=None):
+        try:
+            self.function = TraceRecorder(context).record(node, i, step)
+        except Exception:
+            # Recording only touches its own copies of the variables, so
+            # anything going wrong on the way, down to Python refusing to
+            # compile the trace, just leaves the loop on the tree walker
+            self.failed = True
+
+    def bail(self):
+        self.bails += 1
+        if self.bails >= MAX_TRACE_BAILS:
+            self.function = None
+            self.failed = True
+
+
+def enable_tracing(node):
+    if isinstance(node, (ForNode, WhileNode)) and node.should_return_null:
+        node.trace = LoopTrace()
+    for child in child_nodes(node):
+        enable_tracing(child)
+
+
+class TraceRecorder:
+    # Records one iteration of a statement loop by evaluating it on plain
+    # Python numbers, and turns the path it took into a Python function that
+    # runs the remaining iterations. IF conditions become guards and any
+    # Python exception is a side exit: the trace keeps every variable it
+    # assigns in a working copy and only commits it at the end of an
+    # iteration, so on a side exit the tree walker re-runs the iteration
+    # from where the last committed one left off.
+    def __init__(self, context):
+        self.context = context
+        self.env = {}
+        self.reads = []
+        self.assigned = []
+        self.lines = []
+
+    def record(self, node, i, step):
+        if isinstance(node, ForNode):
+            var_name = node.var_name_tok.value
+            self.assign(var_name, i)
+            self.emit(f'n_{var_name} = _i')
+            self.record_statement(node.body_node)
+            return self.build(node, self.for_loop(var_name, step))
+
+        code, value = self.record_expr(node.condition_node)
+        if not Number(value).is_true():
+            # Nothing to record in an iteration that leaves the loop
+            return None
+        condition_lines = self.lines
+        self.lines = []
+        self.record_statement(node.body_node)
+        return self.build(node, self.while_loop(condition_lines, code))
+
+    def emit(self, line):
+        self.lines.append(line)
+
+    def lookup(self, var_name):
+        if var_name in self.env:
+            return self.env[var_name]
+
+        value = self.context.symbol_table.get(var_name)
+        if type(value) is not Number:
+            raise TraceAbort()
+        self.env[var_name] = value.value
+        self.reads.append(var_name)
+        return value.value
+
+    def assign(self, var_name, value):
+        self.env[var_name] = value
+        if var_name not in self.assigned:
+            self.assigned.append(var_name)
+
+    ###################################
+
+    def record_statement(self, node):
+        if isinstance(node, ListNode):
+            for element_node in node.element_nodes:
+                self.record_statement(element_node)
+        elif isinstance(node, IfNode):
+            self.record_if(node)
+        elif not isinstance(node, (NumberNode, VarAccessNode)):
+            code, _ = self.record_expr(node)
+            self.emit(code)
+        else:
+            self.record_expr(node)
+
+    def record_if(self, node):
+        for condition, expr, _ in node.cases:
+            code, value = self.record_expr(condition)
+            if Number(value).is_true():
+                self.emit(f'if not {code}: break')
+                self.record_statement(expr)
+                return
+            self.emit(f'if {code}: break')
+
+        if node.else_case:
+            self.record_statement(node.else_case[0])
+
+    def record_expr(self, node):
+        if isinstance(node, NumberNode):
+            return repr(node.tok.value), node.tok.value
+
+        if isinstance(node, VarAccessNode):
+            var_name = node.var_name_tok.value
+            return f'n_{var_name}', self.lookup(var_name)
+
+        if isinstance(node, VarAssignNode):
+            var_name = node.var_name_tok.value
+            code, value = self.record_expr(node.value_node)
+            self.assign(var_name, value)
+            return f'(n_{var_name} := {code})', value
+
+        if isinstance(node, BinOpNode):
+            left_code, left = self.record_expr(node.left_node)
+            right_code, right = self.record_expr(node.right_node)
+
+            op_tok = node.op_tok
+            op = BINARY_OPS.get(op_tok.type)
+            if op == None:
+                op = BINARY_OPS[(op_tok.type, op_tok.value)]
+
+            try:
+                resultado, error = getattr(
+                    Number(left), BINARY_OP_NAMES[op])(Number(right))
+            except Exception:
+                raise TraceAbort()
+            if error:
+                raise TraceAbort()
+            return TRACED_BINARY_OPS[op].format(left_code, right_code), resultado.value
+
+        if isinstance(node, UnaryOpNode):
+            code, value = self.record_expr(node.node)
+            if node.op_tok.type == TOKENTYPE_MINUS:
+                return f'({code} * -1)', value * -1
+            elif node.op_tok.matches(TOKENTYPE_KEYWORD, 'NOT'):
+                return f'(1 if {code} == 0 else 0)', 1 if value == 0 else 0
+            return code, value
+
+        # Calls, strings, lists, nested loops and jumps stay on the tree walker
+        raise TraceAbort()
+
+    ###################################
+
+    def for_loop(self, var_name, step):
+        comparison = '<' if step >= 0 else '>'
+        return (
+            [f'while _i {comparison} _end:']
+            + self.iteration_lines(self.lines)
+            + ['    _i += _step', 'else:', '    _done = True']
+        )
+
+    def while_loop(self, condition_lines, condition_code):
+        lines = condition_lines + [f'if not {condition_code}:']
+        lines += ['    ' + line for line in self.commit_lines()]
+        lines += ['    _done = True', '    break'] + self.lines
+        return ['while True:'] + self.iteration_lines(lines)
+
+    def iteration_lines(self, lines):
+        # Working copies start from the committed values of the variables
+        # the iteration reads before assigning
+        start = [f'n_{var_name} = v_{var_name}'
+                 for var_name in self.assigned if var_name in self.reads]
+        return ['    ' + line for line in start + lines + self.commit_lines()]
+
+    def commit_lines(self):
+        return [f'v_{var_name} = n_{var_name}' for var_name in self.assigned]
+
+    def build(self, node, loop_lines):
+        lines = ['def _trace(_context, _i=None, _end=None, _step=None):',
+                 '    _table = _context.symbol_table']
+
+        for var_name in self.reads:
+            lines += [
+                f'    _value = _table.get({var_name!r})',
+                '    if type(_value) is not _Number:',
+                '        return False, _i',
+                f'    n_{var_name} = _value.value',
+            ]
+        for var_name in self.assigned:
+            if var_name in self.reads:
+                lines.append(f'    v_{var_name} = n_{var_name}')
+            else:
+                lines.append(f'    v_{var_name} = None')
+
+        lines += ['    _done = False', '    try:']
+        lines += ['        ' + line for line in loop_lines]
+        lines += ['    except Exception:', '        pass']
+
+        for var_name in self.assigned:
+            lines += [
+                f'    if v_{var_name} is not None:',
+                f'        _table.set({var_name!r}, _Number(v_{var_name}).set_context(_context))',
+            ]
+        lines.append('    return _done, _i')
+
+        source = '\n'.join(lines) + '\n'
+        trace_source = find_source(node.pos_inicio)
+        filename = f'<trace {trace_source.fileName}:{trace_source.line(node.pos_inicio) + 1}>'
+        namespace = {'_Number': Number}
+        exec(compile(source, filename, 'exec'), namespace)
+        return namespace['_trace']
+
+
+#######################################
+# BYTECODE
+#######################################
+
+OP_LOAD_NUMBER = 0
+OP_LOAD_STRING = 1
+OP_LOAD_NULL = 2
+OP_LOAD_NAME = 3
+OP_STORE_NAME = 4
+OP_POP = 5
+OP_BUILD_LIST = 6
+OP_BINARY = 7
+OP_UNARY = 8
+OP_JUMP = 9
+OP_POP_JUMP_IF_FALSE = 10
+OP_SETUP_FOR = 11
+OP_FOR_ITER = 12
+OP_SETUP_WHILE = 13
+OP_LOOP_APPEND = 14
+OP_END_LOOP = 15
+OP_BREAK = 16
+OP_CONTINUE = 17
+OP_MAKE_FUNCTION = 18
+OP_CALL = 19
+OP_RETURN = 20
+OP_HALT = 21
+OP_LOAD_FAST = 22
+OP_STORE_FAST = 23
+OP_LOAD_GLOBAL = 24
+OP_FOR_ITER_FAST = 25
+
+OP_NAMES = [
+    'LOAD_NUMBER',
+    'LOAD_STRING',
+    'LOAD_NULL',
+    'LOAD_NAME',
+    'STORE_NAME',
+    'POP',
+    'BUILD_LIST',
+    'BINARY',
+    'UNARY',
+    'JUMP',
+    'POP_JUMP_IF_FALSE',
+    'SETUP_FOR',
+    'FOR_ITER',
+    'SETUP_WHILE',
+    'LOOP_APPEND',
+    'END_LOOP',
+    'BREAK',
+    'CONTINUE',
+    'MAKE_FUNCTION',
+    'CALL',
+    'RETURN',
+    'HALT',
+    'LOAD_FAST',
+    'STORE_FAST',
+    'LOAD_GLOBAL',
+    'FOR_ITER_FAST',
+]
+
+BINARY_OP_NAMES = [
+    'added_to',
+    'subbed_by',
+    'multed_by',
+    'dived_by',
+    'powed_by',
+    'get_comparison_eq',
+    'get_comparison_ne',
+    'get_comparison_lt',
+    'get_comparison_gt',
+    'get_comparison_lte',
+    'get_comparison_gte',
+    'anded_by',
+    'ored_by',
+]
+
+BINARY_OPS = {
+    TOKENTYPE_SUM: 0,
+    TOKENTYPE_MINUS: 1,
+    TOKENTYPE_MUL: 2,
+    TOKENTYPE_DIV: 3,
+    TOKENTYPE_POW: 4,
+    TOKENTYPE_EE: 5,
+    TOKENTYPE_NE: 6,
+    TOKENTYPE_LT: 7,
+    TOKENTYPE_GT: 8,
+    TOKENTYPE_LTE: 9,
+    TOKENTYPE_GTE: 10,
+    (TOKENTYPE_KEYWORD, 'AND'): 11,
+    (TOKENTYPE_KEYWORD, 'OR'): 12,
+}
+
+UNARY_PLUS = 0
+UNARY_MINUS = 1
+UNARY_NOT = 2
+
+
+class CodeObject:
+    def __init__(self, name):
+        self.name = name
+        self.ops = []
+        self.args = []
+        self.nodes = []
+        self.consts = []
+        self.names = []
+        self.local_names = []
+        self.arg_slots = []
+        self.needs_table = False
+
+    def disassemble(self):
+        lines = []
+        for pc in range(len(self.ops)):
+            op = self.ops[pc]
+            arg = self.args[pc]
+            if op in (OP_LOAD_NAME, OP_STORE_NAME, OP_FOR_ITER, OP_LOAD_GLOBAL):
+                detail = f' ({self.names[arg]})'
+            elif op in (OP_LOAD_FAST, OP_STORE_FAST, OP_FOR_ITER_FAST):
+                detail = f' ({self.local_names[arg]})'
+            elif op in (OP_LOAD_NUMBER, OP_LOAD_STRING, OP_MAKE_FUNCTION):
+                detail = f' ({self.consts[arg]!r})'
+            elif op == OP_BINARY:
+                detail = f' ({BINARY_OP_NAMES[arg]})'
+            else:
+                detail = ''
+            lines.append(f'{pc:>5} {OP_NAMES[op]:<18} {arg}{detail}')
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return f'<code {self.name}>'
+
+
+class FunctionCode:
+    def __init__(self, name, arg_names, code, should_auto_return, source):
+        self.name = name
+        self.arg_names = arg_names
+        self.code = code
+        self.should_auto_return = should_auto_return
+        self.source = source
+
+    def __repr__(self):
+        return f'<function code {self.name or "<anonymous>"}>'
+
+
+#######################################
+# COMPILER
+#######################################
+
+class Compiler:
+    def __init__(self, resolver=None):
+        self.resolver = resolver
+        self.scope = None
+
+    def compile(self, node, name='<program>'):
+        self.code = CodeObject(name)
+        self.const_idxs = {}
+        self.name_idxs = {}
+        if not self.resolver:
+            self.resolver = Resolver().resolve(node)
+
+        self.visit(node)
+        self.emit(OP_HALT, 0, node)
+        return self.code
+
+    def compile_function(self, node):
+        func_name = node.var_name_tok.value if node.var_name_tok else None
+        self.code = CodeObject(func_name or '<anonymous>')
+        self.const_idxs = {}
+        self.name_idxs = {}
+        self.scope = self.resolver.scopes[node]
+        self.code.local_names = self.scope.local_names
+        self.code.arg_slots = [self.scope.slots.get(name)
+                               for name in self.scope.params]
+        self.code.needs_table = self.scope.needs_table
+
+        if node.should_auto_return:
+            self.visit(node.body_node)
+        else:
+            self.visit_discard(node.body_node)
+            self.emit(OP_LOAD_NULL, 0, node)
+        self.emit(OP_HALT, 0, node)
+
+        arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+        return FunctionCode(func_name, arg_names, self.code, node.should_auto_return,
+                            find_source(node.pos_inicio))
+
+    ###################################
+
+    def emit(self, op, arg, node):
+        self.code.ops.append(op)
+        self.code.args.append(arg)
+        self.code.nodes.append(node)
+        return len(self.code.ops) - 1
+
+    def patch(self, idx, target):
+        self.code.args[idx] = target
+
+    def here(self):
+        return len(self.code.ops)
+
+    def add_const(self, value):
+        key = (type(value), value)
+        if key not in self.const_idxs:
+            self.const_idxs[key] = len(self.code.consts)
+            self.code.consts.append(value)
+        return self.const_idxs[key]
+
+    def add_name(self, name):
+        if name not in self.name_idxs:
+            self.name_idxs[name] = len(self.code.names)
+            self.code.names.append(name)
+        return self.name_idxs[name]
+
+    ###################################
+
+    def visit(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_visit_method)
+        method(node)
+
+    def visit_discard(self, node):
+        # Compiles a node whose value is never used, so statement blocks
+        # do not have to build a List only to throw it away
+        if isinstance(node, ListNode):
+            for element_node in node.element_nodes:
+                self.visit_discard(element_node)
+        elif isinstance(node, IfNode):
+            self.compile_if(node, True)
+        else:
+            self.visit(node)
+            self.emit(OP_POP, 0, node)
+
+    def no_visit_method(self, node):
+        raise Exception(f'No compile_{type(node).__name__} method defined')
+
+    ###################################
+
+    def compile_NumberNode(self, node):
+        self.emit(OP_LOAD_NUMBER, self.add_const(node.tok.value), node)
+
+    def compile_StringNode(self, node):
+        self.emit(OP_LOAD_STRING, self.add_const(node.tok.value), node)
+
+    def compile_ListNode(self, node):
+        for element_node in node.element_nodes:
+            self.visit(element_node)
+        self.emit(OP_BUILD_LIST, len(node.element_nodes), node)
+
+    def compile_VarAccessNode(self, node):
+        var_name = node.var_name_tok.value
+
+        if not self.scope:
+            self.emit(OP_LOAD_NAME, self.add_name(var_name), node)
+        elif var_name in self.scope.slots:
+            self.emit(OP_LOAD_FAST, self.scope.slots[var_name], node)
+        elif var_name in self.resolver.exposed:
+            self.emit(OP_LOAD_NAME, self.add_name(var_name), node)
+        else:
+            # Not a local of any function in the program, so only the
+            # global table can have it
+            self.emit(OP_LOAD_GLOBAL, self.add_name(var_name), node)
+
+    def compile_VarAssignNode(self, node):
+        self.visit(node.value_node)
+        self.compile_store(node.var_name_tok.value, node)
+
+    def compile_store(self, var_name, node):
+        if self.scope and var_name in self.scope.slots:
+            self.emit(OP_STORE_FAST, self.scope.slots[var_name], node)
+        else:
+            self.emit(OP_STORE_NAME, self.add_name(var_name), node)
+
+    def compile_BinOpNode(self, node):
+        self.visit(node.left_node)
+        self.visit(node.right_node)
+
+        op_tok = node.op_tok
+        op = BINARY_OPS.get(op_tok.type)
+        if op == None:
+            op = BINARY_OPS[(op_tok.type, op_tok.value)]
+        self.emit(OP_BINARY, op, node)
+
+    def compile_UnaryOpNode(self, node):
+        self.visit(node.node)
+
+        if node.op_tok.type == TOKENTYPE_MINUS:
+            op = UNARY_MINUS
+        elif node.op_tok.matches(TOKENTYPE_KEYWORD, 'NOT'):
+            op = UNARY_NOT
+        else:
+            op = UNARY_PLUS
+        self.emit(OP_UNARY, op, node)
+
+    def compile_IfNode(self, node):
+        self.compile_if(node, False)
+
+    def compile_if(self, node, discard):
+        end_jumps = []
+
+        for condition, expr, should_return_null in node.cases:
+            self.visit(condition)
+            jump_false = self.emit(OP_POP_JUMP_IF_FALSE, 0, condition)
+            self.compile_case(expr, should_return_null, discard)
+            end_jumps.append(self.emit(OP_JUMP, 0, node))
+            self.patch(jump_false, self.here())
+
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            self.compile_case(expr, should_return_null, discard)
+        elif not discard:
+            self.emit(OP_LOAD_NULL, 0, node)
+
+        for jump in end_jumps:
+            self.patch(jump, self.here())
+
+    def compile_case(self, expr, should_return_null, discard):
+        if discard:
+            self.visit_discard(expr)
+        elif should_return_null:
+            self.visit_discard(expr)
+            self.emit(OP_LOAD_NULL, 0, expr)
+        else:
+            self.visit(expr)
+
+    def compile_ForNode(self, node):
+        self.visit(node.start_value_node)
+        self.visit(node.end_value_node)
+        if node.step_value_node:
+            self.visit(node.step_value_node)
+        else:
+            self.emit(OP_LOAD_NUMBER, self.add_const(1), node)
+
+        setup = self.emit(OP_SETUP_FOR, 0, node)
+        var_name = node.var_name_tok.value
+        if self.scope and var_name in self.scope.slots:
+            head = self.emit(OP_FOR_ITER_FAST, self.scope.slots[var_name], node)
+        else:
+            head = self.emit(OP_FOR_ITER, self.add_name(var_name), node)
+        self.compile_loop_body(node)
+        self.emit(OP_JUMP, head, node)
+
+        self.patch(setup, self.here())
+        self.emit(OP_END_LOOP, int(node.should_return_null), node)
+
+    def compile_WhileNode(self, node):
+        setup = self.emit(OP_SETUP_WHILE, 0, node)
+        head = self.here()
+        self.visit(node.condition_node)
+        jump_false = self.emit(OP_POP_JUMP_IF_FALSE, 0, node.condition_node)
+        self.compile_loop_body(node)
+        self.emit(OP_JUMP, head, node)
+
+        self.patch(setup, self.here())
+        self.patch(jump_false, self.here())
+        self.emit(OP_END_LOOP, int(node.should_return_null), node)
+
+    def compile_loop_body(self, node):
+        if node.should_return_null:
+            self.visit_discard(node.body_node)
+        else:
+            self.visit(node.body_node)
+            self.emit(OP_LOOP_APPEND, 0, node.body_node)
+
+    def compile_FuncDefNode(self, node):
+        func_code = Compiler(self.resolver).compile_function(node)
+        self.emit(OP_MAKE_FUNCTION, self.add_const(func_code), node)
+
+        if node.var_name_tok:
+            self.compile_store(node.var_name_tok.value, node)
+
+    def compile_CallNode(self, node):
+        self.visit(node.node_to_call)
+        for arg_node in node.arg_nodes:
+            self.visit(arg_node)
+        self.emit(OP_CALL, len(node.arg_nodes), node)
+
+    def compile_ReturnNode(self, node):
+        if node.node_to_return:
+            self.visit(node.node_to_return)
+        else:
+            self.emit(OP_LOAD_NULL, 0, node)
+        self.emit(OP_RETURN, 0, node)
+
+    def compile_ContinueNode(self, node):
+        self.emit(OP_CONTINUE, 0, node)
+
+    def compile_BreakNode(self, node):
+        self.emit(OP_BREAK, 0, node)
+
+
+#######################################
+# VM
+#######################################
+
+class LoopBlock:
+    def __init__(self, head, exit, level):
+        self.head = head
+        self.exit = exit
+        self.level = level
+        self.elements = []
+        self.i = None
+        self.end = None
+        self.step = None
+        self.ascending = True
+
+
+class CompiledFunction(Function):
+    tail_calls = False
+
+    def __init__(self, func_code, globals):
+        super().__init__(func_code.name, None, func_code.arg_names,
+                         func_code.should_auto_return)
+        self.func_code = func_code
+        self.globals = globals
+        self.source = func_code.source
+
+    def generate_new_context(self):
+        code = self.func_code.code
+        new_context = Context(self.name, self.context, self.pos_inicio)
+
+        # Only functions with locals read by other functions need their own
+        # table, the rest live in slots
+        if code.needs_table:
+            new_context.symbol_table = SymbolTable(
+                new_context.parent.symbol_table)
+        else:
+            new_context.symbol_table = new_context.parent.symbol_table
+        new_context.slots = [None] * len(code.local_names)
+        return new_context
+
+    def populate_args(self, arg_names, args, exec_ctx):
+        slots = exec_ctx.slots
+        arg_slots = self.func_code.code.arg_slots
+        for i in range(len(args)):
+            arg_value = args[i].set_context(exec_ctx)
+            if arg_slots[i] is None:
+                exec_ctx.symbol_table.set(arg_names[i], arg_value)
+            else:
+                slots[arg_slots[i]] = arg_value
+
+    def run_body(self, exec_ctx):
+        return VM().run(self.func_code.code, exec_ctx, self.globals)
+
+    def copy(self):
+        copy = CompiledFunction(self.func_code, self.globals)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_inicio, self.pos_final)
+        return copy
+
+
+class VM:
+    def run(self, code, context, globals=None):
+        res = RTResult()
+        ops = code.ops
+        args = code.args
+        nodes = code.nodes
+        consts = code.consts
+        names = code.names
+        symbol_table = context.symbol_table
+        slots = context.slots
+        if globals is None:
+            globals = symbol_table
+
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        blocks = []
+        pc = 0
+
+        while True:
+            op = ops[pc]
+            arg = args[pc]
+            pc += 1
+
+            if op == OP_LOAD_FAST:
+                node = nodes[pc - 1]
+                value = slots[arg]
+
+                if value is None:
+                    # Not assigned yet in this call, so the dynamic scope
+                    # decides like it would for the interpreter
+                    var_name = code.local_names[arg]
+                    value = symbol_table.get(var_name)
+                    if not value:
+                        return res.failure(RTErro(
+                            node.pos_inicio, node.pos_final,
+                            f"'{var_name}' is not defined",
+                            context
+                        ))
+
+                push(value.copy().set_pos(
+                    node.pos_inicio, node.pos_final).set_context(context))
+
+            elif op == OP_STORE_FAST:
+                slots[arg] = stack[-1]
+
+            elif op == OP_LOAD_NAME:
+                node = nodes[pc - 1]
+                value = symbol_table.get(names[arg])
+
+                if not value:
+                    return res.failure(RTErro(
+                        node.pos_inicio, node.pos_final,
+                        f"'{names[arg]}' is not defined",
+                        context
+                    ))
+
+                push(value.copy().set_pos(
+                    node.pos_inicio, node.pos_final).set_context(context))
+
+            elif op == OP_LOAD_GLOBAL:
+                node = nodes[pc - 1]
+                value = globals.get(names[arg])
+                if not value:
+                    value = symbol_table.get(names[arg])
+
+                if not value:
+                    return res.failure(RTErro(
+                        node.pos_inicio, node.pos_final,
+                        f"'{names[arg]}' is not defined",
+                        context
+                    ))
+
+                push(value.copy().set_pos(
+                    node.pos_inicio, node.pos_final).set_context(context))
+
+            elif op == OP_LOAD_NUMBER:
+                node = nodes[pc - 1]
+                if type(node) is NumberNode:
+                    push(constant_number(node, context))
+                else:
+                    push(Number(consts[arg]).set_context(context).set_pos(
+                        node.pos_inicio, node.pos_final))
+
+            elif op == OP_BINARY:
+                node = nodes[pc - 1]
+                right = pop()
+                left = pop()
+                resultado, error = getattr(
+                    left, BINARY_OP_NAMES[arg])(right)
+                if error:
+                    return res.failure(error)
+                push(resultado.set_pos(node.pos_inicio, node.pos_final))
+
+            elif op == OP_STORE_NAME:
+                symbol_table.set(names[arg], stack[-1])
+
+            elif op == OP_POP:
+                pop()
+
+            elif op == OP_JUMP:
+                pc = arg
+
+            elif op == OP_POP_JUMP_IF_FALSE:
+                if not pop().is_true():
+                    pc = arg
+
+            elif op == OP_FOR_ITER_FAST:
+                block = blocks[-1]
+                i = block.i
+                if (i < block.end) if block.ascending else (i > block.end):
+                    slots[arg] = make_number(i)
+                    block.i = i + block.step
+                else:
+                    pc = block.exit
+
+            elif op == OP_FOR_ITER:
+                block = blocks[-1]
+                i = block.i
+                if (i < block.end) if block.ascending else (i > block.end):
+                    symbol_table.set(names[arg], make_number(i))
+                    block.i = i + block.step
+                else:
+                    pc = block.exit
+
+            elif op == OP_CALL:
+                node = nodes[pc - 1]
+                if arg:
+                    call_args = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    call_args = []
+                value_to_call = pop().copy().set_pos(node.pos_inicio, node.pos_final)
+
+                call_res = value_to_call.execute(call_args)
+                if call_res.error:
+                    return call_res
+
+                if call_res.loop_should_break or call_res.loop_should_continue:
+                    pc = self.unwind(stack, blocks, call_res.loop_should_break)
+                    if pc == None:
+                        return call_res
+                    continue
+
+                push(call_res.value.copy().set_pos(
+                    node.pos_inicio, node.pos_final).set_context(context))
+
+            elif op == OP_LOOP_APPEND:
+                blocks[-1].elements.append(pop())
+
+            elif op == OP_LOAD_STRING:
+                node = nodes[pc - 1]
+                push(String(consts[arg]).set_context(context).set_pos(
+                    node.pos_inicio, node.pos_final))
+
+            elif op == OP_LOAD_NULL:
+                push(Number.null)
+
+            elif op == OP_UNARY:
+                node = nodes[pc - 1]
+                value = number = pop()
+                error = None
+
+                if arg == UNARY_MINUS:
+                    number, error = number.multed_by(Number(-1))
+                    if error:
+                        # The -1 stands where the operator is
+                        error = value.multed_by(Number(-1).set_pos(
+                            node.pos_inicio, node.pos_final))[1]
+                elif arg == UNARY_NOT:
+                    number, error = number.notted()
+
+                if error:
+                    return res.failure(error)
+                push(number.set_pos(node.pos_inicio, node.pos_final))
+
+            elif op == OP_BUILD_LIST:
+                node = nodes[pc - 1]
+                if arg:
+                    elements = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    elements = []
+                push(List(elements).set_context(context).set_pos(
+                    node.pos_inicio, node.pos_final))
+
+            elif op == OP_SETUP_FOR:
+                step_value = pop()
+                end_value = pop()
+                start_value = pop()
+
+                block = LoopBlock(pc, arg, len(stack))
+                block.i = start_value.value
+                block.end = end_value.value
+                block.step = step_value.value
+                block.ascending = step_value.value >= 0
+                blocks.append(block)
+
+            elif op == OP_SETUP_WHILE:
+                blocks.append(LoopBlock(pc, arg, len(stack)))
+
+            elif op == OP_END_LOOP:
+                node = nodes[pc - 1]
+                block = blocks.pop()
+                push(
+                    Number.null if arg else
+                    List(block.elements).set_context(context).set_pos(
+                        node.pos_inicio, node.pos_final)
+                )
+
+            elif op == OP_BREAK or op == OP_CONTINUE:
+                pc = self.unwind(stack, blocks, op == OP_BREAK)
+                if pc == None:
+                    return res.success_break() if op == OP_BREAK else res.success_continue()
+
+            elif op == OP_MAKE_FUNCTION:
+                node = nodes[pc - 1]
+                push(CompiledFunction(consts[arg], globals).set_context(context).set_pos(
+                    node.pos_inicio, node.pos_final))
+
+            elif op == OP_RETURN:
+                return res.success_return(pop())
+
+            elif op == OP_HALT:
+                return res.success(pop())
+
+            else:
+                raise Exception(f'Unknown opcode {op}')
+
+    def unwind(self, stack, blocks, is_break):
+        # BREAK/CONTINUE outside of a loop leave the frame, just like the
+        # Interpreter lets them escape from the current function
+        if not blocks:
+            return None
+
+        block = blocks[-1]
+        del stack[block.level:]
+        return block.exit if is_break else block.head
+
+
+#######################################
+# CLOSURE COMPILER
+#######################################
+
+class UnboxFailure(Exception):
+    pass
+
+
+def raw_div(left, right):
+    if right == 0:
+        # The boxed path reports the error with the right positions
+        raise UnboxFailure()
+    return left / right
+
+
+RAW_BINARY_OPS = [
+    lambda left, right: left + right,
+    lambda left, right: left - right,
+    lambda left, right: left * right,
+    raw_div,
+    lambda left, right: left ** right,
+    lambda left, right: 1 if left == right else 0,
+    lambda left, right: 1 if left != right else 0,
+    lambda left, right: 1 if left < right else 0,
+    lambda left, right: 1 if left > right else 0,
+    lambda left, right: 1 if left <= right else 0,
+    lambda left, right: 1 if left >= right else 0,
+    lambda left, right: int(left and right),
+    lambda left, right: int(left or right),
+]
+
+
+class ClosureFunction(Function):
+    def __init__(self, name, body_node, arg_names, should_auto_return, body_closure):
+        super().__init__(name, body_node, arg_names, should_auto_return)
+        self.body_closure = body_closure
+
+    def run_body(self, exec_ctx):
+        return run_closure(self.body_closure, exec_ctx)
+
+    def copy(self):
+        copy = ClosureFunction(self.name, self.body_node, self.arg_names,
+                               self.should_auto_return, self.body_closure)
+        copy.memo = self.memo
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_inicio, self.pos_final)
+        return copy
+
+
+class ClosureCompiler:
+    def compile(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_visit_method)
+        closure = method(node)
+
+        if isinstance(node, (BinOpNode, UnaryOpNode)) and self.is_unboxable(node):
+            return self.compile_unboxed(node, closure)
+        return closure
+
+    def compile_discard(self, node):
+        # Statement blocks whose value is thrown away skip building the List
+        if isinstance(node, ListNode):
+            element_closures = [self.compile_discard(element_node)
+                                for element_node in node.element_nodes]
+
+            def statements(context):
+                for element_closure in element_closures:
+                    element_closure(context)
+            return statements
+
+        return self.compile(node)
+
+    def no_visit_method(self, node):
+        raise Exception(f'No compile_{type(node).__name__} method defined')
+
+    ###################################
+
+    def is_unboxable(self, node):
+        # Arithmetic over names and literals that type inference proved
+        # numeric can run on raw Python numbers
+        if getattr(node, 'inferred_type', None) not in NUMBER_TYPES:
+            return False
+        if isinstance(node, (NumberNode, VarAccessNode)):
+            return True
+        if isinstance(node, BinOpNode):
+            return self.is_unboxable(node.left_node) and self.is_unboxable(node.right_node)
+        if isinstance(node, UnaryOpNode):
+            return self.is_unboxable(node.node)
+        return False
+
+    def compile_unboxed(self, node, boxed_closure):
+        raw_closure = self.compile_raw(node)
+        pos_inicio, pos_final = node.pos_inicio, node.pos_final
+
+        def unboxed(context):
+            try:
+                value = raw_closure(context)
+            except UnboxFailure:
+                # A value from outside the program broke the inferred types.
+                # The expression only reads names, so running it again boxed
+                # is safe
+                return boxed_closure(context)
+            return Number(value).set_context(context).set_pos(pos_inicio, pos_final)
+        return unboxed
+
+    def compile_raw(self, node):
+        if isinstance(node, NumberNode):
+            value = node.tok.value
+
+            def raw_number(context):
+                return value
+            return raw_number
+
+        if isinstance(node, VarAccessNode):
+            var_name = node.var_name_tok.value
+
+            def raw_var_access(context):
+                cache = cached_lookup(node, context)
+                value = cache.value if cache else context.symbol_table.get(var_name)
+                if type(value) is not Number:
+                    raise UnboxFailure()
+                return value.value
+            return raw_var_access
+
+        if isinstance(node, BinOpNode):
+            left_closure = self.compile_raw(node.left_node)
+            right_closure = self.compile_raw(node.right_node)
+            op_tok = node.op_tok
+            op = BINARY_OPS.get(op_tok.type)
+            if op == None:
+                op = BINARY_OPS[(op_tok.type, op_tok.value)]
+            operation = RAW_BINARY_OPS[op]
+
+            def raw_bin_op(context):
+                return operation(left_closure(context), right_closure(context))
+            return raw_bin_op
+
+        operand_closure = self.compile_raw(node.node)
+        if node.op_tok.type == TOKENTYPE_MINUS:
+            def raw_unary_op(context): return operand_closure(context) * -1
+        elif node.op_tok.matches(TOKENTYPE_KEYWORD, 'NOT'):
+            def raw_unary_op(context): return 1 if operand_closure(context) == 0 else 0
+        else:
+            raw_unary_op = operand_closure
+        return raw_unary_op
+
+    ###################################
+
+    def compile_NumberNode(self, node):
+        def number(context):
+            return constant_number(node, context)
+        return number
+
+    def compile_StringNode(self, node):
+        value = node.tok.value
+        pos_inicio, pos_final = node.pos_inicio, node.pos_final
+
+        def string(context):
+            return String(value).set_context(context).set_pos(pos_inicio, pos_final)
+        return string
+
+    def compile_ListNode(self, node):
+        element_closures = [self.compile(element_node)
+                            for element_node in node.element_nodes]
+        pos_inicio, pos_final = node.pos_inicio, node.pos_final
+
+        def list_(context):
+            elements = [element_closure(context)
+                        for element_closure in element_closures]
+            return List(elements).set_context(context).set_pos(pos_inicio, pos_final)
+        return list_
+
+    def compile_VarAccessNode(self, node):
+        var_name = node.var_name_tok.value
+        pos_inicio, pos_final = node.pos_inicio, node.pos_final
+
+        def var_access(context):
+            cache = cached_lookup(node, context)
+            value = cache.value if cache else context.symbol_table.get(var_name)
+
+            if not value:
+                raise ErroSignal(RTErro(
+                    pos_inicio, pos_final,
+                    f"'{var_name}' is not defined",
+                    context
+                ))
+
+            return value
+        return var_access
+
+    def compile_VarAssignNode(self, node):
+        var_name = node.var_name_tok.value
+        value_closure = self.compile(node.value_node)
+
+        def var_assign(context):
+            value = value_closure(context)
+            context.symbol_table.set(var_name, value)
+            return value
+        return var_assign
+
+    def compile_BinOpNode(self, node):
+        left_closure = self.compile(node.left_node)
+        right_closure = self.compile(node.right_node)
+        pos_inicio, pos_final = node.pos_inicio, node.pos_final
+
+        op_tok = node.op_tok
+        op = BINARY_OPS.get(op_tok.type)
+        if op == None:
+            op = BINARY_OPS[(op_tok.type, op_tok.value)]
+        method_name = BINARY_OP_NAMES[op]
+        number_operation = getattr(Number, method_name)
+
+        def bin_op(context):
+            left = left_closure(context)
+            right = right_closure(context)
+
+            if type(left) is Number:
+                resultado, error = number_operation(left, right)
+            else:
+                resultado, error = getattr(left, method_name)(right)
+
+            if error:
+                raise ErroSignal(binary_op_error(
+                    node, method_name, left, right, context))
+            return resultado.set_pos(pos_inicio, pos_final)
+
+        def passed_bin_op(context):
+            left = left_closure(context)
+            left_source = value_source(node.left_node)
+            right = right_closure(context)
+
+            resultado, error = getattr(left, method_name)(right)
+            if error:
+                raise ErroSignal(binary_op_error(
+                    node, method_name, left, right, context, left_source))
+            return resultado.set_pos(pos_inicio, pos_final)
+
+        if type(node.left_node) in VALUE_PASSING_NODES:
+            return passed_bin_op
+        return bin_op
+
+    def compile_UnaryOpNode(self, node):
+        operand_closure = self.compile(node.node)
+        pos_inicio, pos_final = node.pos_inicio, node.pos_final
+
+        if node.op_tok.type == TOKENTYPE_MINUS:
+            def operation(number): return number.multed_by(Number(-1))
+        elif node.op_tok.matches(TOKENTYPE_KEYWORD, 'NOT'):
+            def operation(number): return number.notted()
+        else:
+            def operation(number): return number, None
+
+        def unary_op(context):
+            number = operand_closure(context)
+            resultado, error = operation(number)
+            if error:
+                raise ErroSignal(unary_op_error(node, number, context))
+            return resultado.set_pos(pos_inicio, pos_final)
+        return unary_op
+
+    def compile_IfNode(self, node):
+        cases = [
+            (self.compile(condition),
+             self.compile_discard(expr) if should_return_null else self.compile(expr),
+             should_return_null,
+             None if should_return_null else expr)
+            for condition, expr, should_return_null in node.cases
+        ]
+
+        if node.else_case:
+            expr, else_return_null = node.else_case
+            else_closure = self.compile_discard(
+                expr) if else_return_null else self.compile(expr)
+            else_taken = None if else_return_null else expr
+        else:
+            else_closure = None
+
+        def if_(context):
+            for condition_closure, expr_closure, should_return_null, taken in cases:
+                if condition_closure(context).is_true():
+                    expr_value = expr_closure(context)
+                    node.taken = taken
+                    return Number.null if should_return_null else expr_value
+
+            if else_closure:
+                expr_value = else_closure(context)
+                node.taken = else_taken
+                return Number.null if else_return_null else expr_value
+
+            node.taken = None
+            return Number.null
+        return if_
+
+    def compile_ForNode(self, node):
+        var_name = node.var_name_tok.value
+        start_closure = self.compile(node.start_value_node)
+        end_closure = self.compile(node.end_value_node)
+        step_closure = self.compile(
+            node.step_value_node) if node.step_value_node else None
+        should_return_null = node.should_return_null
+        body_closure = self.compile_discard(
+            node.body_node) if should_return_null else self.compile(node.body_node)
+        pos_inicio, pos_final = node.pos_inicio, node.pos_final
+
+        def for_(context):
+            elements = []
+            set_var = context.symbol_table.set
+
+            start_value = start_closure(context)
+            end_value = end_closure(context).value
+            step_value = step_closure(context).value if step_closure else 1
+
+            i = start_value.value
+            ascending = step_value >= 0
+
+            while (i < end_value) if ascending else (i > end_value):
+                set_var(var_name, make_number(i))
+                i += step_value
+
+                try:
+                    value = body_closure(context)
+                except ContinueSignal:
+                    continue
+                except BreakSignal:
+                    break
+
+                elements.append(value)
+
+            return (
+                Number.null if should_return_null else
+                List(elements).set_context(context).set_pos(pos_inicio, pos_final)
+            )
+        return for_
+
+    def compile_WhileNode(self, node):
+        condition_closure = self.compile(node.condition_node)
+        should_return_null = node.should_return_null
+        body_closure = self.compile_discard(
+            node.body_node) if should_return_null else self.compile(node.body_node)
+        pos_inicio, pos_final = node.pos_inicio, node.pos_final
+
+        def while_(context):
+            elements = []
+
+            while condition_closure(context).is_true():
+                try:
+                    value = body_closure(context)
+                except ContinueSignal:
+                    continue
+                except BreakSignal:
+                    break
+
+                elements.append(value)
+
+            return (
+                Number.null if should_return_null else
+                List(elements).set_context(context).set_pos(pos_inicio, pos_final)
+            )
+        return while_
+
+    def compile_FuncDefNode(self, node):
+        func_name = node.var_name_tok.value if node.var_name_tok else None
+        body_node = node.body_node
+        arg_names = [arg_name.value for arg_name in node.arg_name_toks]
+        should_auto_return = node.should_auto_return
+        body_closure = self.compile(
+            body_node) if should_auto_return else self.compile_discard(body_node)
+        pos_inicio, pos_final = node.pos_inicio, node.pos_final
+
+        def func_def(context):
+            func_value = ClosureFunction(
+                func_name, body_node, arg_names, should_auto_return, body_closure
+            ).set_context(context).set_pos(pos_inicio, pos_final)
+            func_value.memo = node.memo
+
+            if func_name:
+                context.symbol_table.set(func_name, func_value)
+
+            return func_value
+        return func_def
+
+    def compile_CallNode(self, node):
+        callee_closure = self.compile(node.node_to_call)
+        arg_closures = [self.compile(arg_node) for arg_node in node.arg_nodes]
+        pos_inicio, pos_final = node.pos_inicio, node.pos_final
+        tail_call = node.tail_call
+
+        def call(context):
+            value_to_call = callee_closure(context)
+            args = [arg_closure(context) for arg_closure in arg_closures]
+
+            value_to_call = value_to_call.set_pos(
+                pos_inicio, pos_final).set_context(context)
+            if tail_call and isinstance(value_to_call, Function) and value_to_call.tail_calls:
+                return TailCall(value_to_call, args)
+            return raise_call_result(value_to_call.execute(args))
+        return call
+
+    def compile_ReturnNode(self, node):
+        value_closure = self.compile(
+            node.node_to_return) if node.node_to_return else None
+
+        def return_(context):
+            raise ReturnSignal(value_closure(context) if value_closure else Number.null)
+        return return_
+
+    def compile_ContinueNode(self, node):
+        def continue_(context):
+            raise ContinueSignal()
+        return continue_
+
+    def compile_BreakNode(self, node):
+        def break_(context):
+            raise BreakSignal()
+        return break_
+
+
+#######################################
+# TRANSPILER
+#######################################
+
+COMPARISON_OPS = (TOKENTYPE_EE, TOKENTYPE_NE, TOKENTYPE_LT,
+                  TOKENTYPE_GT, TOKENTYPE_LTE, TOKENTYPE_GTE)
+
+TRANSPILED_BINARY_OPS = [
+    '_add',
+    '_sub',
+    '_mul',
+    '_div',
+    '_pow',
+    '_eq',
+    '_ne',
+    '_lt',
+    '_gt',
+    '_lte',
+    '_gte',
+    '_and',
+    '_or',
+]
+
+
+class TranspiledFunctionInfo:
+    def __init__(self, name, arg_names, py_name, should_auto_return, node):
+        self.name = name
+        self.arg_names = arg_names
+        self.py_name = py_name
+        self.should_auto_return = should_auto_return
+        self.node = node
+        self.py_function = None
+
+
+class TranspiledProgram:
+    def __init__(self, filename, source, line_nodes, sites, functions, exposed):
+        self.filename = filename
+        self.source = source
+        self.line_nodes = line_nodes
+        self.sites = sites
+        self.functions = functions
+        self.exposed = exposed
+        self.code = compile(source, filename, 'exec')
+
+    def node_at_line(self, lineno):
+        if 0 < lineno <= len(self.line_nodes):
+            return self.line_nodes[lineno - 1]
+        return None
+
+
+class Transpiler:
+    def transpile(self, node):
+        self.sites = []
+        self.functions = []
+        self.function_lines = []
+        self.temp_count = 0
+        self.needs_statements_cache = {}
+        self.tracked_ifs = set()
+
+        self.resolver = Resolver().resolve(node)
+        self.exposed = self.resolver.exposed
+
+        self.lines = []
+        self.depth = 1
+        self.scope = None
+        self.loop_depth = 0
+
+        value = self.expr(node)
+        self.emit(f'return {value}', node)
+        program_lines = [(0, 'def _program(_frame):', node)] + self.lines
+
+        all_lines = self.function_lines + program_lines
+        source = '\n'.join('    ' * depth + text for depth,
+                           text, _ in all_lines) + '\n'
+        line_nodes = [line_node for _, _, line_node in all_lines]
+        filename = f'<miniLang {find_source(node.pos_inicio).fileName}>'
+        return TranspiledProgram(filename, source, line_nodes, self.sites, self.functions, self.exposed)
+
+    ###################################
+
+    def emit(self, text, node):
+        self.lines.append((self.depth, text, node))
+
+    def site(self, node):
+        self.sites.append(node)
+        return len(self.sites) - 1
+
+    def new_temp(self):
+        self.temp_count += 1
+        return f'_t{self.temp_count}'
+
+    def is_stable(self, value):
+        # Temps and literals cannot be changed by statements hoisted later
+        return (value.startswith('_t') and value[2:].isdigit()) or value[0] in '0123456789\'"'
+
+    def needs_statements(self, node):
+        key = id(node)
+        if key not in self.needs_statements_cache:
+            if isinstance(node, (ForNode, WhileNode, ReturnNode, BreakNode, ContinueNode)):
+                result = True
+            elif isinstance(node, FuncDefNode):
+                result = False
+            elif isinstance(node, IfNode) and (
+                    any(case[2] for case in node.cases) or (node.else_case and node.else_case[1])):
+                result = True
+            else:
+                result = any(self.needs_statements(child)
+                             for child in child_nodes(node))
+            self.needs_statements_cache[key] = result
+        return self.needs_statements_cache[key]
+
+    def exprs(self, nodes, left_site=None):
+        # With left_site the first value is paired with where it was made,
+        # for _passed
+        values = []
+
+        for node in nodes:
+            mark = len(self.lines)
+            value = self.expr(node)
+            if left_site != None and not values:
+                value = f'_sourced({value}, {left_site})'
+
+            if len(self.lines) > mark:
+                # Keep left-to-right evaluation order when this operand had to
+                # be lowered into statements
+                hoisted = []
+                for idx, prev in enumerate(values):
+                    if not self.is_stable(prev):
+                        temp = self.new_temp()
+                        hoisted.append((self.depth, f'{temp} = {prev}', node))
+                        values[idx] = temp
+                self.lines[mark:mark] = hoisted
+
+            values.append(value)
+
+        return values
+
+    def block(self, compile_body, node):
+        self.depth += 1
+        mark = len(self.lines)
+        compile_body()
+        if len(self.lines) == mark:
+            self.emit('pass', node)
+        self.depth -= 1
+
+    ###################################
+
+    def expr(self, node):
+        method_name = f'expr_{type(node).__name__}'
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node)
+
+    def stmt(self, node):
+        if isinstance(node, ListNode):
+            for element_node in node.element_nodes:
+                self.stmt(element_node)
+        elif isinstance(node, IfNode):
+            self.if_statement(node, None)
+        elif isinstance(node, ForNode):
+            self.for_statement(node, None)
+        elif isinstance(node, WhileNode):
+            self.while_statement(node, None)
+        elif isinstance(node, VarAssignNode) and self.scope:
+            value = self.expr(node.value_node)
+            self.emit(f'{self.local_target(node.var_name_tok.value)} = {value}', node)
+        else:
+            value = self.expr(node)
+            if not self.is_stable(value) and value != 'None':
+                self.emit(value, node)
+
+    def condition(self, node):
+        value = self.expr(node)
+        if isinstance(node, BinOpNode) and (
+                node.op_tok.type in COMPARISON_OPS or node.op_tok.type == TOKENTYPE_KEYWORD):
+            return value
+        if isinstance(node, UnaryOpNode) and node.op_tok.matches(TOKENTYPE_KEYWORD, 'NOT'):
+            return value
+        return f'_truthy({value})'
+
+    def no_visit_method(self, node):
+        raise Exception(f'No expr_{type(node).__name__} method defined')
+
+    ###################################
+
+    def local_target(self, name):
+        if name in self.exposed:
+            return f'_l[{name!r}]'
+        return f'v_{name}'
+
+    def read_name(self, name, site):
+        scope = self.scope
+        if scope and name in scope.params and name not in self.exposed:
+            return f'v_{name}'
+        if scope and (name in scope.params or name in scope.assigned):
+            if name in self.exposed:
+                return f'_getl(_l, {name!r}, {site})'
+            return f'(v_{name} if v_{name} is not _UNSET else _lookup({name!r}, {site}))'
+        return f'_lookup({name!r}, {site})'
+
+    def assign_name(self, name, value, node):
+        if not self.scope:
+            return f'_store({name!r}, {value})'
+        if name in self.exposed:
+            return f'_setl(_l, {name!r}, {value})'
+        return f'(v_{name} := {value})'
+
+    ###################################
+
+    def expr_NumberNode(self, node):
+        return repr(node.tok.value)
+
+    def expr_StringNode(self, node):
+        return repr(node.tok.value)
+
+    def expr_ListNode(self, node):
+        values = self.exprs(node.element_nodes)
+        return f'_new_list([{", ".join(values)}])'
+
+    def expr_VarAccessNode(self, node):
+        return self.read_name(node.var_name_tok.value, self.site(node))
+
+    def expr_VarAssignNode(self, node):
+        value = self.expr(node.value_node)
+        return self.assign_name(node.var_name_tok.value, value, node)
+
+    def expr_BinOpNode(self, node):
+        self.track_source(node.left_node)
+        self.track_source(node.right_node)
+        op_tok = node.op_tok
+        op = BINARY_OPS.get(op_tok.type)
+        if op == None:
+            op = BINARY_OPS[(op_tok.type, op_tok.value)]
+        site = self.site(node)
+
+        if type(node.left_node) in VALUE_PASSING_NODES:
+            # The right side may run the same IF again, so find where the
+            # left value was made first
+            left, right = self.exprs([node.left_node, node.right_node], site)
+            return f'_passed({op}, {left}, {right}, {site})'
+
+        left, right = self.exprs([node.left_node, node.right_node])
+        return f'{TRANSPILED_BINARY_OPS[op]}({left}, {right}, {site})'
+
+    def expr_UnaryOpNode(self, node):
+        self.track_source(node.node)
+        value = self.expr(node.node)
+        if node.op_tok.type == TOKENTYPE_MINUS:
+            return f'_neg({value}, {self.site(node)})'
+        if node.op_tok.matches(TOKENTYPE_KEYWORD, 'NOT'):
+            return f'_not({value}, {self.site(node)})'
+        return value
+
+    def track_source(self, node):
+        # IFs whose value an operand can get note the branch they take, so
+        # errors can point at it
+        while isinstance(node, VarAssignNode):
+            node = node.value_node
+        if not isinstance(node, IfNode):
+            return
+
+        self.tracked_ifs.add(node)
+        for _, expr, should_return_null in node.cases:
+            if not should_return_null:
+                self.track_source(expr)
+        if node.else_case and not node.else_case[1]:
+            self.track_source(node.else_case[0])
+
+    def took(self, value, if_site, branch):
+        # value, noting that the IF at if_site took branch (None for NULL)
+        if if_site == None:
+            return value
+        branch_site = self.site(branch) if branch else -1
+        return f'_took({value}, {if_site}, {branch_site})'
+
+    def expr_IfNode(self, node):
+        if not self.needs_statements(node):
+            if_site = self.site(node) if node in self.tracked_ifs else None
+            values = []
+            for condition, expr, _ in node.cases:
+                values.append((self.condition(condition),
+                               self.took(self.expr(expr), if_site, expr)))
+            if node.else_case:
+                resultado = self.took(self.expr(
+                    node.else_case[0]), if_site, node.else_case[0])
+            else:
+                resultado = self.took('0', if_site, None)
+            for condition, value in reversed(values):
+                resultado = f'({value} if {condition} else {resultado})'
+            return resultado
+
+        temp = self.new_temp()
+        self.if_statement(node, temp)
+        return temp
+
+    def if_statement(self, node, target):
+        nested = 0
+        if_site = self.site(node) if target and node in self.tracked_ifs else None
+
+        for idx, (condition, expr, should_return_null) in enumerate(node.cases):
+            if idx == 0:
+                self.emit(f'if {self.condition(condition)}:', condition)
+            elif not self.needs_statements(condition):
+                self.emit(f'elif {self.condition(condition)}:', condition)
+            else:
+                self.emit('else:', condition)
+                self.depth += 1
+                nested += 1
+                self.emit(f'if {self.condition(condition)}:', condition)
+
+            self.block(lambda: self.case_body(
+                expr, should_return_null, target, if_site), expr)
+
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            self.emit('else:', expr)
+            self.block(lambda: self.case_body(
+                expr, should_return_null, target, if_site), expr)
+        elif target:
+            self.emit('else:', node)
+            self.block(lambda: self.emit(
+                f'{target} = {self.took("0", if_site, None)}', node), node)
+
+        self.depth -= nested
+
+    def case_body(self, expr, should_return_null, target, if_site=None):
+        if target and not should_return_null:
+            value = self.expr(expr)
+            self.emit(f'{target} = {self.took(value, if_site, expr)}', expr)
+        else:
+            self.stmt(expr)
+            if target:
+                self.emit(f'{target} = {self.took("0", if_site, None)}', expr)
+
+    def expr_ForNode(self, node):
+        temp = self.new_temp()
+        self.for_statement(node, None if node.should_return_null else temp)
+        return '0' if node.should_return_null else f'_List({temp})'
+
+    def for_statement(self, node, target):
+        step_node = node.step_value_node
+        value_nodes = [node.start_value_node, node.end_value_node]
+        if step_node:
+            value_nodes.append(step_node)
+        values = self.exprs(value_nodes)
+
+        i, end = self.new_temp(), self.new_temp()
+        self.emit(f'{i} = {values[0]}', node.start_value_node)
+        self.emit(f'{end} = {values[1]}', node.end_value_node)
+
+        if not step_node:
+            step = '1'
+            loop_condition = f'{i} < {end}'
+        elif isinstance(step_node, NumberNode):
+            step = values[2]
+            loop_condition = f'{i} {"<" if step_node.tok.value >= 0 else ">"} {end}'
+        else:
+            step, ascending = self.new_temp(), self.new_temp()
+            self.emit(f'{step} = {values[2]}', step_node)
+            self.emit(f'{ascending} = {step} >= 0', step_node)
+            loop_condition = f'({i} < {end} if {ascending} else {i} > {end})'
+
+        if target:
+            self.emit(f'{target} = []', node)
+        self.emit(f'while {loop_condition}:', node)
+
+        def body():
+            var_name = node.var_name_tok.value
+            if self.scope:
+                self.emit(f'{self.local_target(var_name)} = {i}', node)
+            else:
+                self.emit(f'_store({var_name!r}, {i})', node)
+            self.emit(f'{i} += {step}', node)
+            self.loop_body(node, target)
+
+        self.block(body, node)
+
+    def expr_WhileNode(self, node):
+        temp = self.new_temp()
+        self.while_statement(node, None if node.should_return_null else temp)
+        return '0' if node.should_return_null else f'_List({temp})'
+
+    def while_statement(self, node, target):
+        if target:
+            self.emit(f'{target} = []', node)
+
+        # A BREAK/CONTINUE inside the condition belongs to the enclosing
+        # loop, so it is compiled as if it were outside of this one
+        loop_depth = self.loop_depth
+        self.loop_depth = 0
+
+        if not self.needs_statements(node.condition_node):
+            self.emit(
+                f'while {self.condition(node.condition_node)}:', node.condition_node)
+            self.loop_depth = loop_depth
+            self.block(lambda: self.loop_body(node, target), node)
+            return
+
+        self.emit('while True:', node)
+        self.depth += 1
+        self.emit(
+            f'if not {self.condition(node.condition_node)}:', node.condition_node)
+        self.block(lambda: self.emit('break', node), node)
+        self.loop_depth = loop_depth
+        self.loop_body(node, target)
+        self.depth -= 1
+
+    def loop_body(self, node, target):
+        # BREAK/CONTINUE may also arrive from a called function, as signals
+        self.emit('try:', node.body_node)
+        self.loop_depth += 1
+
+        def body():
+            if target:
+                value = self.expr(node.body_node)
+                self.emit(f'{target}.append(_box({value}))', node.body_node)
+            else:
+                self.stmt(node.body_node)
+
+        self.block(body, node.body_node)
+        self.loop_depth -= 1
+        self.emit('except _Continue:', node.body_node)
+        self.block(lambda: self.emit('continue', node.body_node), node.body_node)
+        self.emit('except _Break:', node.body_node)
+        self.block(lambda: self.emit('break', node.body_node), node.body_node)
+
+    def expr_FuncDefNode(self, node):
+        idx = self.function(node)
+        value = f'_make_function({idx}, {self.site(node)})'
+        if node.var_name_tok:
+            return self.assign_name(node.var_name_tok.value, value, node)
+        return value
+
+    def function(self, node):
+        saved = (self.lines, self.depth, self.scope, self.loop_depth)
+        scope = self.resolver.scopes[node]
+        idx = len(self.functions)
+        py_name = f'_f{idx}'
+        func_name = node.var_name_tok.value if node.var_name_tok else None
+        self.functions.append(TranspiledFunctionInfo(
+            func_name, scope.params, py_name, node.should_auto_return, node))
+
+        self.lines = []
+        self.depth = 1
+        self.scope = scope
+        self.loop_depth = 0
+
+        if len(set(scope.params)) == len(scope.params):
+            py_params = [f'v_{name}' for name in scope.params]
+        else:
+            py_params = [f'_p{k}' for k in range(len(scope.params))]
+            for k, name in enumerate(scope.params):
+                self.emit(f'v_{name} = _p{k}', node)
+
+        if (scope.assigned | set(scope.params)) & self.exposed:
+            self.emit('_l = _frame.locals = {}', node)
+            for name in scope.params:
+                if name in self.exposed:
+                    self.emit(f'_l[{name!r}] = v_{name}', node)
+
+        unset = sorted(name for name in scope.assigned if name not in self.exposed)
+        if unset:
+            self.emit(' = '.join(f'v_{name}' for name in unset) + ' = _UNSET', node)
+
+        if node.should_auto_return:
+            value = self.expr(node.body_node)
+            self.emit(f'return {value}', node.body_node)
+        else:
+            self.stmt(node.body_node)
+            self.emit('return 0', node.body_node)
+
+        header = f'def {py_name}({", ".join(["_frame"] + py_params)}):'
+        self.function_lines.append((0, header, node))
+        self.function_lines.extend(self.lines)
+
+        self.lines, self.depth, self.scope, self.loop_depth = saved
+        return idx
+
+    def expr_CallNode(self, node):
+        values = self.exprs([node.node_to_call] + node.arg_nodes)
+        return f'_call({self.site(node)}, {", ".join(values)})'
+
+    def expr_ReturnNode(self, node):
+        value = self.expr(node.node_to_return) if node.node_to_return else '0'
+        if self.scope:
+            self.emit(f'return {value}', node)
+        else:
+            self.emit(f'raise _Return({value})', node)
+        return 'None'
+
+    def expr_ContinueNode(self, node):
+        self.emit('continue' if self.loop_depth else 'raise _Continue()', node)
+        return 'None'
+
+    def expr_BreakNode(self, node):
+        self.emit('break' if self.loop_depth else 'raise _Break()', node)
+        return 'None'
+
+
+#######################################
+# TRANSPILER RUNTIME
+#######################################
+
+NUMERIC_TYPES = {int, float, complex}
+UNSET = object()
+
+
+def box(value):
+    value_type = type(value)
+    if value_type in NUMERIC_TYPES:
+        return Number(value)
+    if value_type is str:
+        return String(value)
+    return value
+
+
+def unbox(value):
+    value_type = type(value)
+    if value_type is Number or value_type is String:
+        return value.value
+    return value
+
+
+class TranspiledFrame:
+    def __init__(self, name, call_pos):
+        self.name = name
+        self.call_pos = call_pos
+        self.locals = None
+        self.context = None
+        self.base_table = None
+
+
+class FrameSymbolTable(SymbolTable):
+    def __init__(self, runtime, frame_idx):
+        super().__init__()
+        self.runtime = runtime
+        self.frame_idx = frame_idx
+
+    def get(self, name):
+        value = self.symbols.get(name, None)
+        if value == None:
+            return self.runtime.find(name, self.frame_idx)
+        return value
+
+
+class TranspiledFunction(Function):
+    def __init__(self, info, runtime):
+        super().__init__(info.name, info.node.body_node,
+                         info.arg_names, info.should_auto_return)
+        self.info = info
+        self.runtime = runtime
+
+    def run_body(self, exec_ctx):
+        args = [unbox(exec_ctx.symbol_table.get(arg_name))
+                for arg_name in self.arg_names]
+        res = self.runtime.run_entry(
+            exec_ctx, lambda frame: self.info.py_function(frame, *args))
+
+        if not self.should_auto_return and not res.should_return():
+            # The Python function already resolved RETURN for us
+            return RTResult().success_return(res.value)
+        return res
+
+    def copy(self):
+        copy = TranspiledFunction(self.info, self.runtime)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_inicio, self.pos_final)
+        return copy
+
+
+class TranspilerRuntime:
+    def __init__(self, program):
+        self.program = program
+        self.sites = program.sites
+        self.frames = []
+        self.entries = []
+        self.exposed = program.exposed
+
+        namespace = self.namespace()
+        exec(program.code, namespace)
+        for info in program.functions:
+            info.py_function = namespace[info.py_name]
+        self.program_function = namespace['_program']
+
+    def run(self, context):
+        return self.run_entry(context, self.program_function)
+
+    def run_entry(self, context, function):
+        res = RTResult()
+        frame = TranspiledFrame(context.display_name, context.parent_entry_pos)
+        frame.context = context
+        frame.base_table = context.symbol_table
+        self.frames.append(frame)
+        self.entries.append(frame)
+
+        try:
+            return res.success(box(function(frame)))
+        except ReturnSignal as signal:
+            return res.success_return(box(signal.value))
+        except BreakSignal:
+            return res.success_break()
+        except ContinueSignal:
+            return res.success_continue()
+        except ErroSignal as signal:
+            return res.failure(signal.error)
+        except Exception as e:
+            return res.failure(self.python_error(e, context))
+        finally:
+            self.entries.pop()
+            self.frames.pop()
+
+    def python_error(self, e, context):
+        # Map a Python level failure back to miniLang through the source map
+        node = None
+        tb = e.__traceback__
+        while tb:
+            if tb.tb_frame.f_code.co_filename == self.program.filename:
+                node = self.program.node_at_line(tb.tb_lineno) or node
+            tb = tb.tb_next
+
+        if node == None:
+            raise e
+
+        return RTErro(
+            node.pos_inicio, node.pos_final,
+            f'{type(e).__name__}: {e}',
+            getattr(e, 'minilang_context', None) or context
+        )
+
+    ###################################
+
+    def current_context(self):
+        frames = self.frames
+        idx = len(frames) - 1
+        frame = frames[idx]
+        if frame.context != None:
+            if frame.locals != None and frame.context.symbol_table is frame.base_table:
+                # A function entered from outside keeps its exposed locals in
+                # the frame, where only a FrameSymbolTable finds them
+                context = frame.context
+                frame.context = Context(context.display_name, context.parent,
+                                        context.parent_entry_pos)
+                frame.context.symbol_table = FrameSymbolTable(self, idx)
+            return frame.context
+
+        start = idx
+        while frames[start].context == None:
+            start -= 1
+        for k in range(start + 1, idx + 1):
+            frame = frames[k]
+            frame.context = Context(
+                frame.name, frames[k - 1].context, frame.call_pos)
+            frame.context.symbol_table = FrameSymbolTable(self, k)
+        return frames[idx].context
+
+    def find(self, name, frame_idx):
+        frames = self.frames
+        while frame_idx >= 0:
+            frame = frames[frame_idx]
+            if frame.locals != None and name in frame.locals:
+                return box(frame.locals[name])
+            if frame.base_table != None:
+                return frame.base_table.get(name)
+            frame_idx -= 1
+        return None
+
+    def error(self, pos_inicio, pos_final, detalhe):
+        raise ErroSignal(RTErro(
+            pos_inicio, pos_final, detalhe, self.current_context()))
+
+    ###################################
+
+    def namespace(self):
+        runtime = self
+        sites = self.sites
+        frames = self.frames
+        entries = self.entries
+        exposed = self.exposed
+        error = self.error
+
+        def lookup(name, site):
+            if name in exposed:
+                value = runtime.find(name, len(frames) - 1)
+            else:
+                value = entries[-1].base_table.get(name)
+
+            if not value:
+                node = sites[site]
+                error(node.pos_inicio, node.pos_final,
+                      f"'{name}' is not defined")
+            return unbox(value)
+
+        def store(name, value):
+            entries[-1].base_table.set(name, box(value))
+            return value
+
+        def getl(locals_, name, site):
+            if name in locals_:
+                return locals_[name]
+            return lookup(name, site)
+
+        def setl(locals_, name, value):
+            locals_[name] = value
+            return value
+
+        def make_function(idx, site):
+            node = sites[site]
+            return TranspiledFunction(self.program.functions[idx], runtime).set_context(
+                runtime.current_context()).set_pos(node.pos_inicio, node.pos_final)
+
+        def call(site, value_to_call, *args):
+            if type(value_to_call) is TranspiledFunction and value_to_call.runtime is runtime:
+                info = value_to_call.info
+                if len(args) != len(info.arg_names):
+                    return call_foreign(site, value_to_call, args)
+
+                frame = TranspiledFrame(info.name, sites[site].pos_inicio)
+                frames.append(frame)
+                try:
+                    return info.py_function(frame, *args)
+                except ControlSignal:
+                    raise
+                except Exception as e:
+                    if getattr(e, 'minilang_context', None) == None:
+                        e.minilang_context = runtime.current_context()
+                    raise
+                finally:
+                    frames.pop()
+
+            return call_foreign(site, value_to_call, args)
+
+        def call_foreign(site, value_to_call, args):
+            node = sites[site]
+            context = runtime.current_context()
+            value_to_call = box(value_to_call).copy().set_context(
+                context).set_pos(node.pos_inicio, node.pos_final)
+            return unbox(raise_call_result(value_to_call.execute([box(arg) for arg in args])))
+
+        def new_list(values):
+            return List([box(value) for value in values])
+
+        def truthy(value):
+            value_type = type(value)
+            if value_type in NUMERIC_TYPES:
+                return value != 0
+            if value_type is str:
+                return len(value) > 0
+            return value.is_true()
+
+        def generic(method_name, left, right, site):
+            context = runtime.current_context()
+            left = box(left).set_context(context)
+            right = box(right).set_context(context)
+            resultado, erro = getattr(left, method_name)(right)
+            if erro:
+                raise ErroSignal(binary_op_error(
+                    sites[site], method_name, left, right, context))
+            return unbox(resultado)
+
+        def sourced(value, site):
+            # The left operand of site, an IF or VAR, gave value
+            return value, value_source(sites[site].left_node)
+
+        def passed(op, left, right, site):
+            value, left_source = left
+            try:
+                return operations[op](value, right, site)
+            except ErroSignal:
+                context = runtime.current_context()
+                raise ErroSignal(binary_op_error(
+                    sites[site], BINARY_OP_NAMES[op], box(value), box(right), context, left_source))
+
+        def took(value, if_site, branch_site):
+            sites[if_site].taken = sites[branch_site] if branch_site >= 0 else None
+            return value
+
+        def add(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return left + right
+            if type(left) is str and type(right) is str:
+                return left + right
+            return generic('added_to', left, right, site)
+
+        def sub(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return left - right
+            return generic('subbed_by', left, right, site)
+
+        def mul(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return left * right
+            return generic('multed_by', left, right, site)
+
+        def div(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                if right == 0:
+                    node = value_source(sites[site].right_node)
+                    error(node.pos_inicio, node.pos_final, 'Division by zero')
+                return left / right
+            return generic('dived_by', left, right, site)
+
+        def pow_(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return left ** right
+            return generic('powed_by', left, right, site)
+
+        def eq(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return 1 if left == right else 0
+            return generic('get_comparison_eq', left, right, site)
+
+        def ne(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return 1 if left != right else 0
+            return generic('get_comparison_ne', left, right, site)
+
+        def lt(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return 1 if left < right else 0
+            return generic('get_comparison_lt', left, right, site)
+
+        def gt(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return 1 if left > right else 0
+            return generic('get_comparison_gt', left, right, site)
+
+        def lte(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return 1 if left <= right else 0
+            return generic('get_comparison_lte', left, right, site)
+
+        def gte(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return 1 if left >= right else 0
+            return generic('get_comparison_gte', left, right, site)
+
+        def and_(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return int(left and right)
+            return generic('anded_by', left, right, site)
+
+        def or_(left, right, site):
+            if type(left) in NUMERIC_TYPES and type(right) in NUMERIC_TYPES:
+                return int(left or right)
+            return generic('ored_by', left, right, site)
+
+        def neg(value, site):
+            if type(value) in NUMERIC_TYPES:
+                return value * -1
+            node = sites[site]
+            source = value_source(node.node)
+            context = runtime.current_context()
+            number = box(value).copy().set_pos(source.pos_inicio,
+                                               source.pos_final).set_context(context)
+            resultado, erro = number.multed_by(
+                Number(-1).set_pos(node.pos_inicio, node.pos_final))
+            if erro:
+                raise ErroSignal(erro)
+            return unbox(resultado)
+
+        def not_(value, site):
+            if type(value) in NUMERIC_TYPES:
+                return 1 if value == 0 else 0
+            resultado, erro = box(value).notted()
+            if erro:
+                raise ErroSignal(erro)
+            return unbox(resultado)
+
+        operations = [add, sub, mul, div, pow_, eq, ne,
+                      lt, gt, lte, gte, and_, or_]
+
+        return {
+            '__builtins__': __builtins__,
+            '_lookup': lookup,
+            '_store': store,
+            '_getl': getl,
+            '_setl': setl,
+            '_make_function': make_function,
+            '_call': call,
+            '_new_list': new_list,
+            '_truthy': truthy,
+            '_box': box,
+            '_List': List,
+            '_UNSET': UNSET,
+            '_Break': BreakSignal,
+            '_Continue': ContinueSignal,
+            '_Return': ReturnSignal,
+            '_add': add,
+            '_sub': sub,
+            '_mul': mul,
+            '_div': div,
+            '_pow': pow_,
+            '_eq': eq,
+            '_ne': ne,
+            '_lt': lt,
+            '_gt': gt,
+            '_lte': lte,
+            '_gte': gte,
+            '_and': and_,
+            '_or': or_,
+            '_neg': neg,
+            '_not': not_,
+            '_sourced': sourced,
+            '_passed': passed,
+            '_took': took,
+        }
+
+
+#######################################
+# AST CACHE
+#######################################
+
+# Interpreter digest, script mtime and size, and script digest; the bytes
+# of a CachedAst follow
+AST_CACHE_HEADER = struct.Struct('<16sqq16s')
+INTERPRETER_DIGEST = None
+
+# Kinds of CachedAst entries. Tokens kept by nodes (names, operators) get
+# entries of their own; IF_CASE and ELSE_CASE hold the parts of an IfNode.
+CACHED_KINDS = [
+    NumberNode, StringNode, ListNode, VarAccessNode, VarAssignNode,
+    BinOpNode, UnaryOpNode, IfNode, ForNode, WhileNode, FuncDefNode,
+    CallNode, ReturnNode, ContinueNode, BreakNode, Token, 'IF_CASE', 'ELSE_CASE',
+]
+CACHED_KIND_CODES = {kind: code for code, kind in enumerate(CACHED_KINDS)}
+(CACHED_NUMBER, CACHED_STRING, CACHED_LIST, CACHED_VAR_ACCESS, CACHED_VAR_ASSIGN,
+ CACHED_BIN_OP, CACHED_UNARY_OP, CACHED_IF, CACHED_FOR, CACHED_WHILE, CACHED_FUNC_DEF,
+ CACHED_CALL, CACHED_RETURN, CACHED_CONTINUE, CACHED_BREAK, CACHED_TOKEN,
+ CACHED_IF_CASE, CACHED_ELSE_CASE) = range(len(CACHED_KINDS))
+
+# Nodes whose constructor works out the span from the children
+CACHED_DERIVED_SPANS = frozenset((
+    CACHED_VAR_ASSIGN, CACHED_BIN_OP, CACHED_UNARY_OP, CACHED_IF, CACHED_FOR,
+    CACHED_WHILE, CACHED_FUNC_DEF, CACHED_CALL,
+))
+
+# Flag bits, kept in ops by entries without a token type
+CACHED_BLOCK = 1
+CACHED_HAS_STEP = 2
+CACHED_HAS_NAME = 2
+
+# Entry count, child count and byte size of the value table, which comes as
+# JSON after the arrays in the bytes of a CachedAst
+CACHED_LAYOUT = struct.Struct('<III')
+CACHED_VALUE_TYPES = frozenset((type(None), int, float, str))
+
+
+class CachedAst:
+    # The layout of an AST in a cache file: parallel arrays of kind, token
+    # type code or flag bits, start and end offsets relative to base, an
+    # index into a table that holds each distinct constant or name once, and
+    # where the entry's children start in children. Entries come after their
+    # children, so the root is the last one. to_bytes() writes the arrays as
+    # they are and the value table as JSON, so reading a cache runs no code
+    # from the file, and node() builds the usual node classes back.
+    def __init__(self, base=0):
+        self.base = base
+        self.kinds = array('B')
+        self.ops = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.values = array('I')
+        self.child_starts = array('I', [0])
+        self.children = array('I')
+        self.value_table = [None]
+        self.value_index = {}
+
+    @classmethod
+    def from_node(cls, node, base=None):
+        cached = cls(find_source(node.pos_inicio).base if base is None else base)
+        cached.add(node)
+        cached.value_index = None
+        return cached
+
+    @classmethod
+    def from_bytes(cls, data, base=0):
+        # The CachedAst to_bytes() wrote; raises if data is not one
+        count, child_count, table_size = CACHED_LAYOUT.unpack_from(data)
+        cached = cls(base)
+        cached.value_index = None
+        arrays = [
+            (cached.kinds, count), (cached.ops, count), (cached.starts, count),
+            (cached.ends, count), (cached.values, count),
+            (cached.child_starts, count), (cached.children, child_count),
+        ]
+
+        view = memoryview(data)
+        offset = CACHED_LAYOUT.size
+        for items, size in arrays:
+            size *= items.itemsize
+            items.frombytes(view[offset:offset + size])
+            offset += size
+        if offset + table_size != len(data):
+            raise ValueError('truncated AST cache')
+
+        table = json.loads(view[offset:].tobytes().decode('ascii'))
+        if (type(table) is not list or not table or table[0] is not None
+                or not all(type(value) in CACHED_VALUE_TYPES for value in table)):
+            raise ValueError('bad AST cache value table')
+        cached.value_table = table
+        return cached
+
+    def to_bytes(self):
+        # TypeError if a value has no JSON form
+        table = json.dumps(self.value_table, ensure_ascii=True).encode('ascii')
+        return b''.join([
+            CACHED_LAYOUT.pack(len(self.kinds), len(self.children), len(table)),
+            self.kinds.tobytes(), self.ops.tobytes(), self.starts.tobytes(),
+            self.ends.tobytes(), self.values.tobytes(),
+            self.child_starts[1:].tobytes(), self.children.tobytes(), table,
+        ])
+
+    ###################################
+
+    def intern(self, value):
+        if value is None:
+            return 0
+        # 1, 1.0 and True are equal keys, the type keeps them apart
+        key = (type(value), value)
+        index = self.value_index.get(key)
+        if index is None:
+            index = self.value_index[key] = len(self.value_table)
+            self.value_table.append(value)
+        return index
+
+    def parts(self, item):
+        # kind, op, value, children and span of something to store
+        kind = type(item)
+
+        if kind is Token:
+            return CACHED_TOKEN, TOKEN_TYPE_CODES[item.type], item.value, (), item
+        if kind is tuple:
+            if len(item) == 3:
+                condition, body, is_block = item
+                return CACHED_IF_CASE, is_block and CACHED_BLOCK, None, (condition, body), body
+            body, is_block = item
+            return CACHED_ELSE_CASE, is_block and CACHED_BLOCK, None, (body,), body
+
+        code = CACHED_KIND_CODES[kind]
+        if kind is NumberNode or kind is StringNode:
+            return code, TOKEN_TYPE_CODES[item.tok.type], item.tok.value, (), item
+        if kind is VarAccessNode:
+            return code, TOKEN_TYPE_CODES[item.var_name_tok.type], item.var_name_tok.value, (), item
+        if kind is ListNode:
+            return code, item.partial and CACHED_BLOCK, None, item.element_nodes, item
+        if kind is VarAssignNode:
+            return code, 0, None, (item.var_name_tok, item.value_node), item
+        if kind is BinOpNode:
+            return code, 0, None, (item.left_node, item.op_tok, item.right_node), item
+        if kind is UnaryOpNode:
+            return code, 0, None, (item.op_tok, item.node), item
+        if kind is IfNode:
+            children = list(item.cases)
+            if item.else_case:
+                children.append(item.else_case)
+            return code, 0, None, children, item
+        if kind is ForNode:
+            children = [item.var_name_tok, item.start_value_node, item.end_value_node]
+            flags = item.should_return_null and CACHED_BLOCK
+            if item.step_value_node:
+                children.append(item.step_value_node)
+                flags |= CACHED_HAS_STEP
+            children.append(item.body_node)
+            return code, flags, None, children, item
+        if kind is WhileNode:
+            return code, item.should_return_null and CACHED_BLOCK, None, (item.condition_node, item.body_node), item
+        if kind is FuncDefNode:
+            children = list(item.arg_name_toks)
+            flags = item.should_auto_return and CACHED_BLOCK
+            if item.var_name_tok:
+                children.insert(0, item.var_name_tok)
+                flags |= CACHED_HAS_NAME
+            children.append(item.body_node)
+            return code, flags, None, children, item
+        if kind is CallNode:
+            return code, 0, None, [item.node_to_call] + list(item.arg_nodes), item
+        if kind is ReturnNode:
+            return code, 0, None, (item.node_to_return,) if item.node_to_return else (), item
+        return code, 0, None, (), item
+
+    def add(self, root):
+        # Post-order without recursion: an item is stored once the indices
+        # of its children are on done
+        stack = [(root, None)]
+        done = []
+
+        while stack:
+            item, parts = stack.pop()
+            if parts is None:
+                parts = self.parts(item)
+                stack.append((item, parts))
+                for child in reversed(parts[3]):
+                    stack.append((child, None))
+                continue
+
+            kind, op, value, children, span = parts
+            count = len(children)
+            if count:
+                self.children.extend(done[-count:])
+                del done[-count:]
+
+            done.append(len(self.kinds))
+            self.kinds.append(kind)
+            self.ops.append(op)
+            self.starts.append(span.pos_inicio - self.base)
+            self.ends.append(span.pos_final - self.base)
+            self.values.append(self.intern(value))
+            self.child_starts.append(len(self.children))
+
+    ###################################
+
+    def node(self):
+        # Node classes for the whole tree, built in one pass since every
+        # child comes before its parent
+        base = self.base
+        kinds = self.kinds
+        ops = self.ops
+        starts = self.starts
+        ends = self.ends
+        values = self.values
+        value_table = self.value_table
+        child_starts = self.child_starts
+        children = self.children
+        built = []
+
+        for i in range(len(kinds)):
+            kind = kinds[i]
+            op = ops[i]
+            kids = [built[child] for child in children[child_starts[i]:child_starts[i + 1]]]
+
+            if kind == CACHED_TOKEN:
+                obj = Token(TOKEN_TYPES[op], value_table[values[i]], base + starts[i], base + ends[i])
+            elif kind == CACHED_NUMBER:
+                obj = NumberNode(Token(TOKEN_TYPES[op], value_table[values[i]], base + starts[i], base + ends[i]))
+            elif kind == CACHED_VAR_ACCESS:
+                obj = VarAccessNode(Token(TOKEN_TYPES[op], value_table[values[i]], base + starts[i], base + ends[i]))
+            elif kind == CACHED_BIN_OP:
+                obj = BinOpNode(kids[0], kids[1], kids[2])
+            elif kind == CACHED_STRING:
+                obj = StringNode(Token(TOKEN_TYPES[op], value_table[values[i]], base + starts[i], base + ends[i]))
+            elif kind == CACHED_LIST:
+                obj = ListNode(kids, base + starts[i], base + ends[i])
+                obj.partial = bool(op & CACHED_BLOCK)
+            elif kind == CACHED_VAR_ASSIGN:
+                obj = VarAssignNode(kids[0], kids[1])
+            elif kind == CACHED_CALL:
+                obj = CallNode(kids[0], kids[1:])
+            elif kind == CACHED_UNARY_OP:
+                obj = UnaryOpNode(kids[0], kids[1])
+            elif kind == CACHED_IF_CASE:
+                obj = (kids[0], kids[1], bool(op & CACHED_BLOCK))
+            elif kind == CACHED_ELSE_CASE:
+                obj = (kids[0], bool(op & CACHED_BLOCK))
+            elif kind == CACHED_IF:
+                if len(kids[-1]) == 2:
+                    obj = IfNode(kids[:-1], kids[-1])
+                else:
+                    obj = IfNode(kids, None)
+            elif kind == CACHED_FOR:
+                step = kids[3] if op & CACHED_HAS_STEP else None
+                obj = ForNode(kids[0], kids[1], kids[2], step, kids[-1], bool(op & CACHED_BLOCK))
+            elif kind == CACHED_WHILE:
+                obj = WhileNode(kids[0], kids[1], bool(op & CACHED_BLOCK))
+            elif kind == CACHED_FUNC_DEF:
+                if op & CACHED_HAS_NAME:
+                    obj = FuncDefNode(kids[0], kids[1:-1], kids[-1], bool(op & CACHED_BLOCK))
+                else:
+                    obj = FuncDefNode(None, kids[:-1], kids[-1], bool(op & CACHED_BLOCK))
+            elif kind == CACHED_RETURN:
+                obj = ReturnNode(kids[0] if kids else None, base + starts[i], base + ends[i])
+            elif kind == CACHED_CONTINUE:
+                obj = ContinueNode(base + starts[i], base + ends[i])
+            else:
+                obj = BreakNode(base + starts[i], base + ends[i])
+
+            if kind in CACHED_DERIVED_SPANS:
+                # The optimizer may leave a span other than the one the
+                # children give
+                obj.pos_inicio = base + starts[i]
+                obj.pos_final = base + ends[i]
+
+            built.append(obj)
+
+        return obj
+
+
+
+def interpreter_digest():
+    # Changes with this file and the Python running it, which decide the
+    # nodes a script parses to and how their arrays are laid out
+    global INTERPRETER_DIGEST
+
+    if INTERPRETER_DIGEST is None:
+        with open(os.path.abspath(__file__), 'rb') as f:
+            data = f.read() + sys.version.encode() + sys.byteorder.encode()
+        INTERPRETER_DIGEST = hashlib.blake2b(data, digest_size=16).digest()
+
+    return INTERPRETER_DIGEST
+
+
+def ast_cache_path(fileName, optimize):
+    directory, name = os.path.split(os.path.abspath(fileName))
+    return os.path.join(directory, AST_CACHE_DIR, name + ('.opt.mlc' if optimize else '.mlc'))
+
+
+def ast_cache_key(fileName, text):
+    # The header a cache of fileName needs to hold the AST of text, None if
+    # fileName is not a file to cache for
+    if AST_CACHE_DIR is None:
+        return None
+    try:
+        info = os.stat(fileName)
+    except (OSError, ValueError):
+        return None
+    if not S_ISREG(info.st_mode):
+        return None
+
+    digest = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    return AST_CACHE_HEADER.pack(interpreter_digest(), info.st_mtime_ns, info.st_size, digest)
+
+
+def load_cached_ast(fileName, text, optimize, key):
+    # The cached AST of text and the new Source for text it is placed in,
+    # or None, None
+    if key is None:
+        return None, None
+
+    try:
+        with open(ast_cache_path(fileName, optimize), 'rb') as f:
+            if f.read(AST_CACHE_HEADER.size) != key:
+                return None, None
+            data = f.read()
+    except OSError:
+        return None, None
+
+    # Building the nodes makes a lot of objects at once, the collector
+    # would scan them again and again along the way. A file that does not
+    # hold a well formed CachedAst is a miss like any other.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        cached = CachedAst.from_bytes(data)
+        source = add_source(fileName, text)
+        cached.base = source.base
+        return cached.node(), source
+    except Exception:
+        return None, None
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def save_cached_ast(fileName, node, base, optimize, key):
+    # The AST is stored as a CachedAst, written to a temporary file that
+    # replaces the cache in one step, so a cache is never seen half
+    # written, with the permissions of the script. Failing to write is not
+    # an error.
+    if key is None:
+        return
+
+    path = ast_cache_path(fileName, optimize)
+    try:
+        data = CachedAst.from_node(node, base).to_bytes()
+        mode = S_IMODE(os.stat(fileName).st_mode) & 0o666
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    except Exception:
+        return
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+            f.write(data)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+#######################################
+# RUN
+#######################################
+
+global_symbol_table = SymbolTable()
+global_symbol_table.set("NULL", Number.null)
+global_symbol_table.set("FALSE", Number.false)
+global_symbol_table.set("TRUE", Number.true)
+global_symbol_table.set("MATH_PI", Number.math_PI)
+global_symbol_table.set("PRINT", BuiltInFunction.print)
+global_symbol_table.set("PRINT_RET", BuiltInFunction.print_ret)
+global_symbol_table.set("INPUT", BuiltInFunction.input)
+global_symbol_table.set("INPUT_INT", BuiltInFunction.input_int)
+global_symbol_table.set("CLEAR", BuiltInFunction.clear)
+global_symbol_table.set("CLS", BuiltInFunction.clear)
+global_symbol_table.set("IS_NUM", BuiltInFunction.is_number)
+global_symbol_table.set("IS_STR", BuiltInFunction.is_string)
+global_symbol_table.set("IS_LIST", BuiltInFunction.is_list)
+global_symbol_table.set("IS_DEF", BuiltInFunction.is_function)
+global_symbol_table.set("APPEND", BuiltInFunction.append)
+global_symbol_table.set("POP", BuiltInFunction.pop)
+global_symbol_table.set("EXTEND", BuiltInFunction.extend)
+global_symbol_table.set("LEN", BuiltInFunction.len)
+global_symbol_table.set("RUN", BuiltInFunction.run)
+global_symbol_table.set("IMPORT", BuiltInFunction.import_)
+
+
+def run_transpiled(node, context):
+    # Python's own compiler limits how deeply the generated expressions may
+    # nest; a program past them runs on closures instead
+    try:
+        program = Transpiler().transpile(node)
+    except (SyntaxError, RecursionError, MemoryError):
+        return run_closure(ClosureCompiler().compile(TypeInference().infer(node)), context)
+    return TranspilerRuntime(program).run(context)
+
+
+ENGINES = {
+    # Hot functions tier up to closures, which use the inferred types
+    'interpreter': lambda node, context: Interpreter().run(TypeInference().infer(node), context),
+    'bytecode': lambda node, context: VM().run(Compiler().compile(node), context),
+    'closures': lambda node, context: run_closure(ClosureCompiler().compile(TypeInference().infer(node)), context),
+    'python': run_transpiled,
+    'stackless': lambda node, context: StacklessInterpreter().run(node, context),
+}
+
+
+PARSERS = {
+    'predictive': Parser,
+    # Generated from the grammar file, never recurses in Python
+    'table': TableParser,
+}
+
+
+def prepare(node, jit, memoize):
+    # Let the interpreter trace hot loops
+    if jit:
+        enable_tracing(node)
+
+    # Cache the results of pure functions
+    if memoize:
+        PurityAnalysis().analyze(node)
+
+    mark_tail_calls(node)
+    return node
+
+
+def run(fileName, text, engine='interpreter', optimize=False, jit=False, memoize=True, parser='predictive',
+        symbol_table=None):
+    # symbol_table takes the names the program defines, global_symbol_table
+    # by default
+    if engine not in ENGINES:
+        raise Exception(f"Unknown engine '{engine}'")
+    if parser not in PARSERS:
+        raise Exception(f"Unknown parser '{parser}'")
+
+    # Reuse the AST of a script that has not changed. source is held until
+    # the program is done, the nodes only know offsets into it.
+    cache_key = ast_cache_key(fileName, text)
+    node, source = load_cached_ast(fileName, text, optimize, cache_key)
+
+    if node is None:
+        # Generate tokens
+        lexer = Lexer(fileName, text)
+        source = lexer.source
+        tokens, error = lexer.make_token_buffer()
+        if error:
+            return None, error
+
+        # Generate AST. Parsing makes a lot of objects at once, the
+        # collector would scan them again and again along the way.
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            ast = PARSERS[parser](tokens).parse()
+        finally:
+            if enabled:
+                gc.enable()
+        if ast.error:
+            return None, ast.error
+
+        # Optimize AST
+        node = ast.node
+        if optimize:
+            node = Optimizer().optimize(node)
+
+        save_cached_ast(fileName, node, source.base, optimize, cache_key)
+
+    node = prepare(node, jit, memoize)
+
+    # Run program
+    context = Context('<program>')
+    context.symbol_table = global_symbol_table if symbol_table is None else symbol_table
+    resultado = ENGINES[engine](node, context)
+
+    return resultado.value, resultado.error
+
+
+def stream_size(stream):
+    # An upper bound on the characters left in stream, if it has one
+    try:
+        return os.fstat(stream.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        pass
+    try:
+        return len(stream)
+    except TypeError:
+        return None
+
+
+def run_stream(fileName, stream, engine='interpreter', optimize=False, jit=False, memoize=True):
+    # Like run, but stream (a file-like object or an mmap) is lexed a chunk
+    # at a time and each top-level statement runs as soon as it is parsed,
+    # after which its tokens and AST can be freed. Statements before an
+    # error have already run, and the result only holds the value of the
+    # last statement.
+    if engine not in ENGINES:
+        raise Exception(f"Unknown engine '{engine}'")
+
+    lexer = StreamLexer(fileName, stream, stream_size(stream))
+    parser = StreamParser(TokenStream(chain.from_iterable(lexer.chunks())))
+
+    context = Context('<program>')
+    context.symbol_table = global_symbol_table
+    resultado = None
+
+    for ast in parser.statements():
+        if lexer.error or ast.error:
+            lexer.finish_line()
+            return None, lexer.error or ast.error
+
+        node = ListNode([ast.node], ast.node.pos_inicio, ast.node.pos_final)
+        if optimize:
+            node = Optimizer().optimize(node)
+        node = prepare(node, jit, memoize)
+        node.partial = True
+        resultado = ENGINES[engine](node, context)
+
+        # A top-level RETURN, BREAK or CONTINUE ends the program
+        if resultado.error or resultado.value is None:
+            if resultado.error:
+                lexer.finish_line()
+            return resultado.value, resultado.error
+
+    if lexer.error:
+        lexer.finish_line()
+        return None, lexer.error
+    return resultado.value, None
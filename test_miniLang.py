@@ -0,0 +1,821 @@
+import gc
+import io
+import sys
+
+import pytest
+
+import miniLang
+
+
+ENGINES = list(miniLang.ENGINES)
+
+
+def run_program(text, **kwargs):
+    # Values of the top-level statements, or the error text
+    result, error = miniLang.run('<test>', text, **kwargs)
+    if error:
+        return error.as_string()
+    return [str(value) for value in result.elements]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_cached_global_is_hidden_by_caller_local(engine):
+    text = '\n'.join([
+        'DEF cache_get() -> cache_k',
+        'VAR cache_k = 1',
+        'cache_get()',
+        'DEF cache_hide()',
+        '    VAR cache_k = 2',
+        '    RETURN cache_get()',
+        'END',
+        'cache_hide()',
+        'cache_get()',
+    ])
+    values = run_program(text, engine=engine)
+    assert (values[2], values[4], values[5]) == ('1', '2', '1')
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_memoized_function_sees_free_names_of_callees(engine, capsys):
+    text = '\n'.join([
+        'DEF memo_g(x) -> x + memo_k',
+        'DEF memo_f(x) -> memo_g(x) * 2',
+        'VAR memo_k = 1',
+        'PRINT(memo_f(1))',
+        'VAR memo_k = 10',
+        'PRINT(memo_f(1))',
+        'DEF memo_h()',
+        '    VAR memo_k = 100',
+        '    RETURN memo_f(1)',
+        'END',
+        'PRINT(memo_h())',
+    ])
+    run_program(text, engine=engine)
+    assert capsys.readouterr().out.split() == ['4', '22', '202']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_traceback_lists_frames_replaced_by_tail_calls(engine):
+    text = '\n'.join([
+        'DEF trace_f3(x) -> x + "s"',
+        'DEF trace_f2(x) -> trace_f3(x)',
+        'DEF trace_f1(x)',
+        '    VAR y = x',
+        '    RETURN trace_f2(y)',
+        'END',
+        'trace_f1(1)',
+    ])
+    assert run_program(text, engine=engine).startswith('\n'.join([
+        'Traceback (most recent call last):',
+        '  File <test>, line 7, in <program>',
+        '  File <test>, line 5, in trace_f1',
+        '  File <test>, line 2, in trace_f2',
+        '  File <test>, line 1, in trace_f3',
+        'Runtime Erro: Illegal operation',
+    ]))
+
+
+def test_traceback_of_long_tail_call_chain_is_bounded():
+    text = '\n'.join([
+        'DEF trace_down(n) -> IF n == 0 THEN n + "s" ELSE trace_down(n - 1)',
+        'trace_down(150)',
+    ])
+    lines = run_program(text).splitlines()
+    assert lines[1:4] == [
+        '  File <test>, line 2, in <program>',
+        '  ... 50 more tail calls',
+        '  File <test>, line 1, in trace_down',
+    ]
+    assert lines.count('  File <test>, line 1, in trace_down') == \
+        miniLang.TAIL_CALL_FRAMES + 1
+
+
+OPERAND_ERRORS = [
+    ('VAR a = (IF 1 THEN "s" ELSE 2) - 1',
+     '                   ^^^^^^^^^^^^^^^'),
+    ('VAR a = "s" - (IF 1 THEN 2 ELSE 3)',
+     '        ^^^^^^^^^^^^^^^^^^'),
+    ('VAR a = (IF 1 THEN (VAR c = "s") ELSE 2) * "q"',
+     '                            ^^^^^^^^^^^^^^^^^^'),
+    ('DEF f(n) -> (IF n THEN "s" ELSE 1) - (IF n THEN f(n - 1) ELSE 0)\nf(1)',
+     '                       ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^'),
+]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('text, arrows', OPERAND_ERRORS)
+def test_operand_error_points_at_the_branch_that_made_the_value(engine, text, arrows):
+    assert run_program(text, engine=engine).endswith(
+        text.splitlines()[0] + '\n' + arrows)
+
+
+ERROR_PROGRAMS = [text for text, _ in OPERAND_ERRORS] + [
+    'VAR a = 1 / (IF 1 THEN 0 ELSE 2)',
+    'VAR a = 2 ^ (IF 0 THEN 1 ELIF 1 THEN [] ELSE 2)',
+    'DEF errors_e(x) -> x - (VAR y = "s")\nerrors_e(1)',
+    'DEF errors_n(n) -> IF n THEN errors_n(n - 1) ELSE "s" * "t"\nerrors_n(3)',
+    'VAR a = 1 + errors_undefined',
+    'VAR a = -"s" + 1',
+    'VAR a = -[1]',
+    'VAR a = -(IF 1 THEN [1] ELSE 2)',
+]
+
+
+@pytest.mark.parametrize('text', ERROR_PROGRAMS)
+def test_engines_report_the_same_errors(text):
+    errors = {engine: run_program(text, engine=engine) for engine in ENGINES}
+    assert errors['interpreter'].startswith('Traceback')
+    for engine, error in errors.items():
+        assert error == errors['interpreter'], engine
+
+
+STREAMED_ERROR = '\n'.join([
+    'VAR stream_a = 1',
+    'DEF stream_f(x) -> x - "ç"',
+    'VAR stream_b = 2',
+    'stream_f(stream_a)',
+])
+
+
+def test_streamed_error_shows_the_line_of_non_file_input():
+    _, error = miniLang.run_stream('<stdin>', io.StringIO(STREAMED_ERROR))
+    assert error.as_string() == run_program(STREAMED_ERROR).replace('<test>', '<stdin>')
+    assert error.as_string().endswith('DEF stream_f(x) -> x - "ç"\n' + ' ' * 19 + '^' * 7)
+
+
+def test_streamed_error_reads_old_lines_back_in_the_stream_encoding(tmp_path, monkeypatch):
+    monkeypatch.setattr(miniLang, 'STREAM_KEPT_LINES', 1)
+    path = tmp_path / 'script.ml'
+    path.write_bytes(STREAMED_ERROR.encode('utf-8'))
+
+    with open(path, 'rb') as stream:
+        _, error = miniLang.run_stream(str(path), stream)
+    assert error.as_string().endswith('DEF stream_f(x) -> x - "ç"\n' + ' ' * 19 + '^' * 7)
+
+
+STREAMED_PROGRAM = '\n'.join([
+    '# tokens of every kind, some of them longer than a chunk: ç ü',
+    'VAR stream_total = 0',
+    'VAR stream_name = "ção x"',
+    'FOR stream_i = 10 TO 250 STEP 3 THEN VAR stream_total = stream_total + stream_i * 2.25',
+    'PRINT(stream_total)',
+    'PRINT(stream_name + "é")',
+    'DEF stream_f(a, b) -> IF a >= b THEN a ELSE b',
+    'PRINT(stream_f(12345, 678.5) != 0)',
+    'PRINT([stream_total <= 1, "ü"])',
+    'stream_f(1, 2)',
+])
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7])
+def test_streamed_tokens_split_across_chunks_run_the_same(chunk_size, monkeypatch, capsys):
+    expected = run_program(STREAMED_PROGRAM)[-1], capsys.readouterr().out
+    monkeypatch.setattr(miniLang, 'STREAM_CHUNK_SIZE', chunk_size)
+    for stream in (io.StringIO(STREAMED_PROGRAM), io.BytesIO(STREAMED_PROGRAM.encode('utf-8'))):
+        result, error = miniLang.run_stream('<test>', stream)
+        assert error is None
+        assert (str(result), capsys.readouterr().out) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 64])
+@pytest.mark.parametrize('line', [
+    'VAR stream_q = 5 $ 3 + 44444444',
+    'VAR stream_q = 12 34 + 5555555 + 66666666',
+    'VAR stream_q = 1; stream_q + "s"; VAR stream_r = 3333333333',
+    'VAR stream_q = (1 +',
+])
+def test_streamed_error_shows_the_whole_line_lexing_stopped_in(line, chunk_size, monkeypatch):
+    text = f'VAR stream_a = 1\nVAR stream_b = 22\n{line}\nPRINT(1)'
+    expected = run_program(text)
+    assert line in expected.splitlines()
+    monkeypatch.setattr(miniLang, 'STREAM_CHUNK_SIZE', chunk_size)
+    for stream in (io.StringIO(text), io.BytesIO(text.encode('utf-8'))):
+        _, error = miniLang.run_stream('<test>', stream)
+        assert error.as_string() == expected
+
+
+CACHED_PROGRAM = 'VAR cache_x = "ab" * (1 + 2)\nDEF cache_f(n) -> n - 0.5\ncache_f(3)'
+
+
+def test_cached_ast_has_the_script_mode_and_runs_the_same(tmp_path):
+    path = tmp_path / 'script.ml'
+    path.write_text(CACHED_PROGRAM)
+    path.chmod(0o640)
+
+    first = run_program(CACHED_PROGRAM)
+    assert miniLang.run(str(path), CACHED_PROGRAM)[1] is None
+    cache = tmp_path / miniLang.AST_CACHE_DIR / 'script.ml.mlc'
+    assert cache.stat().st_mode & 0o777 == 0o640
+    result, error = miniLang.run(str(path), CACHED_PROGRAM)
+    assert error is None and [str(value) for value in result.elements] == first
+
+
+def test_cached_ast_does_not_run_code_from_the_cache_file(tmp_path):
+    pickle = pytest.importorskip('pickle')
+
+    class Payload:
+        def __reduce__(self):
+            return exec, ('import miniLang; miniLang.cache_loaded = True',)
+
+    path = tmp_path / 'script.ml'
+    path.write_text(CACHED_PROGRAM)
+    cache = tmp_path / miniLang.AST_CACHE_DIR / 'script.ml.mlc'
+    cache.parent.mkdir()
+    key = miniLang.ast_cache_key(str(path), CACHED_PROGRAM)
+    cache.write_bytes(key + pickle.dumps(Payload()))
+
+    result, error = miniLang.run(str(path), CACHED_PROGRAM)
+    assert not hasattr(miniLang, 'cache_loaded')
+    assert error is None and str(result.elements[-1]) == '2.5'
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_function_from_run_sees_the_locals_of_its_caller(engine, tmp_path, capsys):
+    lib = tmp_path / 'lib.ml'
+    lib.write_text('DEF scope_lib() -> scope_k * 2\n')
+    text = '\n'.join([
+        f'RUN({str(lib)!r})'.replace("'", '"'),
+        'DEF scope_caller()',
+        '    VAR scope_k = 5',
+        '    RETURN scope_lib()',
+        'END',
+        'DEF scope_param(scope_k) -> scope_lib()',
+        'PRINT(scope_caller())',
+        'PRINT(scope_param(7))',
+    ])
+    run_program(text, engine=engine)
+    assert capsys.readouterr().out.split() == ['10', '14']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_function_from_an_earlier_run_sees_the_locals_of_its_caller(engine):
+    run_program('DEF scope_earlier() -> scope_j + 1', engine=engine)
+    text = '\n'.join([
+        'DEF scope_later()',
+        '    VAR scope_j = 41',
+        '    RETURN scope_earlier()',
+        'END',
+        'scope_later()',
+    ])
+    assert run_program(text, engine=engine)[-1] == '42'
+
+
+LONG_SUM = ' + '.join(['1'] * 250)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_engines_run_expressions_past_python_nesting_limits(engine):
+    text = '\n'.join([
+        f'VAR long_a = {LONG_SUM}',
+        f'DEF long_f(x) -> x - {LONG_SUM}',
+        'long_f(long_a)',
+    ])
+    assert run_program(text, engine=engine) == ['250', '<function long_f>', '498']
+
+
+def test_loop_whose_trace_python_cannot_compile_stays_on_the_tree_walker():
+    text = '\n'.join([
+        'VAR jit_b = 0',
+        'FOR jit_i = 0 TO 100 THEN',
+        f'    VAR jit_b = jit_b + {LONG_SUM}',
+        'END',
+        'jit_b',
+    ])
+    assert run_program(text, jit=True)[-1] == '25000'
+
+
+def live_sources():
+    gc.collect()
+    return sum(ref() is not None for ref in miniLang.SOURCES)
+
+
+def test_sources_of_finished_runs_are_released():
+    run_program('VAR source_a = 1')
+    before = live_sources()
+    for _ in range(20):
+        run_program('VAR source_a = source_a + 1\nsource_a - "s"')
+    assert live_sources() == before
+
+
+def test_function_keeps_its_source_for_later_errors():
+    run_program('DEF source_f(x) -> x - "s"')
+    live_sources()
+    assert run_program('source_f(1)').endswith(
+        'DEF source_f(x) -> x - "s"\n' + ' ' * 19 + '^' * 7)
+
+
+@pytest.mark.parametrize('parser', list(miniLang.PARSERS))
+def test_parsers_give_nodes_tokens_of_their_own(parser):
+    tokens, error = miniLang.Lexer('<test>', 'VAR a = -b + f(1, "s")').make_token_buffer()
+    node = miniLang.PARSERS[parser](tokens).parse().node
+    assign = node.element_nodes[0]
+    unary = assign.value_node.left_node
+    call = assign.value_node.right_node
+    kept = [assign.var_name_tok, unary.op_tok, unary.node.var_name_tok, assign.value_node.op_tok,
+            call.node_to_call.var_name_tok, call.arg_nodes[0].tok, call.arg_nodes[1].tok]
+    assert all(type(tok) is miniLang.Token for tok in kept)
+    assert [repr(tok) for tok in kept] == ['IDENTIFIER:a', 'MINUS', 'IDENTIFIER:b', 'SUM', 'IDENTIFIER:f', 'INT:1', 'STRING:s']
+    assert [tok.pos_inicio - tokens.base for tok in kept] == [4, 8, 9, 11, 13, 15, 18]
+
+
+def dump_ast(value):
+    # The fields of a tree as nested lists and tuples, for comparing trees
+    if isinstance(value, (list, tuple)):
+        return [dump_ast(item) for item in value]
+    if isinstance(value, miniLang.Token):
+        return (value.type, value.value, value.pos_inicio, value.pos_final)
+    if hasattr(value, '__dict__'):
+        return (type(value).__name__, {name: dump_ast(item) for name, item in vars(value).items()})
+    return value
+
+
+def parse_with_each_parser(text):
+    # The tree or error text of every parser, all from the same tokens
+    lexer = miniLang.Lexer('<test>', text)
+    tokens, error = lexer.make_token_buffer()
+    assert error is None
+    results = []
+    for parser in miniLang.PARSERS.values():
+        result = parser(tokens).parse()
+        results.append(result.error.as_string() if result.error else dump_ast(result.node))
+    return results
+
+
+@pytest.mark.parametrize('text', [
+    'VAR a = 1 + 2 * 3 ^ -4 / +5',
+    'NOT a == 1 AND b != 2 OR c <= 3 AND d >= 4 OR e < f > g',
+    '[1, 2.5, "s", [], f(x, y), -f()]',
+    'IF a THEN 1 ELIF b THEN 2 ELSE 3',
+    'IF a THEN\n  VAR x = 1\nELIF b THEN\n  2\nELSE\n  3\nEND',
+    'IF a THEN\n  1\nEND; IF b THEN 2 ELSE\n  3\nEND',
+    'FOR i = 1 TO 10 STEP 2 THEN\n  IF i == 5 THEN BREAK\n  CONTINUE\nEND',
+    'FOR i = 0 TO n THEN VAR s = s + i',
+    'WHILE a < 3 THEN VAR a = a + 1',
+    'WHILE 1 THEN\n  RETURN\nEND',
+    'DEF f(a, b) -> a + b\nDEF (x)\n  RETURN x\nEND\nDEF g()\n  RETURN\nEND',
+    'VAR h = DEF (x) -> IF x THEN h(x - 1) ELSE 0',
+    '\n\n1; 2\n\n3\n',
+    '(((1)))',
+])
+def test_parsers_build_the_same_tree(text):
+    predictive, table = parse_with_each_parser(text)
+    assert type(predictive) is tuple
+    assert predictive == table
+
+
+@pytest.mark.parametrize('text', [
+    'VAR = 1', 'VAR a 1', '1 +', '(1', '[1, 2', '[1 2]', 'f(1,', 'f(1 2)', 'f(END)',
+    'IF a 1', 'IF a THEN 1 ELSE\n2', 'IF THEN',
+    'FOR 1', 'FOR i 1', 'FOR i = 1 10', 'FOR i = 1 TO 2 THEN\n1',
+    'WHILE a', 'WHILE a THEN\n1', 'DEF', 'DEF 1', 'DEF f', 'DEF f(a,', 'DEF f(1)', 'DEF f() 1',
+    'DEF f()\n1', '1 2', ')', 'END', 'RETURN )', 'VAR a = THEN', 'NOT', '-', '1 ^', 'a AND',
+])
+def test_parsers_report_the_same_syntax_error(text):
+    predictive, table = parse_with_each_parser(text)
+    assert type(predictive) is str
+    assert predictive == table
+
+
+def test_only_the_table_parser_parses_nesting_past_the_recursion_limit():
+    # The one difference the README documents
+    tokens, error = miniLang.Lexer('<test>', '(' * 5000 + '1' + ')' * 5000).make_token_buffer()
+    with pytest.raises(RecursionError):
+        miniLang.PARSERS['predictive'](tokens).parse()
+    result = miniLang.PARSERS['table'](tokens).parse()
+    assert result.error is None
+    assert dump_ast(result.node.element_nodes[0])[0] == 'NumberNode'
+
+
+def expression_shape(node):
+    # An expression tree written out with every operation in brackets
+    kind = type(node).__name__
+    if kind == 'BinOpNode':
+        return f'({expression_shape(node.left_node)} {node.op_tok.value or node.op_tok.type} {expression_shape(node.right_node)})'
+    if kind == 'UnaryOpNode':
+        return f'({node.op_tok.value or node.op_tok.type} {expression_shape(node.node)})'
+    if kind == 'CallNode':
+        return f'{expression_shape(node.node_to_call)}({", ".join(expression_shape(arg) for arg in node.arg_nodes)})'
+    if kind == 'NumberNode':
+        return str(node.tok.value)
+    return node.var_name_tok.value
+
+
+def parse_predictive(text):
+    tokens, error = miniLang.Lexer('<test>', text).make_token_buffer()
+    assert error is None
+    return miniLang.Parser(tokens).parse()
+
+
+@pytest.mark.parametrize('text, shape', [
+    ('2 ^ 3 ^ 2', '(2 POW (3 POW 2))'),
+    ('7 - 2 - 1', '((7 MINUS 2) MINUS 1)'),
+    ('8 / 4 / 2', '((8 DIV 4) DIV 2)'),
+    ('1 + 2 * 3 - 4', '((1 SUM (2 MUL 3)) MINUS 4)'),
+    ('(1 + 2) * 3', '((1 SUM 2) MUL 3)'),
+    ('-2 ^ 2', '(MINUS (2 POW 2))'),
+    ('- - a', '(MINUS (MINUS a))'),
+    ('1 + -2 * 3', '(1 SUM ((MINUS 2) MUL 3))'),
+    ('2 ^ -1', '(2 POW (MINUS 1))'),
+    ('-f(a) ^ 2', '(MINUS (f(a) POW 2))'),
+    ('a < b == c', '((a LT b) EE c)'),
+    ('NOT a AND b', '((NOT a) AND b)'),
+    ('a OR b OR c', '((a OR b) OR c)'),
+    ('a == 1 AND b OR NOT c < 2', '(((a EE 1) AND b) OR (NOT (c LT 2)))'),
+])
+def test_parser_gives_operators_their_precedence_and_associativity(text, shape):
+    result = parse_predictive(text)
+    assert result.error is None
+    assert expression_shape(result.node.element_nodes[0]) == shape
+
+
+@pytest.mark.parametrize('text, message', [
+    (')', miniLang.EXPECTED_STATEMENT),
+    ('IF a THEN )', miniLang.EXPECTED_STATEMENT),
+    ('VAR a = )', miniLang.EXPECTED_EXPR),
+    ('NOT )', miniLang.EXPECTED_COMP_EXPR),
+    ('1 + )', miniLang.EXPECTED_ATOM),
+    ('-)', miniLang.EXPECTED_ATOM),
+    ('f(', miniLang.EXPECTED_ARG),
+    ('f(1, )', miniLang.EXPECTED_EXPR),
+    ('[', miniLang.EXPECTED_ELEMENT),
+    ('[1, )', miniLang.EXPECTED_EXPR),
+    ('(1 + 2', "Expected ')'"),
+    ('1 2', 'Token cannot appear after previous tokens'),
+])
+def test_parser_says_what_it_expected(text, message):
+    error = parse_predictive(text).error
+    assert isinstance(error, miniLang.InvalidSyntaxErro)
+    assert error.detalhe == message
+
+
+def test_parser_reads_long_operator_chains_without_recursing():
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(200)
+    try:
+        result = parse_predictive(' - '.join(['1'] * 5000))
+    finally:
+        sys.setrecursionlimit(limit)
+    assert result.error is None
+    node, depth = result.node.element_nodes[0], 0
+    while type(node).__name__ == 'BinOpNode':
+        assert type(node.right_node).__name__ == 'NumberNode'
+        node, depth = node.left_node, depth + 1
+    assert depth == 4999
+
+
+def ml_string(path):
+    return '"' + str(path) + '"'
+
+
+def test_module_runs_once_for_every_importer(tmp_path, capsys):
+    lib = tmp_path / 'lib.ml'
+    lib.write_text('PRINT("loading")\nVAR import_counter = [0]\n')
+    for name in ('first', 'second'):
+        (tmp_path / f'{name}.ml').write_text(
+            f'VAR import_{name} = IMPORT({ml_string(lib)})\n'
+            f'APPEND(import_{name} / "import_counter", 1)\n'
+        )
+    run_program(f'RUN({ml_string(tmp_path / "first.ml")})\nRUN({ml_string(tmp_path / "second.ml")})')
+    assert capsys.readouterr().out.split() == ['loading']
+    # Both importers appended to the one list the module made
+    assert run_program(f'IMPORT({ml_string(lib)}) / "import_counter"') == ['0, 1, 1']
+
+
+def test_circular_import_sees_the_names_defined_so_far(tmp_path):
+    first = tmp_path / 'first.ml'
+    second = tmp_path / 'second.ml'
+    first.write_text(f'VAR import_early = 1\nVAR import_other = IMPORT({ml_string(second)})\nVAR import_late = 2\n')
+    second.write_text('\n'.join([
+        f'VAR import_back = IMPORT({ml_string(first)})',
+        'VAR import_seen = import_back / "import_early"',
+        'DEF import_late_value() -> import_back / "import_late"',
+    ]))
+    text = '\n'.join([
+        f'VAR import_first = IMPORT({ml_string(first)})',
+        'VAR import_second = import_first / "import_other"',
+        'import_second / "import_seen"',
+        '(import_second / "import_late_value")()',
+    ])
+    assert run_program(text)[-2:] == ['1', '2']
+
+
+def test_circular_import_of_a_name_not_defined_yet_fails(tmp_path):
+    first = tmp_path / 'first.ml'
+    second = tmp_path / 'second.ml'
+    first.write_text(f'VAR import_other = IMPORT({ml_string(second)})\nVAR import_late = 2\n')
+    second.write_text(f'VAR import_back = IMPORT({ml_string(first)})\nimport_back / "import_late"\n')
+    error = run_program(f'IMPORT({ml_string(first)})')
+    assert 'Failed to finish executing module' in error
+    assert '\'import_late\' is not defined in module' in error
+    assert str(first) not in miniLang.MODULES and str(second) not in miniLang.MODULES
+
+
+def test_failed_module_is_dropped_and_runs_again(tmp_path, capsys):
+    lib = tmp_path / 'lib.ml'
+    lib.write_text('PRINT("loading")\nVAR import_value = 1 / 0\n')
+    error = run_program(f'IMPORT({ml_string(lib)})')
+    assert 'Failed to finish executing module' in error and 'Division by zero' in error
+    assert str(lib) not in miniLang.MODULES
+
+    lib.write_text('PRINT("loading")\nVAR import_value = 1 / 4\n')
+    assert run_program(f'IMPORT({ml_string(lib)}) / "import_value"') == ['0.25']
+    assert capsys.readouterr().out.split() == ['loading', 'loading']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_module_function_reaches_the_private_helpers_of_its_module(engine, tmp_path):
+    lib = tmp_path / f'lib_{engine}.ml'
+    lib.write_text('\n'.join([
+        'VAR import_scale = 10',
+        'DEF import_helper(x) -> x * import_scale',
+        'DEF import_public(x) -> import_helper(x) + 1',
+    ]))
+    text = '\n'.join([
+        'DEF import_helper(x) -> 0',
+        f'VAR import_lib = IMPORT({ml_string(lib)})',
+        '(import_lib / "import_public")(4)',
+        'DEF import_caller(import_scale) -> (import_lib / "import_public")(2)',
+        'import_caller(1000)',
+    ])
+    assert run_program(text, engine=engine)[-3:] == ['41', '<function import_caller>', '21']
+
+
+def test_module_names_stay_out_of_the_global_table(tmp_path):
+    lib = tmp_path / 'lib.ml'
+    lib.write_text('VAR import_private = 1\nDEF import_private_function() -> 2\n')
+    result = run_program(f'VAR import_module = IMPORT({ml_string(lib)})\nimport_private')
+    assert "'import_private' is not defined" in result
+    for name in ('import_private', 'import_private_function'):
+        assert miniLang.global_symbol_table.get(name) is None
+        assert name in miniLang.MODULES[str(lib)].symbol_table.symbols
+
+
+
+SAME_RESULT_PROGRAMS = [
+    '2 + 3 * 4 ^ 2 / 8 - -1\n10 / 4\n7 - 2 - 1\n2 ^ 3 ^ 2\n-2 ^ 2\n1 / 3',
+    '1 == 1 AND 2 < 3 OR 0\nNOT 0\nNOT 5\n1 >= 2\n2 <= 2\n1 AND 0\n0 OR 7',
+    '"ab" + "cd"\n"ab" * 3\n[1, 2] + 3\n[1, 2] * [3, 4]\n[1, 2, 3] / 1\n[1, 2, 3] - 0\n[]',
+    'VAR same_s = 0\nFOR same_i = 10 TO 0 STEP -3 THEN VAR same_s = same_s + same_i\nsame_s\nsame_i',
+    'FOR same_i = 0 TO 5 THEN same_i * same_i',
+    '\n'.join([
+        'VAR same_l = []',
+        'VAR same_i = 0',
+        'WHILE same_i < 10 THEN',
+        '    VAR same_i = same_i + 1',
+        '    IF same_i == 3 THEN CONTINUE',
+        '    IF same_i == 8 THEN BREAK',
+        '    APPEND(same_l, same_i)',
+        'END',
+        'same_l',
+        'same_i',
+    ]),
+    '\n'.join([
+        'VAR same_rows = []',
+        'FOR same_a = 1 TO 4 THEN',
+        '    FOR same_b = 1 TO 4 THEN',
+        '        IF same_b > same_a THEN BREAK',
+        '        APPEND(same_rows, same_a * 10 + same_b)',
+        '    END',
+        'END',
+        'same_rows',
+    ]),
+    '\n'.join([
+        'DEF same_fib(n)',
+        '    IF n < 2 THEN RETURN n',
+        '    RETURN same_fib(n - 1) + same_fib(n - 2)',
+        'END',
+        'same_fib(15)',
+    ]),
+    '\n'.join([
+        'DEF same_twice(f, x) -> f(f(x))',
+        'same_twice(DEF (y) -> y * 3, 2)',
+        'DEF same_adder(same_n) -> DEF (x) -> x + same_n',
+        'VAR same_n = 100',
+        'VAR same_add = same_adder(1)',
+        'same_add(5)',
+    ]),
+    '\n'.join([
+        'DEF same_nothing()',
+        '    VAR same_unused = 1',
+        'END',
+        'same_nothing()',
+        'DEF same_bare()',
+        '    RETURN',
+        'END',
+        'same_bare()',
+    ]),
+    'VAR same_x = IF 0 THEN 1 ELIF 0 THEN 2 ELSE 3\nsame_x\nIF 0 THEN 1\nIF 1 THEN 4 ELSE 5',
+    '\n'.join([
+        'VAR same_l = [1, 2, 3]',
+        'APPEND(same_l, 4)',
+        'POP(same_l, 0)',
+        'EXTEND(same_l, [5, 6])',
+        'LEN(same_l)',
+        'same_l',
+        'IS_NUM(1)\nIS_STR("s")\nIS_LIST([])\nIS_DEF(LEN)\nIS_NUM("s")',
+    ]),
+    '\n'.join([
+        'PRINT("start")',
+        'FOR same_i = 1 TO 4 THEN PRINT(same_i * 1.5)',
+        'PRINT([1, "a", [2]])',
+        'PRINT_RET("x") + "y"',
+    ]),
+    '\n'.join([
+        'DEF same_count(n)',
+        '    VAR total = 0',
+        '    WHILE n > 0 THEN',
+        '        VAR total = total + n',
+        '        VAR n = n - 1',
+        '    END',
+        '    RETURN total',
+        'END',
+        'same_count(100)',
+        'DEF same_inner() -> same_depth',
+        'DEF same_outer(same_depth) -> same_inner()',
+        'same_outer(7)',
+    ]),
+    '\n'.join([
+        'VAR same_t = 0',
+        'FOR same_i = 0 TO 3000 THEN',
+        '    IF same_i / 2 == 0 THEN CONTINUE',
+        '    VAR same_t = same_t + same_i * 0.5',
+        'END',
+        'same_t',
+    ]),
+    '\n'.join([
+        'DEF same_sum(l, i) -> IF i == LEN(l) THEN 0 ELSE l / i + same_sum(l, i + 1)',
+        'same_sum([1, 2, 3, 4], 0)',
+        'DEF same_loop(n, acc) -> IF n == 0 THEN acc ELSE same_loop(n - 1, acc + n)',
+        'same_loop(300, 0)',
+    ]),
+]
+
+
+def run_on_every_engine(text, capsys, **kwargs):
+    # What each engine gives for text, with what it printed
+    outcomes = {}
+    for engine in ENGINES:
+        result = run_program(text, engine=engine, **kwargs)
+        outcomes[engine] = (result, capsys.readouterr().out)
+    return outcomes
+
+
+@pytest.mark.parametrize('optimize', [False, True])
+@pytest.mark.parametrize('text', SAME_RESULT_PROGRAMS)
+def test_engines_give_the_same_values_and_output(text, optimize, capsys):
+    outcomes = run_on_every_engine(text, capsys, optimize=optimize)
+    assert type(outcomes['interpreter'][0]) is list
+    for engine, outcome in outcomes.items():
+        assert outcome == outcomes['interpreter'], engine
+
+
+SAME_ERROR_PROGRAMS = [
+    'DEF fail_f(a, b) -> a + b\nfail_f(1)',
+    'DEF fail_f(a) -> a\nfail_f(1, 2)',
+    'DEF fail_g() -> fail_missing + 1\nfail_g()',
+    'VAR fail_l = [1, 2]\nfail_l / 5',
+    'VAR fail_l = [1, 2]\nfail_l - 5',
+    'VAR fail_x = 3\nfail_x(1)',
+    'DEF fail_d(n) -> 10 / n\nFOR fail_i = 3 TO -1 STEP -1 THEN fail_d(fail_i)',
+    '"s" * "t"',
+    '[1] + [2] * "x"',
+    '\n'.join([
+        'PRINT("before")',
+        'VAR fail_i = 0',
+        'WHILE 1 THEN',
+        '    VAR fail_i = fail_i + 1',
+        '    IF fail_i == 5 THEN fail_i + "s"',
+        'END',
+    ]),
+    '\n'.join([
+        'DEF fail_a(n) -> fail_b(n) * 2',
+        'DEF fail_b(n) -> IF n > 2 THEN fail_a(n - 1) ELSE n / 0',
+        'fail_a(5)',
+    ]),
+    '\n'.join([
+        'DEF fail_h()',
+        '    VAR fail_y = 1',
+        '    RETURN fail_y + fail_z',
+        'END',
+        'fail_h()',
+    ]),
+    'APPEND(1, 2)',
+    'LEN(5)',
+    'POP([1], 3)',
+    'EXTEND([1], 2)',
+    'RUN(5)',
+    'IF "s" + 1 THEN 1',
+    'NOT "s" + 1',
+    '1 AND "s" - 1',
+]
+
+
+@pytest.mark.parametrize('optimize', [False, True])
+@pytest.mark.parametrize('text', SAME_ERROR_PROGRAMS)
+def test_engines_give_the_same_error_text_and_output(text, optimize, capsys):
+    outcomes = run_on_every_engine(text, capsys, optimize=optimize)
+    assert outcomes['interpreter'][0].startswith('Traceback')
+    for engine, outcome in outcomes.items():
+        assert outcome == outcomes['interpreter'], engine
+
+
+@pytest.fixture
+def recorded_traces(monkeypatch):
+    # Every LoopTrace that records, in order
+    traces = []
+    record = miniLang.LoopTrace.record
+
+    def spy(self, *args):
+        traces.append(self)
+        record(self, *args)
+
+    monkeypatch.setattr(miniLang.LoopTrace, 'record', spy)
+    return traces
+
+
+def test_trace_side_exit_runs_one_iteration_on_the_tree_walker(recorded_traces):
+    text = '\n'.join([
+        'VAR jit_s = 0',
+        'FOR jit_i = 0 TO 300 THEN',
+        '    IF jit_i == 120 THEN VAR jit_s = jit_s + 1000 ELSE VAR jit_s = jit_s + jit_i',
+        'END',
+        'jit_s',
+    ])
+    assert run_program(text, jit=True) == run_program(text) == ['0', '0', '45730']
+    trace, = recorded_traces
+    assert trace.bails == 1 and trace.function is not None
+
+
+def test_loop_goes_back_to_the_tree_walker_after_too_many_side_exits(recorded_traces):
+    text = '\n'.join([
+        'VAR jit_s = 0',
+        'FOR jit_i = 0 TO 300 THEN',
+        '    IF jit_i > 120 THEN VAR jit_s = jit_s + 2 ELSE VAR jit_s = jit_s + 1',
+        'END',
+        'jit_s',
+    ])
+    assert run_program(text, jit=True) == run_program(text) == ['0', '0', '479']
+    trace, = recorded_traces
+    assert trace.bails == miniLang.MAX_TRACE_BAILS
+    assert trace.function is None and trace.failed
+
+
+def test_error_in_a_traced_loop_is_reported_by_the_tree_walker(recorded_traces):
+    text = '\n'.join([
+        'VAR jit_r = 0',
+        'VAR jit_i = 0',
+        'WHILE jit_i < 300 THEN',
+        '    VAR jit_r = jit_r + 100 / (jit_i - 150)',
+        '    VAR jit_i = jit_i + 1',
+        'END',
+    ])
+    error = run_program(text, jit=True)
+    assert 'Division by zero' in error
+    assert error == run_program(text)
+    assert recorded_traces[0].bails == 1
+
+
+def test_trace_guard_sends_values_of_another_type_to_the_tree_walker(recorded_traces):
+    text = '\n'.join([
+        'DEF jit_sum(jit_step)',
+        '    VAR jit_t = 0',
+        '    FOR jit_i = 0 TO 100 THEN',
+        '        VAR jit_t = jit_t + jit_step',
+        '    END',
+        '    RETURN jit_t',
+        'END',
+        'jit_sum(1)',
+        'jit_sum(0.5)',
+        'jit_sum("s")',
+    ])
+    error = run_program(text, jit=True)
+    assert 'Runtime Erro: Illegal operation' in error.splitlines()
+    assert recorded_traces[0].bails == 1
+    assert error == run_program(text)
+    assert run_program(text.rsplit('\n', 1)[0], jit=True)[-2:] == ['100', '50.0']
+
+
+def test_stackless_runs_deep_recursion_within_the_python_recursion_limit(monkeypatch):
+    def refuse(limit):
+        raise AssertionError('the recursion limit was changed')
+
+    limit = sys.getrecursionlimit()
+    monkeypatch.setattr(sys, 'setrecursionlimit', refuse)
+    text = '\n'.join([
+        'VAR deep_list = FOR i = 0 TO 9000 THEN i + 1',
+        'DEF deep_sum(l, i) -> IF i == LEN(l) THEN 0 ELSE l / i + deep_sum(l, i + 1)',
+        'deep_sum(deep_list, 0)',
+    ])
+    assert 9000 > limit
+    assert run_program(text, engine='stackless')[-1] == '40504500'
+    assert sys.getrecursionlimit() == limit
+
+
+def test_stackless_reports_a_stack_overflow_past_the_call_depth_limit(monkeypatch):
+    monkeypatch.setattr(miniLang, 'MAX_CALL_DEPTH', 500)
+    text = 'DEF deep_down(n) -> IF n == 0 THEN 0 ELSE 1 + deep_down(n - 1)\ndeep_down(600)'
+    lines = run_program(text, engine='stackless').splitlines()
+    assert lines[:2] == ['Traceback (most recent call last):', '  File <test>, line 2, in <program>']
+    assert lines.count('  File <test>, line 1, in deep_down') == 500
+    assert 'Runtime Erro: Stack overflow: more than 500 nested calls' in lines
+    assert run_program(text.replace('600', '400'), engine='stackless')[-1] == '400'